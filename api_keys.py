@@ -0,0 +1,33 @@
+import hashlib
+import secrets
+
+# New-style keys look like "uz_<prefix>_<secret>". The prefix is public and
+# stored as-is so a key can be recognised in the UI; only the SHA-256 digest
+# of the full key is stored server-side.
+KEY_SCHEME = 'uz'
+PREFIX_BYTES = 4    # 8 hex characters
+SECRET_BYTES = 32   # 43 url-safe characters
+
+
+def generate_api_key():
+    """
+    Create a new random API key.
+    :return: (api_key, prefix, digest) - only prefix and digest are stored.
+    """
+    prefix = secrets.token_hex(PREFIX_BYTES)
+    api_key = f"{KEY_SCHEME}_{prefix}_{secrets.token_urlsafe(SECRET_BYTES)}"
+    return api_key, prefix, digest_api_key(api_key)
+
+
+def digest_api_key(api_key):
+    """Return the hex SHA-256 digest stored for an API key."""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+
+def is_legacy_api_key(api_key):
+    """
+    Legacy keys are bcrypt hashes of the username, e.g. "$2b$12$..." (60
+    characters). Anything else is not looked up in the unindexed api_key column.
+    """
+    return len(api_key) == 60 and api_key.startswith('$2')
+
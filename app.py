@@ -1,19 +1,38 @@
+import hmac
+import json
 import logging
 import os
-import shutil
+import time
 import zipfile
-import pandas as pd
-import numpy as np
-from flask import Flask, request, jsonify, Blueprint
+import click
+from flask import Flask, request, jsonify, Blueprint, Response, g, stream_with_context
 from flask_restful import Api, Resource
 from flask_bcrypt import Bcrypt
 from flask_httpauth import HTTPTokenAuth
-from oracledb import connect
 from dotenv import load_dotenv
 import re  # For email validation
 
+from api_keys import digest_api_key, generate_api_key, is_legacy_api_key
+from auth_cache import ApiKeyCache, SharedGeneration
 from config import Config
+from db import configure as configure_db, db_connection, pool_stats
+from health_queries import Page, QueryError, build_query, decode_cursor, iter_rows, parse_time
+from ingest_state import load_ingest_filter, save_ingest_filter
+from jobs import JobQueue, JobWorkers
+from leaderboard import (PERIODS, LeaderboardCache, PointsRules, current_period_key, daily_totals,
+                         streak_json)
+from metrics import (AUTH_LOOKUP_SECONDS, CONTENT_TYPE, HTTP_REQUEST_SECONDS, INGEST_ROWS, INGEST_STAGE_SECONDS,
+                     UPLOAD_BYTES, configure as configure_metrics, exposition)
+from password_hasher import PasswordHasher, PasswordHasherBusy
+from profiling import UploadProfiler
+from processor.archive import ArchiveLimitError, is_export_member, json_members
 from processor.health_data_processor import HealthDataProcessor
+from processor.push import DECODE_ERRORS, MEDIA_TYPES, UnsupportedEncoding, limit_body, open_body
+from user_points import load_rankings, rebuild_user_points, update_user_points
+
+# pandas and NumPy are imported by the DataFrame ingest path (oracle_writer, processor.downsample,
+# processor.summary, summary_metrics) and oracledb with the first database connection, so a worker
+# starts without them and one serving only logins, reads or row ingest never loads pandas
 
 # Initialize Flask app and API
 app = Flask(__name__)
@@ -31,73 +50,111 @@ logging.basicConfig(level=logging.INFO,
 # Load environment variables
 load_dotenv()
 
-## Database connection helper
-def get_db_connection():
-    try:
-        return connect(
-            user=os.getenv('ORACLE_USER'),
-            password=os.getenv('ORACLE_PASSWORD'),
-            service_name=os.getenv('ORACLE_SERVICE_NAME'),
-            port=1521,
-            host=os.getenv('ORACLE_HOST')
-        )
-    except Exception as e:
-        logging.error(f"Error connecting to Oracle DB: {e}")
-        raise
+# Configure the Oracle session pool; it is created lazily in each worker process
+configure_db(app.config)
+
+# Metric values of each process, kept in METRICS_DIR when set so /metrics covers every worker
+configure_metrics(app.config)
+
+# Dedicated, bounded pool for bcrypt, so login and registration bursts can't starve uploads
+password_hasher = PasswordHasher(bcrypt, rounds=app.config['BCRYPT_LOG_ROUNDS'],
+                                 workers=app.config['PASSWORD_HASH_WORKERS'],
+                                 max_pending=app.config['PASSWORD_HASH_MAX_PENDING'],
+                                 timeout=app.config['PASSWORD_HASH_TIMEOUT'])
+
+# Opt-in profiling of upload requests (off unless PROFILE_DIR and a sample rate or admin users are set)
+upload_profiler = UploadProfiler(app.config['PROFILE_DIR'], sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+                                 admin_users=app.config['PROFILE_ADMIN_USERS'], top=app.config['PROFILE_TOP'])
+
+# Cache of API key digest -> user lookups used by the token authentication; invalidations
+# reach the other workers of this host through the shared revocation file
+api_key_cache = ApiKeyCache(maxsize=app.config['AUTH_CACHE_SIZE'],
+                            ttl=app.config['AUTH_CACHE_TTL'],
+                            negative_ttl=app.config['AUTH_CACHE_NEGATIVE_TTL'],
+                            shared=(SharedGeneration(app.config['AUTH_REVOCATION_FILE'])
+                                    if app.config['AUTH_REVOCATION_FILE'] else None))
 
 
 ## Create a new user with a hashed password and API key, and store email
 def create_user(username, password, email):
-    connection = get_db_connection()
-    cursor = connection.cursor()
-
     # Hash the password
-    password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+    password_hash = password_hasher.hash(password)
 
-    # Generate a unique API key
-    api_key = bcrypt.generate_password_hash(username).decode('utf-8')
+    # Generate a random API key; only its prefix and digest are stored
+    api_key, api_key_prefix, api_key_hash = generate_api_key()
 
     try:
-        # Check if the email or username already exists
-        cursor.execute(
-            "SELECT * FROM users WHERE email = :email OR username = :username",
-            [email, username])
-        if cursor.fetchone():
-            return None, 'User with this email or username already exists.'
-
-        # Insert the new user into the Oracle Database
-        cursor.execute("""
-            INSERT INTO users (username, password_hash, api_key, email)
-            VALUES (:username, :password_hash, :api_key, :email)
-        """, [username, password_hash, api_key, email])
-        connection.commit()
-
-        return api_key, None  # Return the generated API key
+        with db_connection() as connection:
+            cursor = connection.cursor()
+            try:
+                # Check if the email or username already exists
+                cursor.execute(
+                    "SELECT * FROM users WHERE email = :email OR username = :username",
+                    [email, username])
+                if cursor.fetchone():
+                    return None, 'User with this email or username already exists.'
+
+                # Insert the new user into the Oracle Database
+                cursor.execute("""
+                    INSERT INTO users (username, password_hash, api_key_prefix, api_key_hash, email)
+                    VALUES (:username, :password_hash, :api_key_prefix, :api_key_hash, :email)
+                """, [username, password_hash, api_key_prefix, api_key_hash, email])
+                connection.commit()
+
+                # The key is new and random, so no cache holds an answer for it
+                return api_key, None  # Return the generated API key
+            finally:
+                cursor.close()
     except Exception as e:
         logging.error(f"Error creating user: {e}")
         return None, str(e)
-    finally:
-        cursor.close()
-        connection.close()
 
 
-## Verify username and password, and return the corresponding API key if valid
+## Verify username and password, and return the user's key details if valid
 def verify_user(username, password):
-    connection = get_db_connection()
-    cursor = connection.cursor()
+    with db_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            cursor.execute(
+                "SELECT id, password_hash, api_key, api_key_prefix FROM users WHERE username = :username",
+                [username])
+            user = cursor.fetchone()
+        finally:
+            cursor.close()
+
+    if user and password_hasher.check(user[1], password):
+        # api_key is only set for legacy keys; new keys are never stored
+        return {'id': user[0], 'api_key': user[2], 'api_key_prefix': user[3]}
+    else:
+        return None
 
-    cursor.execute(
-        "SELECT password_hash, api_key FROM users WHERE username = :username",
-        [username])
-    user = cursor.fetchone()
 
-    cursor.close()
-    connection.close()
+## Issue a new API key for a user, replacing (and revoking) the current one
+def rotate_api_key(user_id):
+    api_key, api_key_prefix, api_key_hash = generate_api_key()
+
+    with db_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            cursor.execute("""
+                UPDATE users
+                   SET api_key = NULL,
+                       api_key_prefix = :api_key_prefix,
+                       api_key_hash = :api_key_hash
+                 WHERE id = :id
+            """, [api_key_prefix, api_key_hash, user_id])
+            connection.commit()
+        finally:
+            cursor.close()
+
+    invalidate_api_key(user_id=user_id)
+    return api_key, api_key_prefix
 
-    if user and bcrypt.check_password_hash(user[0], password):
-        return user[1]  # Return the API key if password matches
-    else:
-        return None
+
+## Response for a login or registration refused because the password pool is saturated
+def password_hasher_busy(e):
+    logging.error(f"Password hashing unavailable: {e}")
+    return {'error': 'Too many authentication requests, try again shortly'}, 503, {'Retry-After': '1'}
 
 
 ## Validate email format using regular expressions
@@ -106,22 +163,49 @@ def is_valid_email(email):
     return re.match(email_regex, email) is not None
 
 
-## Helper function to find user by API key
+## Helper function to find user by API key, answered from the cache when possible
 def find_user_by_api_key(api_key):
-    connection = get_db_connection()
-    cursor = connection.cursor()
+    return api_key_cache.get(digest_api_key(api_key),
+                             lambda api_key_hash: load_user_by_api_key(api_key, api_key_hash))
 
-    cursor.execute("SELECT id, username FROM users WHERE api_key = :api_key", [api_key])
-    user = cursor.fetchone()
 
-    cursor.close()
-    connection.close()
+## Look up the user owning an API key in the database
+def load_user_by_api_key(api_key, api_key_hash):
+    with AUTH_LOOKUP_SECONDS.time(), db_connection() as connection:
+        cursor = connection.cursor()
+        try:
+            # Single probe on the unique api_key_hash index
+            cursor.execute("SELECT id, username FROM users WHERE api_key_hash = :api_key_hash",
+                           [api_key_hash])
+            user = cursor.fetchone()
+
+            # Legacy bcrypt-style keys not yet backfilled by the migration:
+            # match the plain-text column once and store the digest
+            if not user and is_legacy_api_key(api_key):
+                cursor.execute(
+                    "SELECT id, username FROM users WHERE api_key = :api_key AND api_key_hash IS NULL",
+                    [api_key])
+                user = cursor.fetchone()
+                if user:
+                    cursor.execute("UPDATE users SET api_key_hash = :api_key_hash WHERE id = :id",
+                                   [api_key_hash, user[0]])
+                    connection.commit()
+        finally:
+            cursor.close()
 
     if user:
         return {'id': user[0], 'username': user[1]}
     return None
 
 
+## Drop cached lookups after a key is rotated or a user is deleted, in every worker of this host
+def invalidate_api_key(api_key=None, user_id=None):
+    if api_key is not None:
+        api_key_cache.invalidate(digest_api_key(api_key))
+    if user_id is not None:
+        api_key_cache.invalidate_user(user_id)
+
+
 ## Authentication route to verify the API key using a token (Bearer scheme)
 @auth.verify_token
 def verify_api_key(api_key):
@@ -140,12 +224,199 @@ class ApiInfo(Resource):
         }, 200
 
 
+## Resource exposing Oracle session pool occupancy and acquire wait times
+class PoolStatus(Resource):
+    @auth.login_required
+    def get(self):
+        return pool_stats(), 200
+
+
+## Resource exposing API key cache hit/miss counters
+class AuthCacheStatus(Resource):
+    @auth.login_required
+    def get(self):
+        return api_key_cache.stats(), 200
+
+
+## Resource exposing the password pool: bcrypt queue wait and hashing times, and rejections
+class PasswordHashingStatus(Resource):
+    @auth.login_required
+    def get(self):
+        return password_hasher.stats(), 200
+
+
+## Read API: one page of samples, or of per-bucket aggregates computed in SQL, streamed as
+## NDJSON. The last line holds the cursor of the next page ({"next_cursor": null} at the end).
+class SeriesQuery(Resource):
+    series = None
+
+    @auth.login_required
+    def get(self):
+        user = auth.current_user()
+        try:
+            page = series_page(self.source(), request.args, user['id'])
+        except QueryError as e:
+            return {'error': str(e)}, 400
+
+        return Response(stream_with_context(self.stream(page)), mimetype='application/x-ndjson')
+
+    def source(self):
+        return self.series
+
+    # Rows are written as they are fetched, so a large page is never held in memory
+    def stream(self, page):
+        try:
+            with db_connection() as connection:
+                for row in iter_rows(connection, page.sql, page.binds, app.config['READ_ARRAYSIZE']):
+                    yield page.line(row)
+            last = page.last_line()
+        except Exception as e:
+            # The status line is already sent; end the stream with an error line instead
+            logging.error(f"Error reading {self.source()}: {e}")
+            yield json.dumps({'error': 'Internal server error'}) + '\n'
+            return
+        yield last
+
+
+class MetricsQuery(SeriesQuery):
+    series = 'metrics'
+
+
+class WorkoutsQuery(SeriesQuery):
+    def source(self):
+        return workouts_source()
+
+
+def workouts_source():
+    return 'workout_samples' if app.config['WORKOUT_TABLES'] else 'workouts'
+
+
+## Parse the read API parameters of a request into the page to fetch
+def series_page(series, args, user_id):
+    bucket = args.get('bucket')
+    tz = args.get('tz', 'utc')
+    if tz not in ('utc', 'local'):
+        raise QueryError("tz must be 'utc' or 'local'")
+    try:
+        limit = int(args.get('limit', app.config['READ_PAGE_SIZE']))
+    except ValueError:
+        raise QueryError("limit must be an integer")
+    if not 1 <= limit <= app.config['READ_MAX_PAGE_SIZE']:
+        raise QueryError(f"limit must be between 1 and {app.config['READ_MAX_PAGE_SIZE']}")
+    after = decode_cursor(args['cursor']) if args.get('cursor') else None
+    sql, binds = build_query(series, user_id, name=args.get('name'),
+                             start=parse_time(args.get('start'), 'start'),
+                             end=parse_time(args.get('end'), 'end'),
+                             bucket=bucket, local=tz == 'local', after=after, limit=limit)
+    return Page(sql, binds, bucket, tz == 'local', limit)
+
+
+## Leaderboard of a period ('all', or the current 'week' / 'month'): the top users and the caller's rank
+class LeaderboardQuery(Resource):
+    @auth.login_required
+    def get(self):
+        user = auth.current_user()
+        period = request.args.get('period', 'all')
+        if period not in PERIODS:
+            return {'error': f"period must be one of {', '.join(PERIODS)}"}, 400
+        try:
+            limit = int(request.args.get('limit', app.config['LEADERBOARD_SIZE']))
+        except ValueError:
+            return {'error': 'limit must be an integer'}, 400
+        if not 1 <= limit <= app.config['LEADERBOARD_MAX_SIZE']:
+            return {'error': f"limit must be between 1 and {app.config['LEADERBOARD_MAX_SIZE']}"}, 400
+
+        key = current_period_key(period)
+        try:
+            board = leaderboard_cache.board(key)
+        except Exception as e:
+            logging.error(f"Error loading leaderboard: {e}")
+            return {'error': 'Internal server error'}, 500
+
+        def entry_json(entry):
+            result = {'rank': entry['rank'], 'user_id': entry['user_id'],
+                      'username': entry.get('username'), 'points': round(entry['points'], 2)}
+            if period == 'all':
+                result.update(streak_json(entry))
+            return result
+
+        me = board.get(user['id'])
+        return {
+            'period': period,
+            'key': key,
+            'users': len(board),
+            'top': [entry_json(entry) for entry in board.top(limit)],
+            'me': entry_json(me) if me else None,
+        }, 200
+
+
+## Ingest options shared by the upload endpoints: ?load= and ?incremental=
+def ingest_options(args):
+    load = args.get('load', app.config['LOAD_MODE'])
+    if load not in ('auto', 'rows', 'bulk'):
+        raise ValueError("load must be 'auto', 'rows' or 'bulk'")
+    incremental = args.get('incremental', str(app.config['INCREMENTAL_INGEST'])).lower()
+    if incremental not in ('true', 'false'):
+        raise ValueError("incremental must be 'true' or 'false'")
+    return load, incremental == 'true'
+
+
+## Uncompressed size of an upload in bytes: the declared sizes of a ZIP's JSON members, or what
+## is left of a seekable stream. None for a pushed body, which is only measured as it is read
+def payload_size(kind, stream):
+    if kind == 'zip':
+        with zipfile.ZipFile(stream) as zip_ref:
+            return sum(info.file_size for info in zip_ref.infolist() if is_export_member(info))
+    if not stream.seekable():
+        return None
+    position = stream.tell()
+    size = stream.seek(0, os.SEEK_END) - position
+    stream.seek(position)
+    return size
+
+
+def ingest_response(message, summary):
+    return {
+        'message': message,
+        'rows_written': summary['rows_written'],
+        'rows_rejected': summary['rows_rejected'],
+        'rows_skipped': summary['rows_skipped'],
+        'files_skipped': summary['files_skipped'],
+        'downsampling': summary.get('downsampling'),
+        'workouts_written': summary.get('workouts_written'),
+        'workout_samples_written': summary.get('workout_samples_written')}
+
+
+## Row ingest (ROW_INGEST) doesn't build DataFrames, so it is only used when no DataFrame-based
+## feature (downsampling, workout tables, native timestamps, summaries, leaderboard) is on
+def row_ingest_enabled():
+    config = app.config
+    return (config['ROW_INGEST'] and config['DOWNSAMPLE_RESOLUTION'] in ('', 'raw')
+            and not config['DOWNSAMPLE_OVERRIDES']
+            and not any(config[name] for name in ('WORKOUT_TABLES', 'NATIVE_TIMESTAMPS', 'SUMMARY_METRICS',
+                                                  'LEADERBOARD')))
+
+
 ## Resource for file upload and processing
 class FileUpload(Resource):
     @auth.login_required
     def post(self):
         user = auth.current_user()
-
+        if not upload_profiler.wanted(user, request.headers):
+            return self.upload(user)
+
+        # Profiled request: the profile is tagged with the outcome and named after the request id
+        with upload_profiler.profile(request.headers.get('X-Request-ID'), user) as run:
+            body, status, *headers = self.upload(user)
+            file = request.files.get('file')
+            run.tags.update(status=status, filename=file.filename if file else None, bytes=request.content_length)
+            run.tags.update((name, body[name]) for name in ('rows_written', 'rows_rejected', 'rows_skipped', 'job_id')
+                            if name in body)
+        headers = dict(headers[0]) if headers else {}
+        headers['X-Profile-Id'] = run.request_id
+        return body, status, headers
+
+    def upload(self, user):
         if 'file' not in request.files:
             logging.error("No file part in the request")
             return {'error': 'No file part in the request'}, 400
@@ -159,99 +430,440 @@ class FileUpload(Resource):
                 '.json')):
             logging.error("Unsupported file type")
             return {'error': 'File must be a zip or json'}, 400
+        kind = 'zip' if file.filename.endswith('.zip') else 'json'
+        UPLOAD_BYTES.inc(request.content_length or 0, endpoint='upload')
+
+        mode = request.args.get('mode', app.config['INGEST_MODE'])
+        if mode not in ('sync', 'async'):
+            return {'error': "mode must be 'sync' or 'async'"}, 400
 
         try:
-            # Handle ZIP and JSON files separately
-            if file.filename.endswith('.zip'):
-                combined_df = self.handle_zip_file(file, user['id'])  # Pass user_id
-            else:
-                combined_df = self.handle_json_file(file, user['id'])  # Pass user_id
+            load, incremental = ingest_options(request.args)
+        except ValueError as e:
+            return {'error': str(e)}, 400
 
-            # Save processed data to Oracle DB
-            self.save_to_oracle(combined_df)
+        if mode == 'async':
+            # Persist the payload and hand it to the background workers
+            try:
+                workers = get_ingest_workers()
+                job_id = workers.queue.enqueue(user['id'], kind, file.stream, file.filename,
+                                               options={'load': load, 'incremental': incremental})
+            except Exception as e:
+                logging.error(f"Error queueing ingest job: {e}")
+                return {'error': 'Internal server error'}, 500
+            workers.ensure_started()
+            workers.notify()
+            status_url = f"/api/v1/jobs/{job_id}"
+            return {'job_id': job_id, 'state': 'queued', 'status_url': status_url}, 202, \
+                {'Location': status_url}
+
+        try:
+            summary = self.ingest(kind, file.stream, user['id'], load, incremental)
 
-            return {
-                'message': 'Files processed and data saved to the database'}, 200
+            return ingest_response('Files processed and data saved to the database', summary), 200
         except zipfile.BadZipFile:
             logging.error("Invalid ZIP file provided")
             return {'error': 'Invalid zip file'}, 400
+        except ArchiveLimitError as e:
+            logging.error(f"Rejected ZIP file: {e}")
+            return {'error': str(e)}, 413
         except Exception as e:
             logging.error(f"Error processing file: {e}")
             return {'error': 'Internal server error'}, 500
 
-    # Handle processing of ZIP files
-    def handle_zip_file(self, file, user_id):
-        extract_dir = os.path.join(app.config['UPLOAD_FOLDER'],
-                                   'extracted_files')
-        if not os.path.exists(extract_dir):
-            os.makedirs(extract_dir)
-
-        zip_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(zip_path)
+    # Parse an uploaded ZIP or JSON payload and save it, returning row and batch counts.
+    # Incremental ingest skips exports and samples already stored for the user. With row
+    # ingest, batches are lists of row tuples instead of DataFrames.
+    def ingest(self, kind, stream, user_id, load='auto', incremental=True, size=None):
+        # 'auto' picks one path for the whole upload before its first batch, so every batch and
+        # file of a large upload goes through the deduplicating bulk load. `size` is a byte count
+        # known to the caller (Content-Length of a push body); files are measured here.
+        if load == 'auto':
+            if size is None:
+                size = payload_size(kind, stream)
+            large = size is not None and size >= app.config['BULK_LOAD_THRESHOLD_BYTES']
+            load = 'bulk' if large else 'rows'
+
+        with INGEST_STAGE_SECONDS.time(stage='ingest_state'):
+            ingest_filter = self.load_ingest_state(user_id) if incremental else None
+        rows = row_ingest_enabled()
+        processor = HealthDataProcessor(ingest_filter=ingest_filter,
+                                        workout_tables=app.config['WORKOUT_TABLES'],
+                                        native_timestamps=app.config['NATIVE_TIMESTAMPS'],
+                                        rows=rows)
+
+        # Handle ZIP and JSON files separately; pushed bodies are parsed as they arrive
+        if kind == 'zip':
+            batches = self.handle_zip_file(stream, user_id, processor)  # Pass user_id
+        elif kind == 'json_body':
+            batches = processor.process_stream_single_pass(stream, user_id, app.config['STREAM_BATCH_SIZE'])
+        elif kind == 'ndjson':
+            batches = processor.process_ndjson_stream(stream, user_id, app.config['STREAM_BATCH_SIZE'])
+        else:
+            batches = self.handle_json_file(stream, user_id, processor)  # Pass user_id
+
+        # Roll up high-frequency series to the configured resolution before saving
+        downsampler = None
+        if not rows:
+            from processor.downsample import Downsampler, parse_overrides
+            downsampler = Downsampler(app.config['DOWNSAMPLE_RESOLUTION'],
+                                      parse_overrides(app.config['DOWNSAMPLE_OVERRIDES']))
+
+        # Save processed data to Oracle DB, one batch at a time in streaming mode
+        summary = {'rows': 0, 'rows_written': 0, 'rows_rejected': 0, 'batches': 0,
+                   'rows_skipped': 0, 'files_skipped': 0}
+        days = []
+        rescore = False
+        for df in batches:
+            if not len(df):
+                continue
+            if downsampler is not None:
+                with INGEST_STAGE_SECONDS.time(stage='downsample'):
+                    df = downsampler.apply(df)
+            with INGEST_STAGE_SECONDS.time(stage='write'):
+                report = self.save_to_oracle(df, load)
+            summary['rows'] += len(df)
+            summary['rows_written'] += report['rows_written'] if report else len(df)
+            summary['rows_rejected'] += report['errors'] if report else 0
+            summary['batches'] += report['batches'] if report else 1
+            if app.config['SUMMARY_METRICS'] or app.config['LEADERBOARD']:
+                from oracle_writer import accepted_rows
+                from processor.summary import daily_summary
+                with INGEST_STAGE_SECONDS.time(stage='summary'):
+                    daily = daily_summary(accepted_rows(df, report))
+                    if app.config['SUMMARY_METRICS']:
+                        self.save_daily_summary(daily, report)
+                if app.config['LEADERBOARD']:
+                    # Duplicates skipped by a deduplicating merge are not known and must not score
+                    # again: recompute the user's points from summary_metrics, or leave the batch out
+                    if report and report.get('duplicates'):
+                        rescore = True
+                    else:
+                        days.append(daily)
+
+        # Workouts collected for the narrow workout tables, once the health_data rows are in
+        if app.config['WORKOUT_TABLES']:
+            with INGEST_STAGE_SECONDS.time(stage='workout_tables'):
+                tables = processor.take_workout_tables()
+                reports = self.save_workout_tables(tables)
+            if app.config['LEADERBOARD']:
+                from processor.summary import workout_days
+                days.append(workout_days(tables['workout_sessions']))
+            summary['workouts_written'] = reports['workout_sessions']['rows_written']
+            summary['workout_samples_written'] = sum(
+                report['rows_written'] for table, report in reports.items()
+                if table != 'workout_sessions')
+
+        # Only move the watermarks once every batch was saved
+        if ingest_filter is not None:
+            with INGEST_STAGE_SECONDS.time(stage='ingest_state'):
+                self.save_ingest_state(user_id, ingest_filter)
+            summary['rows_skipped'] = ingest_filter.dropped_rows
+            summary['files_skipped'] = ingest_filter.skipped_files
+        if rescore and app.config['SUMMARY_METRICS']:
+            with INGEST_STAGE_SECONDS.time(stage='points'):
+                self.rebuild_points(user_id)
+        elif days:
+            import pandas as pd
+            with INGEST_STAGE_SECONDS.time(stage='points'):
+                self.save_points(user_id, pd.concat(days, ignore_index=True))
+        INGEST_ROWS.inc(summary['rows_written'], outcome='written')
+        INGEST_ROWS.inc(summary['rows_rejected'], outcome='rejected')
+        INGEST_ROWS.inc(summary['rows_skipped'], outcome='skipped')
+        if downsampler is not None and downsampler.enabled:
+            summary['downsampling'] = downsampler.report()
+            logging.info(f"Downsampled {summary['downsampling']['samples']} samples to "
+                         f"{summary['downsampling']['rows']} rows")
+        return summary
+
+    # Load the user's ingested file digests and per-series watermarks
+    def load_ingest_state(self, user_id):
+        with db_connection() as connection:
+            return load_ingest_filter(connection, user_id)
+
+    def save_ingest_state(self, user_id, ingest_filter):
+        with db_connection() as connection:
+            save_ingest_filter(connection, user_id, ingest_filter)
+
+    # Handle processing of ZIP files, yielding the DataFrame(s) to save.
+    # Members are decompressed straight from the upload stream (which Werkzeug
+    # keeps in memory or in an anonymous temporary file private to the request).
+    def handle_zip_file(self, stream, user_id, processor=None):
+        with zipfile.ZipFile(stream) as zip_ref:
+            members = json_members(zip_ref, app.config['MAX_ZIP_MEMBERS'],
+                                   app.config['MAX_ZIP_UNCOMPRESSED_BYTES'])
+
+            processor = processor or HealthDataProcessor()
+            if app.config['STREAMING_PARSE']:
+                yield from processor.process_archive_streaming(
+                    zip_ref, members, user_id, app.config['STREAM_BATCH_SIZE'])
+            elif app.config['PARSE_WORKERS'] > 0 and len(members) > 1:
+                # Each member is saved as soon as it (and those before it) is parsed
+                yield from processor.process_archive_parallel(
+                    zip_ref, members, user_id, app.config['PARSE_WORKERS'],
+                    app.config['PARSE_EXECUTOR'])
+            else:
+                yield processor.process_archive(zip_ref, members, user_id)  # Pass the user_id here
+
+    # Handle processing of JSON files, yielding the DataFrame(s) to save
+    def handle_json_file(self, stream, user_id, processor=None):
+        processor = processor or HealthDataProcessor()
+        if app.config['STREAMING_PARSE']:
+            yield from processor.process_stream_streaming(
+                stream, user_id, app.config['STREAM_BATCH_SIZE'])
+        else:
+            yield processor.process_stream(stream, user_id)  # Pass the user_id here
 
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_dir)
+    # Save a processed DataFrame (or list of rows) and return the writer report. Large frames
+    # (or load='bulk') go through the staging table and a deduplicating set-based merge.
+    def save_to_oracle(self, df, load='auto'):
+        from oracle_writer import HEALTH_DATA_BINDS, HealthDataWriter, StagingBulkLoader, binds_for
 
-        processor = HealthDataProcessor(extract_dir)
-        combined_df = processor.process_files(user_id)  # Pass the user_id here
+        rows = isinstance(df, list)
+        binds = HEALTH_DATA_BINDS if rows else binds_for(df)
+        bulk = load == 'bulk' or (load == 'auto' and len(df) >= app.config['BULK_LOAD_THRESHOLD'])
+        with db_connection() as connection:
+            try:
+                if bulk:
+                    writer = StagingBulkLoader(connection,
+                                               batch_size=app.config['WRITE_BATCH_SIZE'],
+                                               strategy=app.config['BULK_LOAD_STRATEGY'],
+                                               binds=binds)
+                else:
+                    writer = HealthDataWriter(connection,
+                                              batch_size=app.config['WRITE_BATCH_SIZE'],
+                                              commit_every=app.config['WRITE_COMMIT_EVERY'],
+                                              binds=binds)
+                report = writer.write_rows(df) if rows else writer.write(df)
+                logging.info("Data saved to Oracle DB successfully.")
+                return report
+            except Exception as e:
+                logging.error(f"Error saving data to Oracle DB: {e}")
+                raise
 
-        self.clean_up(zip_path, extract_dir)
-        return combined_df
+    # Fold the daily summary of a saved batch into summary_metrics, touching only the days it covers
+    def save_daily_summary(self, summary, report):
+        from summary_metrics import add_daily_summary, refresh_days
 
-    # Handle processing of JSON files
-    def handle_json_file(self, file, user_id):
-        json_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(json_path)
+        with db_connection() as connection:
+            try:
+                # Rows skipped by a deduplicating merge are not known, so recompute those days
+                if report and report.get('duplicates'):
+                    refresh_days(connection, summary)
+                else:
+                    add_daily_summary(connection, summary)
+            except Exception as e:
+                logging.error(f"Error updating summary_metrics: {e}")
+                raise
 
-        processor = HealthDataProcessor(app.config['UPLOAD_FOLDER'])
-        processor.process_file(json_path, user_id)  # Pass the user_id here
-        combined_df = pd.concat(processor.dataframes, ignore_index=True)
+    # Add an upload's daily totals to the user's points and streak, and to the cached leaderboards
+    def save_points(self, user_id, daily):
+        days = daily_totals(daily).get(user_id)
+        if not days:
+            return
+        with db_connection() as connection:
+            try:
+                changed = update_user_points(connection, user_id, days, points_rules())
+            except Exception as e:
+                logging.error(f"Error updating user_points: {e}")
+                raise
+        for period, state in changed.items():
+            leaderboard_cache.update(period, {'user_id': user_id, **state})
 
-        os.remove(json_path)
-        return combined_df
+    # Recompute the user's points and streak from summary_metrics, for uploads whose new rows
+    # are not known; the loaded leaderboards are dropped to pick up the new totals
+    def rebuild_points(self, user_id):
+        with db_connection() as connection:
+            try:
+                rebuild_user_points(connection, points_rules(), user_id=user_id,
+                                    workout_tables=app.config['WORKOUT_TABLES'])
+            except Exception as e:
+                logging.error(f"Error rebuilding user_points: {e}")
+                raise
+        leaderboard_cache.clear()
 
-        # Modified save_to_oracle to accept user_id
+    # Save the workout sessions and their samples; returns the report of each table
+    def save_workout_tables(self, tables):
+        from oracle_writer import WorkoutTablesWriter
 
-    def save_to_oracle(self, df):
-        with get_db_connection() as connection:
-            cursor = connection.cursor()
+        if tables['workout_sessions'].empty:
+            return {table: {'rows_written': 0} for table in tables}
+        with db_connection() as connection:
             try:
-                insert_query = """
-                      INSERT INTO health_data (
-                      health_data_user, 
-                      type, 
-                      recorded_date, 
-                      source, 
-                      workout_qty, 
-                      workout_units,
-                      elevation_qty, 
-                      elevation_units, 
-                      location, 
-                      value, 
-                      units, 
-                      metric_name)
-                      VALUES (:1, :2, :3, :4, :5, :6, :7, :8, :9, :10, :11, :12)
-                  """
-                df = df.replace({np.nan: None})
-                data_to_insert = [tuple(row) for row in
-                                  df.itertuples(index=False)]
-
-                cursor.executemany(insert_query, data_to_insert)
-                connection.commit()
-                logging.info("Data saved to Oracle DB successfully.")
+                writer = WorkoutTablesWriter(connection, batch_size=app.config['WRITE_BATCH_SIZE'])
+                return writer.write(tables)
             except Exception as e:
-                logging.error(f"Error saving data to Oracle DB: {e}")
+                logging.error(f"Error saving workouts to Oracle DB: {e}")
                 raise
-            finally:
-                cursor.close()
 
-    def clean_up(self, zip_path, extract_dir):
+
+## Resource for exports POSTed directly as the request body (e.g. a Health Auto Export REST
+## automation): application/json or NDJSON (one export per line), optionally gzip or zstd
+## encoded. The body is decoded and parsed as it is read; nothing is written to disk.
+class PushUpload(Resource):
+    @auth.login_required
+    def post(self):
+        user = auth.current_user()
+
+        kind = MEDIA_TYPES.get(request.mimetype)
+        if kind is None:
+            return {'error': f"Content-Type must be one of {', '.join(MEDIA_TYPES)}"}, 415
+
         try:
-            shutil.rmtree(extract_dir)
-            os.remove(zip_path)
-            logging.info("Cleaned up files successfully.")
-        except Exception as e:
-            logging.error(f"Error during cleanup: {e}")
+            load, incremental = ingest_options(request.args)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+
+        max_body = app.config['PUSH_MAX_BODY_BYTES']
+        if (request.content_length or 0) > max_body:
+            return {'error': f"Request body is larger than {max_body} bytes"}, 413
+
+        UPLOAD_BYTES.inc(request.content_length or 0, endpoint='push')
+        try:
+            # Chunked bodies have no Content-Length; their size is checked as they are read
+            body = open_body(limit_body(request.stream, max_body), request.headers.get('Content-Encoding'),
+                             app.config['PUSH_MAX_BYTES'])
+        except UnsupportedEncoding as e:
+            return {'error': str(e)}, 415
+
+        return ingest_push(kind, body, user['id'], load, incremental, request.content_length)
+
+
+## Ingest a decoded push body; returns the response body and status. `size` is the request's
+## Content-Length: the decoded size, or a lower bound of it for a compressed body
+def ingest_push(kind, body, user_id, load, incremental, size=None):
+    try:
+        summary = FileUpload().ingest(kind, body, user_id, load, incremental, size)
+
+        return ingest_response('Export processed and data saved to the database', summary), 200
+    except ArchiveLimitError as e:
+        logging.error(f"Rejected pushed export: {e}")
+        return {'error': str(e)}, 413
+    except DECODE_ERRORS as e:
+        logging.error(f"Invalid encoded body: {e}")
+        return {'error': 'Request body could not be decoded'}, 400
+    except ValueError as e:
+        logging.error(f"Invalid pushed export: {e}")
+        return {'error': 'Invalid export'}, 400
+    except Exception as e:
+        logging.error(f"Error processing pushed export: {e}")
+        return {'error': 'Internal server error'}, 500
+
+
+## Points rules and the in-memory leaderboards of this process
+def points_rules():
+    return PointsRules(step_points=app.config['POINTS_PER_1000_STEPS'],
+                       workout_points=app.config['POINTS_PER_WORKOUT_DAY'],
+                       streak_points=app.config['POINTS_PER_STREAK_DAY'])
+
+
+def load_leaderboard(period):
+    with db_connection() as connection:
+        return load_rankings(connection, period)
+
+
+leaderboard_cache = LeaderboardCache(load_leaderboard, ttl=app.config['LEADERBOARD_CACHE_TTL'])
+
+
+## Background ingest: a durable local job queue and the workers draining it
+_ingest_workers = None
+
+
+def get_ingest_workers():
+    global _ingest_workers
+    if _ingest_workers is None:
+        queue = JobQueue(app.config['JOB_DB_PATH'], app.config['JOB_SPOOL_DIR'],
+                         max_attempts=app.config['JOB_MAX_ATTEMPTS'])
+        _ingest_workers = JobWorkers(queue, run_ingest_job, size=app.config['JOB_WORKERS'])
+    return _ingest_workers
+
+
+## Process a queued upload; returns (rows, batches)
+def run_ingest_job(job):
+    options = job['options'] or {}
+    with open(job['payload_path'], 'rb') as stream:
+        summary = FileUpload().ingest(job['kind'], stream, job['user_id'],
+                                      options.get('load', 'auto'),
+                                      options.get('incremental', app.config['INCREMENTAL_INGEST']))
+    return summary['rows_written'], summary['batches']
+
+
+## Start the workers in each serving process, so jobs queued before a restart are picked up
+@app.before_request
+def start_ingest_workers():
+    if app.config['INGEST_MODE'] == 'async' or os.path.exists(app.config['JOB_DB_PATH']):
+        get_ingest_workers().ensure_started()
+
+
+## Request latency by endpoint, for /metrics
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def observe_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=request.endpoint or 'unknown',
+                                     method=request.method, status=response.status_code)
+    return response
+
+
+## Resource exposing the ingest, database and authentication metrics in the Prometheus text format
+class MetricsExposition(Resource):
+    def get(self):
+        token = app.config['METRICS_TOKEN']
+        if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}"):
+            return {'error': 'Unauthorized'}, 401
+        return Response(exposition(), content_type=CONTENT_TYPE)
+
+
+## Rebuild summary_metrics from health_data, e.g. after enabling SUMMARY_METRICS on existing data
+@app.cli.command('backfill-summary')
+@click.option('--user-id', type=int, default=None, help='Only this user (default: every user)')
+@click.option('--since', default=None, help='First day to recompute, YYYY-MM-DD')
+def backfill_summary_command(user_id, since):
+    from summary_metrics import backfill_summary
+
+    with db_connection() as connection:
+        users = backfill_summary(connection, user_id=user_id, since=since)
+    click.echo(f"Recomputed summary_metrics of {users} user(s)")
+
+
+## Recompute user_points from summary_metrics, e.g. after a backfill of older days
+@app.cli.command('rebuild-leaderboard')
+@click.option('--user-id', type=int, default=None, help='Only this user (default: every user)')
+def rebuild_leaderboard_command(user_id):
+    with db_connection() as connection:
+        users = rebuild_user_points(connection, points_rules(), user_id=user_id,
+                                    workout_tables=app.config['WORKOUT_TABLES'])
+    click.echo(f"Rebuilt user_points of {users} user(s)")
+
+
+## Resource reporting the state of a background ingest job
+class IngestJobStatus(Resource):
+    @auth.login_required
+    def get(self, job_id):
+        user = auth.current_user()
+        job = get_ingest_workers().queue.get(job_id)
+        if job is None or job['user_id'] != user['id']:
+            return {'error': 'Job not found'}, 404
+
+        return {
+            'job_id': job['id'],
+            'state': job['state'],
+            'filename': job['filename'],
+            'rows': job['rows'],
+            'batches': job['batches'],
+            'attempts': job['attempts'],
+            'error': job['error'],
+            'created_at': job['created_at'],
+            'started_at': job['started_at'],
+            'finished_at': job['finished_at'],
+            'queue_seconds': job['queue_seconds'],
+            'run_seconds': job['run_seconds'],
+        }, 200
 
 
 ## Resource for user registration with email
@@ -268,7 +880,10 @@ class UserRegistration(Resource):
         if not is_valid_email(email):
             return {'error': 'Invalid email format'}, 400
 
-        api_key, error = create_user(username, password, email)
+        try:
+            api_key, error = create_user(username, password, email)
+        except PasswordHasherBusy as e:
+            return password_hasher_busy(e)
 
         if api_key:
             return {'api_key': api_key}, 201
@@ -286,19 +901,63 @@ class UserLogin(Resource):
         if not username or not password:
             return {'error': 'Username and password are required'}, 400
 
-        api_key = verify_user(username, password)
+        try:
+            user = verify_user(username, password)
+        except PasswordHasherBusy as e:
+            return password_hasher_busy(e)
 
-        if api_key:
-            return {'api_key': api_key}, 200
-        else:
+        if not user:
+            return {'error': 'Invalid credentials'}, 401
+        if user['api_key']:
+            return {'api_key': user['api_key']}, 200
+        # New-style keys are only shown when issued; a lost key must be rotated
+        return {
+            'api_key_prefix': user['api_key_prefix'],
+            'message': 'API key is only shown once. Use /api/v1/rotate-key to issue a new one.'
+        }, 200
+
+
+## Resource for replacing a user's API key (authenticated with username and password)
+class RotateApiKey(Resource):
+    def post(self):
+        data = request.get_json()
+        username = data.get('username')
+        password = data.get('password')
+
+        if not username or not password:
+            return {'error': 'Username and password are required'}, 400
+
+        try:
+            user = verify_user(username, password)
+        except PasswordHasherBusy as e:
+            return password_hasher_busy(e)
+        if not user:
             return {'error': 'Invalid credentials'}, 401
 
+        try:
+            api_key, api_key_prefix = rotate_api_key(user['id'])
+        except Exception as e:
+            logging.error(f"Error rotating API key: {e}")
+            return {'error': 'Internal server error'}, 500
+
+        return {'api_key': api_key, 'api_key_prefix': api_key_prefix}, 200
+
 
 # Add resources to the API with versioned endpoints
 api.add_resource(ApiInfo, '/api/v1/')
 api.add_resource(FileUpload, '/api/v1/upload')
+api.add_resource(PushUpload, '/api/v1/push')
+api.add_resource(IngestJobStatus, '/api/v1/jobs/<string:job_id>')
 api.add_resource(UserRegistration, '/api/v1/register')
 api.add_resource(UserLogin, '/api/v1/login')
+api.add_resource(RotateApiKey, '/api/v1/rotate-key')
+api.add_resource(PoolStatus, '/api/v1/status/pool')
+api.add_resource(AuthCacheStatus, '/api/v1/status/auth-cache')
+api.add_resource(PasswordHashingStatus, '/api/v1/status/password-hashing')
+api.add_resource(MetricsQuery, '/api/v1/metrics')
+api.add_resource(WorkoutsQuery, '/api/v1/workouts')
+api.add_resource(LeaderboardQuery, '/api/v1/leaderboard')
+api.add_resource(MetricsExposition, '/metrics')
 
 # Run the Flask app
 if __name__ == "__main__":
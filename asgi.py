@@ -0,0 +1,330 @@
+"""
+ASGI entry point, e.g. `uvicorn asgi:app` (any ASGI server works).
+
+Same /api/v1/* routes and Bearer authentication as wsgi.py, but connection
+waits cost no thread: request bodies are received and read pages are
+streamed on the event loop. The read API (metrics, workouts) runs on the
+asyncio Oracle pool; pushed exports are decoded, flattened and written on a
+thread pool, so parsing never blocks the loop. Every other route is served
+by the Flask app on the same thread pool.
+"""
+import asyncio
+import io
+import json
+import logging
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from api_keys import digest_api_key, is_legacy_api_key
+from app import (api_key_cache, app as flask_app, ingest_options, ingest_push, load_user_by_api_key,
+                 series_page, workouts_source)
+from db import async_db_connection, close_async_pool, close_pool
+from health_queries import QueryError, iter_rows_async
+from metrics import UPLOAD_BYTES
+from processor.parallel import shutdown_executors
+from processor.push import MEDIA_TYPES, UnsupportedEncoding, limit_body, open_body
+
+
+class BodyReader(io.RawIOBase):
+    """
+    A request body received on the event loop (feed()) and read as a file on
+    a worker thread. At most `max_chunks` received chunks are held, so a slow
+    parser holds back the client rather than the body piling up in memory.
+    """
+
+    def __init__(self, loop, max_chunks):
+        self.loop = loop
+        self.chunks = asyncio.Queue(max_chunks)
+        self.disconnected = False
+        self._chunk = memoryview(b'')
+        self._done = False
+        self._error = None
+
+    def readable(self):
+        return True
+
+    async def feed(self, receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                self.disconnected = True
+                await self.chunks.put(ConnectionError("Client disconnected"))
+                return
+            chunk = message.get('body', b'')
+            UPLOAD_BYTES.inc(len(chunk), endpoint='push')
+            if chunk:
+                await self.chunks.put(chunk)
+            if not message.get('more_body'):
+                await self.chunks.put(None)
+                return
+
+    def abort(self):
+        """Called on the event loop once feeding stops early, so a pending read can't wait forever."""
+        while not self.chunks.empty():
+            self.chunks.get_nowait()
+        self.chunks.put_nowait(ConnectionError("Request body was not received"))
+
+    def readinto(self, buffer):
+        while not self._chunk and not self._done:
+            chunk = asyncio.run_coroutine_threadsafe(self.chunks.get(), self.loop).result()
+            if isinstance(chunk, Exception):
+                self._done, self._error = True, chunk
+            elif chunk is None:
+                self._done = True
+            else:
+                self._chunk = memoryview(chunk)
+        if self._error is not None:
+            raise self._error
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+
+class AsgiApp:
+
+    def __init__(self, wsgi_app, config):
+        self.wsgi_app = wsgi_app
+        self.config = config
+        self._executor = None
+        self.routes = {
+            ('POST', '/api/v1/push'): self.push,
+            ('GET', '/api/v1/metrics'): lambda scope, receive, send: self.series(scope, send, 'metrics'),
+            ('GET', '/api/v1/workouts'): lambda scope, receive, send: self.series(scope, send, workouts_source()),
+        }
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.config['ASGI_THREADS'], thread_name_prefix='asgi')
+        return self._executor
+
+    def run(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        handler = self.routes.get((scope['method'], scope['path']))
+        if handler is None:
+            await self.wsgi(scope, receive, send)
+        else:
+            await handler(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await close_async_pool()
+                await self.run(close_pool)
+                shutdown_executors()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    # Bearer token check with the same cache and lookups as the Flask app
+    async def authenticate(self, headers):
+        scheme, _, api_key = headers.get('authorization', '').partition(' ')
+        api_key = api_key.strip()
+        if scheme != 'Bearer' or not api_key:
+            return None
+        api_key_hash = digest_api_key(api_key)
+        found, user = api_key_cache.lookup(api_key_hash)
+        if not found:
+            generation = api_key_cache.generation()
+            user = await self.load_user(api_key, api_key_hash)
+            api_key_cache.put(api_key_hash, user, generation)
+        return user
+
+    async def load_user(self, api_key, api_key_hash):
+        async with async_db_connection() as connection:
+            cursor = connection.cursor()
+            try:
+                await cursor.execute("SELECT id, username FROM users WHERE api_key_hash = :api_key_hash",
+                                     [api_key_hash])
+                user = await cursor.fetchone()
+            finally:
+                cursor.close()
+        if user:
+            return {'id': user[0], 'username': user[1]}
+        if is_legacy_api_key(api_key):
+            # Rare: matches and backfills the digest of a legacy key
+            return await self.run(load_user_by_api_key, api_key, api_key_hash)
+        return None
+
+    # POST /api/v1/push: the body is received here and parsed and ingested on the thread pool
+    async def push(self, scope, receive, send):
+        headers = request_headers(scope)
+        user = await self.authenticate(headers)
+        if user is None:
+            await unauthorized(send)
+            return
+
+        kind = MEDIA_TYPES.get(headers.get('content-type', '').split(';')[0].strip().lower())
+        if kind is None:
+            await send_json(send, 415, {'error': f"Content-Type must be one of {', '.join(MEDIA_TYPES)}"})
+            return
+        try:
+            load, incremental = ingest_options(query_args(scope))
+        except ValueError as e:
+            await send_json(send, 400, {'error': str(e)})
+            return
+
+        max_body = self.config['PUSH_MAX_BODY_BYTES']
+        size = int(headers['content-length']) if headers.get('content-length') else None
+        if (size or 0) > max_body:
+            await send_json(send, 413, {'error': f"Request body is larger than {max_body} bytes"})
+            return
+        reader = BodyReader(asyncio.get_running_loop(), self.config['ASGI_PUSH_CHUNKS'])
+        try:
+            body = open_body(limit_body(reader, max_body), headers.get('content-encoding'),
+                             self.config['PUSH_MAX_BYTES'])
+        except UnsupportedEncoding as e:
+            await send_json(send, 415, {'error': str(e)})
+            return
+
+        # The body is parsed on the thread pool as its chunks arrive
+        receiving = asyncio.create_task(reader.feed(receive))
+        try:
+            payload, status = await self.run(ingest_push, kind, body, user['id'], load, incremental, size)
+        finally:
+            # The parser may stop early (an invalid or oversized body) with chunks still unread
+            receiving.cancel()
+            reader.abort()
+        if reader.disconnected:
+            return
+        await send_json(send, status, payload)
+
+    # GET /api/v1/metrics and /api/v1/workouts on the asyncio pool, streamed as rows arrive
+    async def series(self, scope, send, source):
+        user = await self.authenticate(request_headers(scope))
+        if user is None:
+            await unauthorized(send)
+            return
+        try:
+            page = series_page(source, query_args(scope), user['id'])
+        except QueryError as e:
+            await send_json(send, 400, {'error': str(e)})
+            return
+
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'application/x-ndjson')]})
+        try:
+            async with async_db_connection() as connection:
+                async for row in iter_rows_async(connection, page.sql, page.binds,
+                                                 self.config['READ_ARRAYSIZE']):
+                    await send({'type': 'http.response.body', 'body': page.line(row).encode('utf-8'),
+                                'more_body': True})
+            last = page.last_line()
+        except Exception as e:
+            # The status line is already sent; end the stream with an error line instead
+            logging.error(f"Error reading {source}: {e}")
+            last = json.dumps({'error': 'Internal server error'}) + '\n'
+        await send({'type': 'http.response.body', 'body': last.encode('utf-8')})
+
+    # Any other route: the Flask app, called on the thread pool with the body already received
+    async def wsgi(self, scope, receive, send):
+        body = tempfile.SpooledTemporaryFile(max_size=self.config['ASGI_SPOOL_BYTES'])
+        try:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            status, headers, content = await self.run(self.call_wsgi, wsgi_environ(scope, body))
+        finally:
+            body.close()
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+    def call_wsgi(self, environ):
+        response = {}
+        chunks = []
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                   for name, value in headers]
+            return chunks.append
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in result:
+                chunks.append(chunk)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], response['headers'], b''.join(chunks)
+
+
+def request_headers(scope):
+    """Request headers as {lower-case name: value}, repeated headers joined with commas."""
+    headers = {}
+    for name, value in scope['headers']:
+        name, value = name.decode('latin-1').lower(), value.decode('latin-1')
+        headers[name] = f"{headers[name]},{value}" if name in headers else value
+    return headers
+
+
+def query_args(scope):
+    return dict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+
+
+async def send_json(send, status, payload, headers=()):
+    body = (json.dumps(payload) + '\n').encode('utf-8')
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'),
+                            (b'content-length', str(len(body)).encode('ascii')), *headers]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def unauthorized(send):
+    # Same response as flask_httpauth's default error handler
+    body = b'Unauthorized Access'
+    await send({'type': 'http.response.start', 'status': 401,
+                'headers': [(b'content-type', b'text/html; charset=utf-8'),
+                            (b'content-length', str(len(body)).encode('ascii')),
+                            (b'www-authenticate', b'Bearer realm="Authentication Required"')]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in request_headers(scope).items():
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'content-length':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            environ['HTTP_' + name.upper().replace('-', '_')] = value
+    return environ
+
+
+app = AsgiApp(flask_app, flask_app.config)
@@ -0,0 +1,159 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+# Marker stored for keys that are known not to belong to any user
+_MISSING = object()
+
+
+class SharedGeneration:
+    """
+    Revocation counter shared by the processes of one host through a
+    memory-mapped file: bumped on every invalidation, and compared with the
+    value an entry was cached at on every cache hit.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._map = None
+        self._lock = threading.Lock()
+
+    def _mapped(self):
+        if self._map is None:
+            with self._lock:
+                if self._map is None:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                    with open(self.path, 'a+b') as f:
+                        if os.fstat(f.fileno()).st_size < 8:
+                            f.truncate(8)
+                        # The mapping stays valid (and shared after a fork) once the file is closed
+                        self._map = mmap.mmap(f.fileno(), 8)
+        return self._map
+
+    def value(self):
+        return struct.unpack_from('<q', self._mapped(), 0)[0]
+
+    def bump(self):
+        mapped = self._mapped()
+        with open(self.path, 'rb') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                struct.pack_into('<q', mapped, 0, struct.unpack_from('<q', mapped, 0)[0] + 1)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class ApiKeyCache:
+    """
+    Bounded LRU cache for API key lookups.
+
+    Positive results live for `ttl` seconds, negative results (unknown keys)
+    for the shorter `negative_ttl`. The least recently used entry is evicted
+    once `maxsize` entries are held. With a SharedGeneration, invalidating
+    in one process also drops the entries other processes cached before it.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, negative_ttl=30, clock=time.monotonic, shared=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.shared = shared
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, loader):
+        """
+        Return the cached user for `key`, calling `loader(key)` on a miss.
+        `loader` returns the user dict or None when the key is unknown.
+        """
+        found, user = self.lookup(key)
+        if found:
+            return user
+
+        # Load outside the lock so a slow database does not serialise requests
+        generation = self.generation()
+        user = loader(key)
+        self.put(key, user, generation)
+        return user
+
+    def generation(self):
+        """The shared revocation generation; read it before loading the entry to put()."""
+        return self.shared.value() if self.shared is not None else 0
+
+    def lookup(self, key):
+        """
+        (True, user) for a live entry, the user being None for a known-unknown
+        key; (False, None) on a miss, for callers that load asynchronously.
+        """
+        now = self._clock()
+        generation = self.generation()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, cached_generation, user = entry
+                if expires_at > now and cached_generation == generation:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, None if user is _MISSING else user
+                del self._entries[key]
+            self.misses += 1
+        return False, None
+
+    def put(self, key, user, generation=None):
+        ttl = self.ttl if user is not None else self.negative_ttl
+        if ttl <= 0:
+            return
+        expires_at = self._clock() + ttl
+        if generation is None:
+            generation = self.generation()
+        with self._lock:
+            self._entries[key] = (expires_at, generation, _MISSING if user is None else user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Drop the entry for a single API key."""
+        with self._lock:
+            self._entries.pop(key, None)
+        self._revoke()
+
+    def invalidate_user(self, user_id):
+        """Drop every entry that resolves to the given user id."""
+        with self._lock:
+            stale = [key for key, (_, _, user) in self._entries.items()
+                     if user is not _MISSING and user.get('id') == user_id]
+            for key in stale:
+                del self._entries[key]
+        self._revoke()
+
+    def _revoke(self):
+        # Other processes only know that something was invalidated, so they drop everything
+        if self.shared is not None:
+            self.shared.bump()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            'size': size,
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,90 @@
+"""
+Compare the columnar flattening engine with the previous list-of-dicts
+implementation on the sample exports in zipped_json/.
+
+    python -m benchmarks.bench_flatten [--repeat 5]
+"""
+import argparse
+import glob
+import json
+import os
+import time
+import zipfile
+
+import pandas as pd
+
+from processor.columnar import ColumnarBuilder
+from processor.columns import INSERT_COLUMNS, METRIC_COLUMNS, WORKOUT_COLUMNS
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'zipped_json')
+
+
+def load_samples():
+    """Yield (name, parsed export) for every JSON member of the sample zips."""
+    for zip_path in sorted(glob.glob(os.path.join(SAMPLES_DIR, '*.zip'))):
+        with zipfile.ZipFile(zip_path) as zip_ref:
+            for info in zip_ref.infolist():
+                name = info.filename
+                if name.endswith('.json') and not name.startswith('__MACOSX/'):
+                    with zip_ref.open(info) as f:
+                        yield os.path.basename(zip_path), json.load(f)
+
+
+def legacy_flatten(data, user_id):
+    """The list-of-dicts flattening and concat steps this engine replaced."""
+    workouts = []
+    for workout in data['data'].get('workouts') or []:
+        elevation = workout.get('elevationUp', {})
+        for step in workout.get('stepCount', []):
+            workouts.append({
+                'health_data_user': user_id, 'type': 'workout', 'date': step.get('date'),
+                'source': step.get('source'), 'workout_qty': step.get('qty'),
+                'workout_units': step.get('units'), 'elevation_qty': elevation.get('qty', None),
+                'elevation_units': elevation.get('units', None),
+                'location': workout.get('location', None)})
+    metrics = []
+    for metric in data['data'].get('metrics') or []:
+        for entry in metric.get('data', []):
+            metrics.append({
+                'health_data_user': user_id, 'type': 'metric', 'date': entry.get('date'),
+                'source': entry.get('source', None), 'value': entry.get('qty'),
+                'units': metric.get('units', None), 'metric_name': metric.get('name', None)})
+
+    workout_df = pd.DataFrame(workouts) if workouts else pd.DataFrame(columns=WORKOUT_COLUMNS)
+    metrics_df = pd.DataFrame(metrics) if metrics else pd.DataFrame(columns=METRIC_COLUMNS)
+    combined = pd.concat([workout_df, metrics_df], ignore_index=True)
+    # handle_json_file / process_files concatenated the per-file frames again
+    return pd.concat([combined], ignore_index=True)
+
+
+def columnar_flatten(data, user_id):
+    builder = ColumnarBuilder()
+    builder.add_workouts(data, user_id)
+    builder.add_metrics(data, user_id)
+    return builder.build(INSERT_COLUMNS)
+
+
+def best_of(func, data, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = len(func(data, 1))
+        timings.append(time.perf_counter() - started)
+    return rows, min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'sample':<50} {'rows':>7} {'legacy rows/s':>14} {'columnar rows/s':>16} {'speedup':>8}")
+    for name, data in load_samples():
+        rows, legacy = best_of(legacy_flatten, data, args.repeat)
+        _, columnar = best_of(columnar_flatten, data, args.repeat)
+        print(f"{name:<50} {rows:>7} {rows / legacy:>14,.0f} {rows / columnar:>16,.0f} "
+              f"{legacy / columnar:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
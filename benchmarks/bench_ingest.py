@@ -0,0 +1,184 @@
+"""
+Time each ingest stage on synthetic exports (see benchmarks.generator) and
+check the results against a stored baseline.
+
+    python -m benchmarks.bench_ingest [--users 2 --days 14 --workouts 1 --sps 1] [--repeat 5]
+        [--db-latency-ms 0] [--save-baseline | --check] [--baseline benchmarks/baseline.json]
+
+Stages: json.load, flatten_workouts, flatten_metrics, the concat of the
+per-file frames, process_file, process_files over the whole directory, and
+save_to_oracle (row and bulk loads) against the local fake DB in
+benchmarks.fake_db; then the same process_file and row load with row ingest
+(lists of tuples instead of DataFrames). Each reports rows/s (best of --repeat), the peak of
+Python allocations traced during one more run, and the process peak RSS
+after the stage. --check exits 1 when a stage is slower or allocates more
+than the baseline by over --tolerance.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest.mock import patch
+
+import pandas as pd
+
+from benchmarks.fake_db import FakeConnection, fake_db_connection
+from benchmarks.generator import add_arguments, scenario, write_exports
+from processor.health_data_processor import HealthDataProcessor
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+
+def measure(func, repeat):
+    """Best-of-`repeat` seconds and the traced allocation peak (MB) of one more call."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(timings), peak / (1024 * 1024)
+
+
+def stages(paths, input_dir, latency):
+    """(name, rows, callable) for every stage, in ingest order."""
+    processor = HealthDataProcessor()
+    exports = []
+    for path in paths:
+        with open(path) as f:
+            exports.append(json.load(f))
+    workouts = [processor.flatten_workouts(data, 1) for data in exports]
+    metrics = [processor.flatten_metrics(data, 1) for data in exports]
+    frames = [pd.concat([w, m], ignore_index=True) for w, m in zip(workouts, metrics)]
+    df = pd.concat(frames, ignore_index=True)
+    rows = [row for path in paths for row in HealthDataProcessor(rows=True).process_file(path, 1)]
+    processor.dataframes.clear()
+
+    def load_all():
+        for path in paths:
+            with open(path) as f:
+                json.load(f)
+
+    def process_file():
+        for path in paths:
+            HealthDataProcessor().process_file(path, 1)
+
+    def process_file_rows():
+        for path in paths:
+            HealthDataProcessor(rows=True).process_file(path, 1)
+
+    def save(load, batch=df):
+        import app
+        connection = FakeConnection(latency)
+        with patch.object(app, 'db_connection', fake_db_connection(connection)):
+            app.FileUpload().save_to_oracle(batch, load=load)
+
+    return [
+        ('json_load', len(df), load_all),
+        ('flatten_workouts', sum(map(len, workouts)),
+         lambda: [processor.flatten_workouts(data, 1) for data in exports]),
+        ('flatten_metrics', sum(map(len, metrics)),
+         lambda: [processor.flatten_metrics(data, 1) for data in exports]),
+        ('concat', len(df),
+         lambda: pd.concat([pd.concat([w, m], ignore_index=True) for w, m in zip(workouts, metrics)],
+                           ignore_index=True)),
+        ('process_file', len(df), process_file),
+        ('process_files', len(df), lambda: HealthDataProcessor(input_dir).process_files(1)),
+        ('save_to_oracle_rows', len(df), lambda: save('rows')),
+        ('save_to_oracle_bulk', len(df), lambda: save('bulk')),
+        ('process_file_row_tuples', len(rows), process_file_rows),
+        ('save_to_oracle_row_tuples', len(rows), lambda: save('rows', rows)),
+    ]
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as input_dir:
+        paths = write_exports(input_dir, args.users, **scenario(args))
+        results = {}
+        for name, rows, func in stages(paths, input_dir, args.db_latency_ms / 1000):
+            seconds, peak_alloc = measure(func, args.repeat)
+            results[name] = {'rows': rows, 'seconds': round(seconds, 6),
+                             'rows_per_second': round(rows / seconds),
+                             'peak_alloc_mb': round(peak_alloc, 2), 'peak_rss_mb': round(peak_rss_mb(), 1)}
+    return results
+
+
+def regressions(results, baseline, tolerance):
+    """Messages for the stages slower or more allocation-hungry than the baseline."""
+    found = []
+    for name, base in baseline['stages'].items():
+        result = results.get(name)
+        if result is None:
+            continue
+        if result['rows_per_second'] < base['rows_per_second'] * (1 - tolerance):
+            found.append(f"{name}: {result['rows_per_second']:,} rows/s, baseline "
+                         f"{base['rows_per_second']:,}")
+        # Allocation peaks under 1 MB are noise
+        if result['peak_alloc_mb'] > max(base['peak_alloc_mb'] * (1 + tolerance), 1):
+            found.append(f"{name}: peak allocations {result['peak_alloc_mb']} MB, baseline "
+                         f"{base['peak_alloc_mb']} MB")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_arguments(parser)
+    parser.set_defaults(users=2, days=14)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--db-latency-ms', type=float, default=0.0,
+                        help='Simulated round-trip time of the fake DB')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--check', action='store_true')
+    args = parser.parse_args()
+
+    # The writers log every save at INFO
+    logging.disable(logging.INFO)
+    results = run(args)
+    print(f"{'stage':<26} {'rows':>8} {'rows/s':>12} {'peak alloc MB':>14} {'peak RSS MB':>12}")
+    for name, result in results.items():
+        print(f"{name:<26} {result['rows']:>8} {result['rows_per_second']:>12,} "
+              f"{result['peak_alloc_mb']:>14} {result['peak_rss_mb']:>12}")
+
+    current = {'scenario': dict(scenario(args), users=args.users, db_latency_ms=args.db_latency_ms),
+               'python': platform.python_version(), 'pandas': pd.__version__,
+               'machine': platform.machine(), 'cpus': os.cpu_count(), 'stages': results}
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(current, f, indent=2)
+            f.write('\n')
+        print(f"Baseline saved to {args.baseline}")
+    elif args.check:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['scenario'] != current['scenario']:
+            sys.exit(f"Baseline scenario {baseline['scenario']} differs from {current['scenario']}")
+        found = regressions(results, baseline, args.tolerance)
+        for message in found:
+            print(f"REGRESSION {message}")
+        if found:
+            sys.exit(1)
+        print(f"No regression beyond {args.tolerance:.0%} of {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
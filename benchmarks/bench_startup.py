@@ -0,0 +1,118 @@
+"""
+Cold start of an app worker: the time to import the app and the RSS of the
+process once it has served a first request, each in a fresh interpreter.
+
+    python -m benchmarks.bench_startup [--repeat 5] [--days 3 --workout-seconds 600] [--json out.json]
+
+Scenarios: import (the app only), login (register and log in a user), upload
+(one JSON export, DataFrame ingest) and upload_rows (the same with
+ROW_INGEST=true), against the stand-in database of benchmarks.fake_db.
+Reports the median import seconds, the RSS after the import and after the
+scenario, the peak RSS, the number of modules loaded and whether pandas
+was. Linux only (RSS is read from /proc).
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generator import add_arguments, generate_export, scenario
+
+SCENARIOS = ('import', 'login', 'upload', 'upload_rows')
+
+
+def memory_mb():
+    """(current, peak) RSS of this process in MB."""
+    with open('/proc/self/status') as f:
+        fields = dict(line.split(':', 1) for line in f if ':' in line)
+    return int(fields['VmRSS'].split()[0]) / 1024, int(fields['VmHWM'].split()[0]) / 1024
+
+
+def probe(name, export_path):
+    """Run one scenario in this (fresh) process and return its measurements."""
+    started = time.perf_counter()
+    import app as app_module
+    import_seconds = time.perf_counter() - started
+    rss_import, _ = memory_mb()
+
+    if name != 'import':
+        from benchmarks.fake_db import create_users_table, standin_db_connection
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            users_db = os.path.join(work_dir, 'users.sqlite3')
+            create_users_table(users_db)
+            app_module.db_connection = standin_db_connection(users_db)
+            client = app_module.app.test_client()
+            user = {'username': 'startup', 'password': 'startup-password', 'email': 'startup@example.com'}
+            response = client.post('/api/v1/register', json=user)
+            api_key = response.get_json()['api_key']
+            if name == 'login':
+                response = client.post('/api/v1/login', json=user)
+            else:
+                with open(export_path, 'rb') as f:
+                    response = client.post('/api/v1/upload', headers={'Authorization': f'Bearer {api_key}'},
+                                           data={'file': (io.BytesIO(f.read()), 'export.json')},
+                                           content_type='multipart/form-data')
+            if response.status_code != 200:
+                raise RuntimeError(f"{name} answered {response.status_code}: {response.get_data(as_text=True)}")
+
+    rss, peak_rss = memory_mb()
+    return {'import_seconds': import_seconds, 'rss_import_mb': rss_import, 'rss_mb': rss,
+            'peak_rss_mb': peak_rss, 'modules': len(sys.modules), 'pandas': 'pandas' in sys.modules}
+
+
+def run(name, export_path=None, repeat=5):
+    """Median measurements of `repeat` fresh processes running a scenario."""
+    env = dict(os.environ, BCRYPT_LOG_ROUNDS='4', ROW_INGEST='true' if name == 'upload_rows' else 'false')
+    command = [sys.executable, '-m', 'benchmarks.bench_startup', '--probe', name]
+    if export_path:
+        command += ['--export', export_path]
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    result = {key: round(statistics.median(run[key] for run in runs), 3 if key == 'import_seconds' else 1)
+              for key in ('import_seconds', 'rss_import_mb', 'rss_mb', 'peak_rss_mb', 'modules')}
+    result['pandas'] = any(run['pandas'] for run in runs)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_arguments(parser)
+    parser.set_defaults(days=3, workout_seconds=600)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help='Also write the results to this file')
+    parser.add_argument('--probe', choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument('--export', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        # The app logs to stderr; only the result goes to stdout
+        print(json.dumps(probe(args.probe, args.export)))
+        return
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        export_path = os.path.join(work_dir, 'export.json')
+        with open(export_path, 'w') as f:
+            json.dump(generate_export(**scenario(args)), f)
+        results = {name: run(name, export_path, args.repeat) for name in SCENARIOS}
+
+    print(f"{'scenario':<12} {'import s':>9} {'RSS import MB':>14} {'RSS MB':>8} {'peak RSS MB':>12} "
+          f"{'modules':>8} {'pandas':>7}")
+    for name, result in results.items():
+        print(f"{name:<12} {result['import_seconds']:>9} {result['rss_import_mb']:>14} {result['rss_mb']:>8} "
+              f"{result['peak_rss_mb']:>12} {result['modules']:>8} {str(result['pandas']):>7}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+A local stand-in for the Oracle pool, so ingest can be timed without a
+database: connections accept the calls the writers make, count the rows
+they are sent and optionally sleep to model a round trip. Queries other
+than those on users return no rows.
+
+StandInConnection also keeps the users table, in a SQLite file shared by
+every process of a server (see benchmarks.load_app), so users registered
+through one worker can authenticate against any other.
+"""
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+
+
+class FakeCursor:
+    description = None
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = 0
+
+    def setinputsizes(self, *types):
+        pass
+
+    def execute(self, sql, binds=None, **kwargs):
+        self.connection.round_trip()
+        # A merge from the stage "inserts" every staged row
+        self.rowcount = self.connection.staged if sql.lstrip().startswith(('MERGE', 'INSERT')) else 0
+        if sql.startswith('TRUNCATE'):
+            self.connection.staged = 0
+
+    def executemany(self, sql, rows, batcherrors=False):
+        self.connection.round_trip()
+        self.connection.rows += len(rows)
+        self.connection.staged += len(rows)
+        self.rowcount = len(rows)
+
+    def getbatcherrors(self):
+        return []
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return []
+
+    def __iter__(self):
+        return iter(())
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+
+    def __init__(self, latency=0.0):
+        """:param latency: seconds slept per execute/executemany/commit"""
+        self.latency = latency
+        self.rows = 0
+        self.staged = 0
+        self.round_trips = 0
+        self.commits = 0
+
+    def round_trip(self):
+        self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+        self.round_trip()
+
+    def rollback(self):
+        pass
+
+
+# Statements on the users table, and the Oracle bind placeholders in them
+_USERS_SQL = re.compile(r"\b(FROM|INTO|UPDATE)\s+users\b", re.IGNORECASE)
+_BIND = re.compile(r":\w+")
+
+USERS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        username TEXT UNIQUE,
+        password_hash TEXT,
+        api_key TEXT,
+        api_key_prefix TEXT,
+        api_key_hash TEXT UNIQUE,
+        email TEXT UNIQUE,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP)"""
+
+
+class StandInCursor(FakeCursor):
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self.result = None
+
+    def execute(self, sql, binds=None, **kwargs):
+        if not _USERS_SQL.search(sql):
+            self.result = None
+            return super().execute(sql, binds, **kwargs)
+        self.connection.round_trip()
+        # The users statements bind positionally, which SQLite takes as ?
+        self.result = self.connection.users.execute(_BIND.sub('?', sql), binds or kwargs or ())
+        self.rowcount = self.result.rowcount
+
+    def fetchone(self):
+        return self.result.fetchone() if self.result else None
+
+    def fetchall(self):
+        return self.result.fetchall() if self.result else []
+
+    def __iter__(self):
+        return iter(self.result) if self.result else iter(())
+
+
+class StandInConnection(FakeConnection):
+
+    def __init__(self, users_path, latency=0.0):
+        super().__init__(latency)
+        # Autocommit; concurrent writers from other workers wait for the file lock
+        self.users = sqlite3.connect(users_path, timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+
+    def cursor(self):
+        return StandInCursor(self)
+
+    def close(self):
+        self.users.close()
+
+
+def create_users_table(users_path):
+    with sqlite3.connect(users_path) as connection:
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(USERS_SCHEMA)
+    connection.close()
+
+
+def standin_db_connection(users_path, latency=0.0):
+    """A drop-in for db.db_connection handing out a new StandInConnection per call."""
+    @contextmanager
+    def db_connection():
+        connection = StandInConnection(users_path, latency)
+        try:
+            yield connection
+        finally:
+            connection.close()
+    return db_connection
+
+
+def fake_db_connection(connection):
+    """A drop-in for db.db_connection that always hands out `connection`."""
+    @contextmanager
+    def db_connection():
+        yield connection
+    return db_connection
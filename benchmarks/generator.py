@@ -0,0 +1,182 @@
+"""
+Generate synthetic Health Auto Export files shaped like the samples in
+zipped_json/: daily data.metrics series, and data.workouts with per-second
+stepCount, activeEnergy, walkingAndRunningDistance and route series.
+
+    python -m benchmarks.generator --users 3 --days 30 --workouts 1 --sps 1 --out /tmp/exports [--zip]
+
+Exports scale with users x days x workouts per day x samples per second of
+workout; the same seed gives the same files.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import uuid
+import zipfile
+
+# Daily metrics: (name, units, typical value, spread); one sample per day at midnight
+DAILY_METRICS = [
+    ('step_count', 'count', 7000, 3000),
+    ('active_energy', 'kJ', 1200, 500),
+    ('basal_energy_burned', 'kJ', 7900, 150),
+    ('walking_running_distance', 'km', 5, 2.5),
+    ('flights_climbed', 'count', 10, 6),
+    ('resting_heart_rate', 'count/min', 60, 5),
+    ('walking_heart_rate_average', 'count/min', 98, 8),
+    ('heart_rate_variability', 'ms', 45, 10),
+    ('respiratory_rate', 'count/min', 17, 2),
+    ('walking_speed', 'km/hr', 4.5, 0.4),
+    ('walking_step_length', 'cm', 71, 3),
+    ('time_in_daylight', 'min', 40, 25),
+]
+
+WORKOUT_NAMES = [('Outdoor Walk', 'Outdoor', 1.6), ('Outdoor Run', 'Outdoor', 2.7),
+                 ('Indoor Walk', 'Indoor', 1.5)]
+
+
+def _date(moment, offset):
+    return moment.strftime('%Y-%m-%d %H:%M:%S ') + offset
+
+
+def _offset(minutes):
+    sign = '+' if minutes >= 0 else '-'
+    return f"{sign}{abs(minutes) // 60:02d}{abs(minutes) % 60:02d}"
+
+
+def generate_workout(rng, start, duration, samples_per_second, offset, source):
+    """One workout of `duration` seconds with its per-second (scaled) sample series."""
+    name, location, steps_per_second = rng.choice(WORKOUT_NAMES)
+    interval = 1 / samples_per_second
+    count = max(1, int(duration * samples_per_second))
+    moments = [start + datetime.timedelta(seconds=i * interval) for i in range(count)]
+    lat, lon = -1.2786 + rng.uniform(-0.01, 0.01), 36.9647 + rng.uniform(-0.01, 0.01)
+
+    def series(units, mean, sample_source=source):
+        return [{'date': _date(moment, offset), 'qty': abs(rng.gauss(mean, mean / 4)) * interval,
+                 'units': units, 'source': sample_source} for moment in moments]
+
+    step_count = series('steps', steps_per_second)
+    energy = series('kcal', 0.12)
+    distance = series('km', steps_per_second * 0.0007)
+    route = [{'timestamp': _date(moment, offset), 'latitude': lat + i * 1e-6, 'longitude': lon + i * 1e-6,
+              'altitude': 1577 + rng.uniform(-2, 2), 'speed': rng.uniform(0.5, 3),
+              'course': rng.uniform(0, 360), 'horizontalAccuracy': rng.uniform(1, 5),
+              'verticalAccuracy': rng.uniform(1, 3), 'speedAccuracy': rng.uniform(0.2, 1),
+              'courseAccuracy': rng.uniform(10, 700)} for i, moment in enumerate(moments)]
+    heart_rate = [{'date': _date(moment, offset), 'Min': bpm, 'Avg': bpm, 'Max': bpm, 'units': 'bpm',
+                   'source': source}
+                  for moment, bpm in ((moments[i], rng.randint(90, 160)) for i in range(0, count, 5))]
+    end = start + datetime.timedelta(seconds=duration)
+    return {
+        'id': str(uuid.UUID(int=rng.getrandbits(128))),
+        'name': name,
+        'location': location,
+        'start': _date(start, offset),
+        'end': _date(end, offset),
+        'duration': float(duration),
+        'elevationUp': {'qty': rng.uniform(5, 40), 'units': 'm'},
+        'distance': {'qty': sum(sample['qty'] for sample in distance), 'units': 'km'},
+        'activeEnergyBurned': {'qty': sum(sample['qty'] for sample in energy) * 4.184, 'units': 'kJ'},
+        'intensity': {'qty': rng.uniform(3, 9), 'units': 'kcal/hr·kg'},
+        'humidity': {'qty': rng.randint(30, 90), 'units': '%'},
+        'temperature': {'qty': rng.uniform(12, 30), 'units': 'degC'},
+        'metadata': {},
+        'stepCount': step_count,
+        'activeEnergy': energy,
+        'walkingAndRunningDistance': distance,
+        'heartRateData': heart_rate,
+        'heartRateRecovery': [],
+        'route': route,
+    }
+
+
+def generate_export(days=30, workouts_per_day=1, samples_per_second=1.0, workout_seconds=1800,
+                    start=datetime.date(2024, 8, 27), utc_offset_minutes=120, seed=0, name='User'):
+    """A whole export covering `days` days from `start` as a dict."""
+    rng = random.Random(seed)
+    offset = _offset(utc_offset_minutes)
+    source = f"{name}’s Apple\xa0Watch"
+    days_list = [datetime.datetime.combine(start, datetime.time()) + datetime.timedelta(days=i)
+                 for i in range(days)]
+
+    metrics = [{'name': metric, 'units': units,
+                'data': [{'date': _date(day, offset), 'qty': max(0.0, rng.gauss(mean, spread)), 'source': ''}
+                         for day in days_list]}
+               for metric, units, mean, spread in DAILY_METRICS]
+    metrics.append({'name': 'heart_rate', 'units': 'count/min',
+                    'data': [{'date': _date(day, offset), 'Min': rng.randint(48, 60), 'Avg': rng.uniform(70, 90),
+                              'Max': rng.randint(120, 170), 'source': source} for day in days_list]})
+
+    workouts = []
+    for day in days_list:
+        for i in range(workouts_per_day):
+            begin = day + datetime.timedelta(hours=7 + 10 * i / max(workouts_per_day, 1),
+                                             minutes=rng.randint(0, 50), seconds=rng.randint(0, 59))
+            workouts.append(generate_workout(rng, begin, workout_seconds, samples_per_second, offset, source))
+
+    return {'data': {'metrics': metrics, 'workouts': workouts}}
+
+
+def generate_exports(users=1, seed=0, **kwargs):
+    """Yield (file name, export) for each synthetic user."""
+    start = kwargs.get('start', datetime.date(2024, 8, 27))
+    end = start + datetime.timedelta(days=kwargs.get('days', 30) - 1)
+    for user in range(users):
+        name = f"User{user + 1}"
+        yield (f"{name}-HealthAutoExport-{start}-{end}.json",
+               generate_export(seed=seed + user, name=name, **kwargs))
+
+
+def sample_counts(export):
+    """Rows an export turns into: (metric samples, workout stepCount samples)."""
+    data = export['data']
+    return (sum(len(metric['data']) for metric in data['metrics']),
+            sum(len(workout['stepCount']) for workout in data['workouts']))
+
+
+def write_exports(out_dir, users=1, as_zip=False, **kwargs):
+    """Write the exports (optionally each zipped like zipped_json/) and return their paths."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for file_name, export in generate_exports(users, **kwargs):
+        payload = json.dumps(export)
+        path = os.path.join(out_dir, file_name)
+        if as_zip:
+            path += '.zip'
+            with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+                zip_ref.writestr(file_name, payload)
+        else:
+            with open(path, 'w') as f:
+                f.write(payload)
+        paths.append(path)
+    return paths
+
+
+def add_arguments(parser):
+    parser.add_argument('--users', type=int, default=1)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--workouts', type=int, default=1, help='Workouts per day')
+    parser.add_argument('--sps', type=float, default=1.0, help='Workout samples per second')
+    parser.add_argument('--workout-seconds', type=int, default=1800)
+
+
+def scenario(args):
+    return {'days': args.days, 'workouts_per_day': args.workouts, 'samples_per_second': args.sps,
+            'workout_seconds': args.workout_seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--out', required=True)
+    parser.add_argument('--zip', action='store_true')
+    args = parser.parse_args()
+
+    for path in write_exports(args.out, args.users, args.zip, **scenario(args)):
+        print(f"{path} ({os.path.getsize(path):,} bytes)")
+
+
+if __name__ == '__main__':
+    main()
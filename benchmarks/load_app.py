@@ -0,0 +1,37 @@
+"""
+The Flask app with its Oracle pool replaced by the stand-in database of
+benchmarks.fake_db, for load tests (see benchmarks.load_test):
+
+    LOAD_TEST_USERS_DB=/tmp/users.sqlite3 gunicorn -w 2 benchmarks.load_app:app
+
+LOAD_TEST_USERS_DB is the SQLite file holding the users table (created if
+missing) and LOAD_TEST_DB_LATENCY_MS the simulated round trip per call.
+Run as a module it serves the app with the threaded Werkzeug server instead.
+"""
+import argparse
+import os
+import tempfile
+
+import app as app_module
+from benchmarks.fake_db import create_users_table, standin_db_connection
+
+USERS_DB = os.getenv('LOAD_TEST_USERS_DB', os.path.join(tempfile.gettempdir(), 'load_test_users.sqlite3'))
+DB_LATENCY = float(os.getenv('LOAD_TEST_DB_LATENCY_MS', 0)) / 1000
+
+create_users_table(USERS_DB)
+app_module.db_connection = standin_db_connection(USERS_DB, DB_LATENCY)
+app = app_module.app
+
+
+def main():
+    from werkzeug.serving import run_simple
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+    run_simple(args.host, args.port, app, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+"""
+Load test: register synthetic users through /api/v1/register, then replay
+ZIP and JSON uploads to /api/v1/upload at a fixed arrival rate against the
+app served by Gunicorn with the stand-in database (see benchmarks.load_app).
+
+    python -m benchmarks.load_test [--workers 2 --threads 4] [--users 20] [--rate 5 --duration 30]
+        [--zip-ratio 0.5] [--days 3 --workout-seconds 600] [--db-latency-ms 2] [--json report.json]
+
+Arrivals are open-loop (Poisson at --rate per second): each request is timed
+from its scheduled start, so a saturated server shows up as queueing latency
+instead of a lower send rate. Reports p50/p95/p99 latency, throughput and
+error rate per request kind, and the current and peak RSS of every worker.
+--server werkzeug serves the app in one threaded process where Gunicorn is
+not available; --url targets a server that is already running.
+"""
+import argparse
+import io
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.generator import add_arguments, generate_export, scenario
+
+PERCENTILES = (50, 95, 99)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, port, users_db, log):
+    env = dict(os.environ, LOAD_TEST_USERS_DB=users_db, LOAD_TEST_DB_LATENCY_MS=str(args.db_latency_ms))
+    if args.bcrypt_rounds:
+        env['BCRYPT_LOG_ROUNDS'] = str(args.bcrypt_rounds)
+    if args.server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '--workers', str(args.workers),
+                   '--threads', str(args.threads), '--bind', f"127.0.0.1:{port}",
+                   '--timeout', '300', 'benchmarks.load_app:app']
+    else:
+        command = [sys.executable, '-m', 'benchmarks.load_app', '--port', str(port)]
+    return subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_ready(url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            sys.exit(f"Server exited with status {process.returncode}")
+        try:
+            if send(url + '/api/v1/', timeout=2)[0] == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    sys.exit(f"Server not ready after {timeout} s")
+
+
+def send(url, body=None, headers=None, timeout=300):
+    """Make one request and return (status, response body)."""
+    request = urllib.request.Request(url, data=body, headers=headers or {},
+                                     method='POST' if body is not None else 'GET')
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def register(url, username, password):
+    """Register a user (retrying while the password pool is busy) and return its API key."""
+    body = json.dumps({'username': username, 'password': password,
+                       'email': f"{username}@example.com"}).encode('utf-8')
+    while True:
+        status, content = send(url + '/api/v1/register', body, {'Content-Type': 'application/json'})
+        if status != 503:
+            break
+        time.sleep(1)
+    if status != 201:
+        raise RuntimeError(f"Registering {username} failed with {status}: {content[:200]!r}")
+    return json.loads(content)['api_key']
+
+
+def multipart(filename, content):
+    boundary = uuid.uuid4().hex
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: application/octet-stream\r\n\r\n").encode('utf-8') + content + \
+        f"\r\n--{boundary}--\r\n".encode('utf-8')
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def build_payloads(args):
+    """{kind: (content type, multipart body)} for a JSON and a zipped export of the scenario."""
+    export = json.dumps(generate_export(**scenario(args))).encode('utf-8')
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        zip_ref.writestr('HealthAutoExport.json', export)
+
+    payloads = {}
+    for kind, filename, content in (('json', 'HealthAutoExport.json', export),
+                                    ('zip', 'HealthAutoExport.zip', archive.getvalue())):
+        body, content_type = multipart(filename, content)
+        payloads[kind] = (content_type, body)
+    return payloads
+
+
+def replay(url, api_keys, payloads, args):
+    """
+    Send uploads at Poisson arrivals for args.duration seconds.
+    :return: ([(kind, status, seconds)], elapsed seconds)
+    """
+    rng = random.Random(args.seed)
+    samples = []
+    lock = threading.Lock()
+    upload_url = url + '/api/v1/upload' + (f"?{args.query}" if args.query else '')
+
+    def upload(kind, api_key, scheduled):
+        content_type, body = payloads[kind]
+        try:
+            status, _ = send(upload_url, body, {'Content-Type': content_type,
+                                                'Authorization': f"Bearer {api_key}"})
+        except OSError:
+            status = None
+        with lock:
+            samples.append((kind, status, time.perf_counter() - scheduled))
+
+    started = time.perf_counter()
+    scheduled = started
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        for i in range(int(args.rate * args.duration)):
+            scheduled += rng.expovariate(args.rate)
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            kind = 'zip' if rng.random() < args.zip_ratio else 'json'
+            executor.submit(upload, kind, api_keys[i % len(api_keys)], scheduled)
+    return samples, time.perf_counter() - started
+
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of a sorted list."""
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples, elapsed):
+    """Latency percentiles (ms), throughput and error rate, per kind and overall."""
+    kinds = sorted({kind for kind, _, _ in samples})
+    summary = {}
+    for kind in kinds + ['all']:
+        selected = [(status, seconds) for k, status, seconds in samples if kind in ('all', k)]
+        latencies = sorted(seconds * 1000 for _, seconds in selected)
+        errors = sum(1 for status, _ in selected if status is None or status >= 400)
+        summary[kind] = {
+            'requests': len(selected),
+            'throughput_rps': round(len(selected) / elapsed, 2),
+            'error_rate': round(errors / len(selected), 4),
+            **{f"p{q}_ms": round(percentile(latencies, q), 1) for q in PERCENTILES},
+        }
+    return summary
+
+
+def worker_pids(pid):
+    """The child processes of `pid` (Gunicorn workers), or `pid` itself when it has none."""
+    children = []
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # The parent pid is the second field after the parenthesised name
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        children.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    return sorted(children) or [pid]
+
+
+def worker_memory(pid):
+    """{worker pid: {'rss_mb', 'peak_rss_mb'}} from /proc (Linux only)."""
+    memory = {}
+    for worker in worker_pids(pid):
+        try:
+            with open(f"/proc/{worker}/status") as f:
+                fields = dict(line.split(':', 1) for line in f if ':' in line)
+        except OSError:
+            continue
+        memory[worker] = {'rss_mb': round(int(fields['VmRSS'].split()[0]) / 1024, 1),
+                          'peak_rss_mb': round(int(fields['VmHWM'].split()[0]) / 1024, 1)}
+    return memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    add_arguments(parser)
+    parser.set_defaults(days=3, workout_seconds=600)
+    parser.add_argument('--url', help='Target a running server instead of starting one')
+    parser.add_argument('--server-pid', type=int, help='Pid of the --url server, for worker memory')
+    parser.add_argument('--server', choices=('gunicorn', 'werkzeug'), default='gunicorn')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--db-latency-ms', type=float, default=2.0,
+                        help='Simulated round-trip time of the stand-in database')
+    parser.add_argument('--bcrypt-rounds', type=int, help='BCRYPT_LOG_ROUNDS of the started server')
+    parser.add_argument('--rate', type=float, default=5.0, help='Uploads per second')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds of uploads')
+    parser.add_argument('--zip-ratio', type=float, default=0.5, help='Share of uploads sent as ZIP')
+    parser.add_argument('--concurrency', type=int, default=64, help='Client connections at most')
+    parser.add_argument('--query', default='', help="Upload query string, e.g. 'load=bulk'")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='Also write the report to this file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        process = None
+        url = (args.url or '').rstrip('/')
+        if not url:
+            port = free_port()
+            url = f"http://127.0.0.1:{port}"
+            log_path = os.path.join(work_dir, 'server.log')
+            log = open(log_path, 'wb')
+            process = start_server(args, port, os.path.join(work_dir, 'users.sqlite3'), log)
+        try:
+            wait_ready(url, process)
+
+            run_id = uuid.uuid4().hex[:8]
+            started = time.perf_counter()
+            with ThreadPoolExecutor(min(args.concurrency, args.users)) as executor:
+                api_keys = list(executor.map(lambda i: register(url, f"load_{run_id}_{i}", 'load-test-password'),
+                                             range(args.users)))
+            print(f"Registered {args.users} users in {time.perf_counter() - started:.1f} s")
+
+            payloads = build_payloads(args)
+            print(f"Replaying uploads of {len(payloads['json'][1]):,} (JSON) and "
+                  f"{len(payloads['zip'][1]):,} (ZIP) bytes at {args.rate}/s for {args.duration} s")
+            samples, elapsed = replay(url, api_keys, payloads, args)
+
+            pid = process.pid if process is not None else args.server_pid
+            memory = worker_memory(pid) if pid and os.path.isdir('/proc') else {}
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+                log.close()
+
+    summary = summarize(samples, elapsed)
+    print(f"{'kind':<6} {'requests':>9} {'req/s':>8} {'errors':>8} "
+          + ' '.join(f"{f'p{q} ms':>9}" for q in PERCENTILES))
+    for kind, stats in summary.items():
+        print(f"{kind:<6} {stats['requests']:>9} {stats['throughput_rps']:>8} {stats['error_rate']:>8.2%} "
+              + ' '.join(f"{stats[f'p{q}_ms']:>9}" for q in PERCENTILES))
+    for worker, stats in memory.items():
+        print(f"worker {worker}: RSS {stats['rss_mb']} MB, peak {stats['peak_rss_mb']} MB")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'scenario': dict(scenario(args), users=args.users, rate=args.rate,
+                                        duration=args.duration, zip_ratio=args.zip_ratio,
+                                        server=args.server if args.url is None else args.url,
+                                        workers=args.workers, threads=args.threads,
+                                        db_latency_ms=args.db_latency_ms),
+                       'summary': summary, 'workers': memory}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
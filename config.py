@@ -5,4 +5,129 @@ class Config:
     ORACLE_USER = 'dwh_db'
     ORACLE_PASSWORD = 'welcome1234_'
     ORACLE_HOST = '193.122.85.185'
-    ORACLE_SERVICE_NAME = 'FREEPDB1'
\ No newline at end of file
+    ORACLE_SERVICE_NAME = 'FREEPDB1'
+
+    # Oracle session pool sizing (per Gunicorn worker process)
+    ORACLE_POOL_MIN = int(os.getenv('ORACLE_POOL_MIN', 1))
+    ORACLE_POOL_MAX = int(os.getenv('ORACLE_POOL_MAX', 4))
+    ORACLE_POOL_INCREMENT = int(os.getenv('ORACLE_POOL_INCREMENT', 1))
+    ORACLE_POOL_WAIT_TIMEOUT_MS = int(os.getenv('ORACLE_POOL_WAIT_TIMEOUT_MS', 5000))
+    ORACLE_POOL_PING_INTERVAL = int(os.getenv('ORACLE_POOL_PING_INTERVAL', 0))  # 0 pings on every acquire
+
+    # In-process API key lookup cache. A rotated key is refused at once by every worker sharing
+    # AUTH_REVOCATION_FILE (the workers of one host); servers on other hosts keep accepting it
+    # for up to AUTH_CACHE_TTL seconds. Set the file to '' to only invalidate the local worker.
+    AUTH_CACHE_SIZE = int(os.getenv('AUTH_CACHE_SIZE', 4096))
+    AUTH_CACHE_TTL = int(os.getenv('AUTH_CACHE_TTL', 300))  # seconds, known keys
+    AUTH_CACHE_NEGATIVE_TTL = int(os.getenv('AUTH_CACHE_NEGATIVE_TTL', 30))  # seconds, unknown keys
+    AUTH_REVOCATION_FILE = os.getenv('AUTH_REVOCATION_FILE', os.path.join(UPLOAD_FOLDER, 'auth_revocations'))
+
+    # bcrypt cost factor (also read by Flask-Bcrypt) and the pool hashing and checking passwords:
+    # at most PASSWORD_HASH_MAX_PENDING operations wait for the PASSWORD_HASH_WORKERS threads,
+    # further logins and registrations get a 503 with Retry-After
+    BCRYPT_LOG_ROUNDS = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', 32))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))  # seconds
+
+    # Parse uploads incrementally and save them in batches of STREAM_BATCH_SIZE rows
+    STREAMING_PARSE = os.getenv('STREAMING_PARSE', 'false').lower() == 'true'
+    STREAM_BATCH_SIZE = int(os.getenv('STREAM_BATCH_SIZE', 5000))
+
+    # Limits applied to uploaded ZIP archives (zip bomb protection)
+    MAX_ZIP_MEMBERS = int(os.getenv('MAX_ZIP_MEMBERS', 100))
+    MAX_ZIP_UNCOMPRESSED_BYTES = int(os.getenv('MAX_ZIP_UNCOMPRESSED_BYTES', 512 * 1024 * 1024))
+
+    # Largest decoded body accepted by POST /api/v1/push (gzip / zstd bomb protection), and the
+    # largest body as sent (before decoding its Content-Encoding)
+    PUSH_MAX_BYTES = int(os.getenv('PUSH_MAX_BYTES', 512 * 1024 * 1024))
+    PUSH_MAX_BODY_BYTES = int(os.getenv('PUSH_MAX_BODY_BYTES', 512 * 1024 * 1024))
+
+    # Upload ingest: 'sync' saves during the request, 'async' queues a job and returns 202.
+    # Can be overridden per request with ?mode=sync|async
+    INGEST_MODE = os.getenv('INGEST_MODE', 'sync')
+    JOB_DB_PATH = os.getenv('JOB_DB_PATH', os.path.join(UPLOAD_FOLDER, 'jobs.sqlite3'))
+    JOB_SPOOL_DIR = os.getenv('JOB_SPOOL_DIR', os.path.join(UPLOAD_FOLDER, 'jobs'))
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))  # background workers per process
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+
+    # health_data writer: rows per executemany batch, and commit after every N batches (0 = once per upload)
+    WRITE_BATCH_SIZE = int(os.getenv('WRITE_BATCH_SIZE', 5000))
+    WRITE_COMMIT_EVERY = int(os.getenv('WRITE_COMMIT_EVERY', 1))
+
+    # Bulk load through the health_data_stage table: 'auto' picks it for a whole upload, before its
+    # first batch, when the upload's uncompressed size reaches BULK_LOAD_THRESHOLD_BYTES (a frame
+    # saved on its own with 'auto' uses BULK_LOAD_THRESHOLD rows); 'rows'/'bulk' force a path
+    # (override per upload with ?load=)
+    LOAD_MODE = os.getenv('LOAD_MODE', 'auto')
+    BULK_LOAD_THRESHOLD = int(os.getenv('BULK_LOAD_THRESHOLD', 50000))
+    BULK_LOAD_THRESHOLD_BYTES = int(os.getenv('BULK_LOAD_THRESHOLD_BYTES', 5 * 1024 * 1024))
+    BULK_LOAD_STRATEGY = os.getenv('BULK_LOAD_STRATEGY', 'merge')  # 'merge' or 'append' (direct path)
+
+    # Skip exports already ingested and samples at or before each series' stored watermark
+    # (override per upload with ?incremental=false, e.g. to backfill older data)
+    INCREMENTAL_INGEST = os.getenv('INCREMENTAL_INGEST', 'true').lower() == 'true'
+
+    # Parse the members of multi-file uploads on a pool of PARSE_WORKERS processes ('process')
+    # or threads ('thread'); 0 parses them one after another. Not used with STREAMING_PARSE.
+    PARSE_WORKERS = int(os.getenv('PARSE_WORKERS', 0))
+    PARSE_EXECUTOR = os.getenv('PARSE_EXECUTOR', 'process')
+
+    # Ingest-time rollup of workout stepCount series into buckets: 'raw' (off), '10s', '1min', '5min', ...
+    # Metrics are only rolled up when listed, e.g. DOWNSAMPLE_OVERRIDES='step_count=1min,workout=10s'
+    DOWNSAMPLE_RESOLUTION = os.getenv('DOWNSAMPLE_RESOLUTION', 'raw')
+    DOWNSAMPLE_OVERRIDES = os.getenv('DOWNSAMPLE_OVERRIDES', '')
+
+    # Store workouts as sessions plus narrow sample tables (migrations/005) instead of health_data rows
+    WORKOUT_TABLES = os.getenv('WORKOUT_TABLES', 'false').lower() == 'true'
+
+    # Parse sample dates once at ingest and bind them as UTC TIMESTAMPs (recorded_at) with the
+    # original offset (utc_offset_minutes); needs migrations/006. The read API only serves rows
+    # with recorded_at, so it needs this on
+    NATIVE_TIMESTAMPS = os.getenv('NATIVE_TIMESTAMPS', 'false').lower() == 'true'
+
+    # Maintain daily per-user, per-metric aggregates in summary_metrics (migrations/007) as
+    # batches are saved; rebuild existing data with `flask --app app backfill-summary`
+    SUMMARY_METRICS = os.getenv('SUMMARY_METRICS', 'false').lower() == 'true'
+
+    # Points and workout streaks kept in user_points (migrations/008) as uploads are saved, ranked in
+    # memory for GET /api/v1/leaderboard (reloaded every LEADERBOARD_CACHE_TTL seconds). Batches a
+    # bulk merge deduplicated rescore the user from summary_metrics, so they need SUMMARY_METRICS to count
+    LEADERBOARD = os.getenv('LEADERBOARD', 'false').lower() == 'true'
+    POINTS_PER_1000_STEPS = float(os.getenv('POINTS_PER_1000_STEPS', 1))
+    POINTS_PER_WORKOUT_DAY = float(os.getenv('POINTS_PER_WORKOUT_DAY', 10))
+    POINTS_PER_STREAK_DAY = float(os.getenv('POINTS_PER_STREAK_DAY', 5))
+    LEADERBOARD_CACHE_TTL = int(os.getenv('LEADERBOARD_CACHE_TTL', 60))
+    LEADERBOARD_SIZE = int(os.getenv('LEADERBOARD_SIZE', 10))
+    LEADERBOARD_MAX_SIZE = int(os.getenv('LEADERBOARD_MAX_SIZE', 100))
+
+    # Hand uploads to executemany as plain row tuples, without building DataFrames (pandas is then
+    # not loaded), when downsampling, WORKOUT_TABLES, NATIVE_TIMESTAMPS, SUMMARY_METRICS and
+    # LEADERBOARD are all off; otherwise uploads take the DataFrame path
+    ROW_INGEST = os.getenv('ROW_INGEST', 'false').lower() == 'true'
+
+    # ASGI serving (asgi.py): threads parsing pushed exports and serving the Flask routes, the
+    # size above which a request body for a Flask route is spooled to a temporary file, and the
+    # received chunks of a push body held ahead of the thread parsing it
+    ASGI_THREADS = int(os.getenv('ASGI_THREADS', 8))
+    ASGI_SPOOL_BYTES = int(os.getenv('ASGI_SPOOL_BYTES', 1024 * 1024))
+    ASGI_PUSH_CHUNKS = int(os.getenv('ASGI_PUSH_CHUNKS', 16))
+
+    # Read API (GET /api/v1/metrics, /api/v1/workouts): rows per page, and rows per fetch round trip
+    READ_PAGE_SIZE = int(os.getenv('READ_PAGE_SIZE', 1000))
+    READ_MAX_PAGE_SIZE = int(os.getenv('READ_MAX_PAGE_SIZE', 10000))
+    READ_ARRAYSIZE = int(os.getenv('READ_ARRAYSIZE', 500))
+
+    # Prometheus-format GET /metrics. Set METRICS_DIR to a directory (emptied before each server
+    # start) shared by all Gunicorn workers so any worker reports the totals of every process;
+    # with METRICS_TOKEN set, scrapes must send it as a Bearer token
+    METRICS_DIR = os.getenv('METRICS_DIR')
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+    # Opt-in cProfile of uploads, written to PROFILE_DIR: a PROFILE_SAMPLE_RATE share (0-1) of
+    # them, and those sent with an `X-Profile: true` header by one of PROFILE_ADMIN_USERS (user ids)
+    PROFILE_DIR = os.getenv('PROFILE_DIR')
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+    PROFILE_ADMIN_USERS = [int(user_id) for user_id in os.getenv('PROFILE_ADMIN_USERS', '').split(',')
+                           if user_id.strip()]
+    PROFILE_TOP = int(os.getenv('PROFILE_TOP', 30))
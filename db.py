@@ -0,0 +1,210 @@
+import logging
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from metrics import DB_SECONDS
+
+# Settings used to build the pool, populated by configure() from the Flask config
+_settings = {}
+
+# The pool is created lazily, per process, so that Gunicorn workers never share
+# sockets inherited from the master across a fork.
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+# Pool of the asyncio API, used by the ASGI entry point (asgi.py), also per process
+_async_pool = None
+_async_pool_pid = None
+
+# Acquire statistics for the current process
+_stats_lock = threading.Lock()
+_stats = {
+    'acquires': 0,
+    'acquire_errors': 0,
+    'wait_seconds_total': 0.0,
+    'wait_seconds_max': 0.0,
+}
+
+
+def configure(config):
+    """
+    Store the pool sizing from a Flask config (or any mapping).
+    Credentials are read from the environment when the pool is created,
+    which only happens on first use.
+    """
+    _settings.update({
+        'min': config.get('ORACLE_POOL_MIN', 1),
+        'max': config.get('ORACLE_POOL_MAX', 4),
+        'increment': config.get('ORACLE_POOL_INCREMENT', 1),
+        'wait_timeout': config.get('ORACLE_POOL_WAIT_TIMEOUT_MS', 5000),
+        'ping_interval': config.get('ORACLE_POOL_PING_INTERVAL', 0),
+    })
+
+
+def _pool_params():
+    # oracledb is imported with the first pool, not when the app loads
+    import oracledb
+
+    return dict(
+        user=os.getenv('ORACLE_USER'),
+        password=os.getenv('ORACLE_PASSWORD'),
+        service_name=os.getenv('ORACLE_SERVICE_NAME'),
+        port=1521,
+        host=os.getenv('ORACLE_HOST'),
+        min=_settings['min'],
+        max=_settings['max'],
+        increment=_settings['increment'],
+        getmode=oracledb.POOL_GETMODE_TIMEDWAIT,
+        wait_timeout=_settings['wait_timeout'],
+        # A ping interval of 0 checks every session as it is handed out
+        ping_interval=_settings['ping_interval'],
+    )
+
+
+def _create_pool():
+    logging.info(f"Creating Oracle session pool in process {os.getpid()} "
+                 f"(min={_settings['min']}, max={_settings['max']}, "
+                 f"increment={_settings['increment']})")
+    import oracledb
+
+    return oracledb.create_pool(**_pool_params())
+
+
+def get_pool():
+    """
+    Return the session pool for the current process, creating it on first use.
+    A pool inherited from a parent process (e.g. the Gunicorn master) is ignored
+    and a fresh one is created for the worker.
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is not None and _pool_pid == pid:
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != pid:
+            _pool = _create_pool()
+            _pool_pid = pid
+    return _pool
+
+
+def close_pool():
+    """Close the pool of the current process, if one was created."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            try:
+                _pool.close(force=True)
+            except Exception as e:
+                logging.error(f"Error closing Oracle session pool: {e}")
+        _pool = None
+        _pool_pid = None
+
+
+@contextmanager
+def db_connection():
+    """
+    Acquire a pooled connection and release it back to the pool on exit.
+    Any uncommitted work is rolled back by the pool on release.
+    """
+    pool = get_pool()
+    started = time.perf_counter()
+    try:
+        connection = pool.acquire()
+    except Exception as e:
+        with _stats_lock:
+            _stats['acquire_errors'] += 1
+        logging.error(f"Error acquiring Oracle connection: {e}")
+        raise
+    waited = time.perf_counter() - started
+    with _stats_lock:
+        _stats['acquires'] += 1
+        _stats['wait_seconds_total'] += waited
+        _stats['wait_seconds_max'] = max(_stats['wait_seconds_max'], waited)
+    DB_SECONDS.observe(waited, operation='acquire')
+
+    try:
+        yield connection
+    finally:
+        try:
+            pool.release(connection)
+        except Exception as e:
+            logging.error(f"Error releasing Oracle connection: {e}")
+
+
+def get_async_pool():
+    """
+    Return the asyncio session pool of the current process, creating it on
+    first use. Only called from the event loop thread, so no lock is needed.
+    """
+    global _async_pool, _async_pool_pid
+    if _async_pool is None or _async_pool_pid != os.getpid():
+        logging.info(f"Creating Oracle asyncio session pool in process {os.getpid()} "
+                     f"(min={_settings['min']}, max={_settings['max']})")
+        import oracledb
+
+        _async_pool = oracledb.create_pool_async(**_pool_params())
+        _async_pool_pid = os.getpid()
+    return _async_pool
+
+
+async def close_async_pool():
+    global _async_pool, _async_pool_pid
+    if _async_pool is not None and _async_pool_pid == os.getpid():
+        try:
+            await _async_pool.close(force=True)
+        except Exception as e:
+            logging.error(f"Error closing Oracle asyncio session pool: {e}")
+    _async_pool = None
+    _async_pool_pid = None
+
+
+@asynccontextmanager
+async def async_db_connection():
+    """db_connection for coroutines: the acquire and every call on the connection are awaited."""
+    pool = get_async_pool()
+    started = time.perf_counter()
+    try:
+        connection = await pool.acquire()
+    except Exception as e:
+        with _stats_lock:
+            _stats['acquire_errors'] += 1
+        logging.error(f"Error acquiring Oracle connection: {e}")
+        raise
+    waited = time.perf_counter() - started
+    with _stats_lock:
+        _stats['acquires'] += 1
+        _stats['wait_seconds_total'] += waited
+        _stats['wait_seconds_max'] = max(_stats['wait_seconds_max'], waited)
+    DB_SECONDS.observe(waited, operation='acquire')
+
+    try:
+        yield connection
+    finally:
+        try:
+            await pool.release(connection)
+        except Exception as e:
+            logging.error(f"Error releasing Oracle connection: {e}")
+
+
+def pool_stats():
+    """
+    Return occupancy and acquire wait statistics for the current process.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    acquires = stats['acquires']
+    stats['wait_seconds_avg'] = (stats['wait_seconds_total'] / acquires
+                                 if acquires else 0.0)
+    stats['pid'] = os.getpid()
+
+    pool = _pool if _pool_pid == os.getpid() else None
+    if pool is None:
+        stats.update({'created': False, 'opened': 0, 'busy': 0,
+                      'min': _settings.get('min'), 'max': _settings.get('max')})
+    else:
+        stats.update({'created': True, 'opened': pool.opened, 'busy': pool.busy,
+                      'min': pool.min, 'max': pool.max})
+    return stats
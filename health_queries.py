@@ -0,0 +1,214 @@
+import base64
+import datetime
+import json
+
+# Oracle TRUNC formats of the supported buckets (weeks start on Monday)
+BUCKETS = {'hour': 'HH', 'day': 'DD', 'week': 'IW'}
+
+EXPORT_DATE_MASK = 'YYYY-MM-DD HH24:MI:SS TZHTZM'
+
+# recorded_date of the narrow workout tables parsed in SQL; NULL when it isn't in the export
+# format. Indexed by migrations/009, so the expression must stay exactly as it is there.
+_PARSED_DATE = f"TO_TIMESTAMP_TZ(recorded_date DEFAULT NULL ON CONVERSION ERROR, '{EXPORT_DATE_MASK}')"
+
+# Where each read endpoint finds its samples. `time` is the UTC sample time, which pages are
+# ranged, ordered and keyed on through an index leading with the user column, and `local_time`
+# the wall-clock time it was recorded at (used for tz=local buckets). health_data is read by
+# recorded_at: rows without one (not backfilled by migrations/006, or ingested without
+# NATIVE_TIMESTAMPS) are not served.
+SERIES = {
+    'metrics': {
+        'table': 'health_data',
+        'user': 'health_data_user',
+        'where': "type = 'metric'",
+        'name': 'metric_name',
+        'value': 'value',
+        'units': 'units',
+        'time': 'recorded_at',
+        'local_time': "recorded_at + NUMTODSINTERVAL(NVL(utc_offset_minutes, 0), 'MINUTE')",
+        'columns': ['source'],
+    },
+    'workouts': {
+        'table': 'health_data',
+        'user': 'health_data_user',
+        'where': "type = 'workout'",
+        'name': 'location',
+        'value': 'workout_qty',
+        'units': 'workout_units',
+        'time': 'recorded_at',
+        'local_time': "recorded_at + NUMTODSINTERVAL(NVL(utc_offset_minutes, 0), 'MINUTE')",
+        'columns': ['source', 'elevation_qty', 'elevation_units'],
+    },
+    # Workout samples in the narrow tables (WORKOUT_TABLES); dates there are export text
+    'workout_samples': {
+        'table': 'workout_quantity_samples',
+        'user': 'user_id',
+        'where': None,
+        'name': 'series',
+        'value': 'qty',
+        'units': 'units',
+        'time': f"SYS_EXTRACT_UTC({_PARSED_DATE})",
+        'local_time': f"CAST({_PARSED_DATE} AS TIMESTAMP)",
+        'columns': ['workout_id', 'source'],
+    },
+}
+
+
+class QueryError(ValueError):
+    """Raised for invalid read API parameters."""
+
+
+def parse_time(value, field):
+    """Parse an ISO 8601 time to a naive UTC datetime; times without an offset are UTC."""
+    if value is None:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise QueryError(f"{field} must be an ISO 8601 time")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def encode_cursor(time, key):
+    """Opaque keyset cursor for the last row of a page: its time (or None) and tie-breaker."""
+    raw = json.dumps([time.isoformat() if time is not None else None, key]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        time, key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return (datetime.datetime.fromisoformat(time) if time is not None else None), key
+    except (ValueError, TypeError):
+        raise QueryError("Invalid cursor")
+
+
+def build_query(series, user_id, name=None, start=None, end=None, bucket=None,
+                local=False, after=None, limit=1000):
+    """
+    Build the SELECT of one page.
+
+    Raw pages are ordered by (time, ROWID); bucketed pages by (bucket, name)
+    with sum/avg/min/max/count computed in the database. `after` is the
+    decoded cursor of the previous page; the next page starts strictly after
+    it, so no OFFSET scan is needed.
+    :return: (sql, binds)
+    """
+    spec = SERIES[series]
+    binds = {'user_id': user_id, 'limit': limit}
+    # Rows without a time can't be placed in the time order, nor paged past with a cursor
+    where = [f"{spec['user']} = :user_id", f"{spec['time']} IS NOT NULL"]
+    if spec['where']:
+        where.append(spec['where'])
+    if name is not None:
+        where.append(f"{spec['name']} = :name")
+        binds['name'] = name
+    if start is not None:
+        where.append(f"{spec['time']} >= :start_time")
+        binds['start_time'] = start
+    if end is not None:
+        where.append(f"{spec['time']} < :end_time")
+        binds['end_time'] = end
+
+    if bucket is None:
+        if after is not None:
+            where.append(f"({spec['time']} > :after_time OR "
+                         f"({spec['time']} = :after_time AND ROWID > CHARTOROWID(:after_key)))")
+            binds.update(after_time=after[0], after_key=after[1])
+        columns = ', '.join(spec['columns'])
+        sql = (f"SELECT {spec['time']} AS sample_time, ROWIDTOCHAR(ROWID) AS row_key, "
+               f"{spec['name']} AS name, {spec['value']} AS value, {spec['units']} AS units, {columns}"
+               + (", utc_offset_minutes" if spec['table'] == 'health_data' else "") +
+               f"\n  FROM {spec['table']}\n WHERE {' AND '.join(where)}\n"
+               f" ORDER BY {spec['time']}, ROWID\n FETCH FIRST :limit ROWS ONLY")
+        return sql, binds
+
+    if bucket not in BUCKETS:
+        raise QueryError(f"bucket must be one of {', '.join(BUCKETS)}")
+    bucket_expr = f"TRUNC({spec['local_time'] if local else spec['time']}, '{BUCKETS[bucket]}')"
+    outer = ""
+    if after is not None:
+        # The cursor is a bucket boundary, so earlier samples are skipped by the range
+        # scan (TRUNC(t) >= b when t >= b); the tie is settled on the name
+        where.append(f"{spec['local_time'] if local else spec['time']} >= :after_time")
+        outer = "\n WHERE bucket > :after_time OR (bucket = :after_time AND name > :after_key)"
+        binds.update(after_time=after[0], after_key=after[1])
+    # Names are keyset columns, so a missing one (e.g. a workout without location) gets a value
+    name_expr = f"NVL({spec['name']}, 'unknown')"
+    sql = (f"SELECT * FROM (\n"
+           f"SELECT {bucket_expr} AS bucket, {name_expr} AS name, MAX({spec['units']}) AS units,\n"
+           f"       SUM({spec['value']}) AS value_sum, AVG({spec['value']}) AS value_avg,\n"
+           f"       MIN({spec['value']}) AS value_min, MAX({spec['value']}) AS value_max,\n"
+           f"       COUNT(*) AS samples\n"
+           f"  FROM {spec['table']}\n WHERE {' AND '.join(where)}\n"
+           f" GROUP BY {bucket_expr}, {name_expr}){outer}\n"
+           f" ORDER BY bucket, name\n FETCH FIRST :limit ROWS ONLY")
+    return sql, binds
+
+
+class Page:
+    """
+    One page of a read: its query, and the NDJSON lines of its rows. The last
+    line holds the cursor of the next page, or null once a page is short.
+    """
+
+    def __init__(self, sql, binds, bucket, local, limit):
+        self.sql = sql
+        self.binds = binds
+        self.bucket = bucket
+        self.local = local
+        self.limit = limit
+        self.last = None
+        self.count = 0
+
+    def line(self, row):
+        row_key = row.pop('row_key', None)
+        self.last = (row['bucket'], row['name']) if self.bucket else (row['sample_time'], row_key)
+        self.count += 1
+        return row_json(row, utc=not (self.bucket and self.local)) + '\n'
+
+    def last_line(self):
+        # A page ending on a row without a time (not selected by build_query) ends the read
+        full = self.count == self.limit and self.last[0] is not None
+        cursor = encode_cursor(*self.last) if full else None
+        return json.dumps({'next_cursor': cursor}) + '\n'
+
+
+def iter_rows(connection, sql, binds, arraysize=1000):
+    """
+    Execute a page query and yield each row as a dict. Rows are fetched
+    `arraysize` at a time, the first batch with the execute round trip.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.arraysize = arraysize
+        cursor.prefetchrows = arraysize + 1
+        cursor.execute(sql, binds)
+        names = [column[0].lower() for column in cursor.description]
+        for row in cursor:
+            yield dict(zip(names, row))
+    finally:
+        cursor.close()
+
+
+async def iter_rows_async(connection, sql, binds, arraysize=1000):
+    """iter_rows for a connection of the asyncio pool (see db.async_db_connection)."""
+    cursor = connection.cursor()
+    try:
+        cursor.arraysize = arraysize
+        cursor.prefetchrows = arraysize + 1
+        await cursor.execute(sql, binds)
+        names = [column[0].lower() for column in cursor.description]
+        async for row in cursor:
+            yield dict(zip(names, row))
+    finally:
+        cursor.close()
+
+
+def row_json(row, utc=True):
+    """Serialise a result row as ISO 8601 times, marked UTC unless they are local buckets."""
+    suffix = 'Z' if utc else ''
+    return json.dumps({key: value.isoformat() + suffix if isinstance(value, datetime.datetime) else value
+                       for key, value in row.items()})
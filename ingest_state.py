@@ -0,0 +1,68 @@
+import datetime
+import logging
+
+from processor.incremental import IngestFilter
+
+_MERGE_WATERMARK = """
+    MERGE INTO ingest_watermarks w
+    USING (SELECT :user_id AS user_id, :series AS series, :high_water AS high_water FROM dual) s
+    ON (w.user_id = s.user_id AND w.series = s.series)
+    WHEN MATCHED THEN UPDATE
+        SET w.high_water = GREATEST(w.high_water, s.high_water), w.updated_at = SYSTIMESTAMP
+    WHEN NOT MATCHED THEN INSERT (user_id, series, high_water)
+        VALUES (s.user_id, s.series, s.high_water)"""
+
+_INSERT_FILE = """
+    INSERT INTO ingest_files (user_id, content_hash, filename)
+    VALUES (:user_id, :content_hash, :filename)"""
+
+
+def load_ingest_filter(connection, user_id):
+    """Build an IngestFilter from the stored file digests and watermarks of a user."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT content_hash FROM ingest_files WHERE user_id = :user_id",
+                       user_id=user_id)
+        seen_files = [row[0] for row in cursor]
+        cursor.execute("SELECT series, high_water FROM ingest_watermarks WHERE user_id = :user_id",
+                       user_id=user_id)
+        # high_water is stored as a UTC TIMESTAMP
+        watermarks = {series: high_water.replace(tzinfo=datetime.timezone.utc) for series, high_water in cursor}
+    finally:
+        cursor.close()
+    return IngestFilter(seen_files, watermarks)
+
+
+def save_ingest_filter(connection, user_id, ingest_filter):
+    """
+    Record the files accepted and the watermarks advanced by an upload, after
+    its rows were saved. Watermarks only move forward; a file recorded
+    concurrently by another upload is ignored.
+    """
+    watermarks = [{'user_id': user_id, 'series': series,
+                   'high_water': _utc_naive(newest)}
+                  for series, newest in ingest_filter.advanced_watermarks().items()]
+    files = [{'user_id': user_id, 'content_hash': digest, 'filename': name and name[:255]}
+             for digest, name in ingest_filter.new_files]
+    if not watermarks and not files:
+        return
+
+    cursor = connection.cursor()
+    try:
+        if watermarks:
+            cursor.executemany(_MERGE_WATERMARK, watermarks)
+        if files:
+            cursor.executemany(_INSERT_FILE, files, batcherrors=True)
+            for error in cursor.getbatcherrors():
+                if not error.message.startswith('ORA-00001'):
+                    logging.error(f"Error recording ingested file: {error.message}")
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+def _utc_naive(time):
+    # A plain datetime (not a pandas Timestamp, which the filter of a DataFrame ingest produces)
+    time = time.astimezone(datetime.timezone.utc)
+    return datetime.datetime(time.year, time.month, time.day, time.hour, time.minute, time.second,
+                             time.microsecond)
@@ -0,0 +1,298 @@
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id           TEXT PRIMARY KEY,
+        user_id      INTEGER NOT NULL,
+        kind         TEXT NOT NULL,
+        filename     TEXT,
+        payload_path TEXT NOT NULL,
+        state        TEXT NOT NULL,
+        attempts     INTEGER NOT NULL DEFAULT 0,
+        worker_pid   INTEGER,
+        worker_token TEXT,
+        created_at   REAL NOT NULL,
+        started_at   REAL,
+        finished_at  REAL,
+        rows         INTEGER,
+        batches      INTEGER,
+        error        TEXT,
+        options      TEXT
+    );
+    CREATE INDEX IF NOT EXISTS jobs_state_created ON jobs (state, created_at);
+"""
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _process_token(pid):
+    """
+    Identity of a process that a later process reusing its PID doesn't share:
+    the kernel boot id and the process start time, or None where /proc is
+    not available.
+    """
+    try:
+        with open('/proc/sys/kernel/random/boot_id') as f:
+            boot_id = f.read().strip()
+        with open(f'/proc/{pid}/stat') as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # starttime is the 22nd field; the command name before it may contain spaces
+    return f"{boot_id}:{stat.rsplit(')', 1)[1].split()[19]}"
+
+
+def _worker_alive(pid, token):
+    """Whether the process that claimed a job (its PID and _process_token) still runs."""
+    if pid is None or not _pid_alive(pid):
+        return False
+    if token is None:
+        return True
+    current = _process_token(pid)
+    return current is None or current == token
+
+
+def _job_dict(row):
+    job = dict(row)
+    job['options'] = json.loads(job['options']) if job['options'] else None
+    return job
+
+
+class JobQueue:
+    """
+    Durable ingest job queue backed by a local SQLite database.
+
+    Payloads are spooled to files under `spool_dir` and the job rows survive
+    restarts; a job left 'running' by a process that has since died is put
+    back in the queue (up to `max_attempts` times). Several processes may
+    share the same database file.
+    """
+
+    def __init__(self, db_path, spool_dir, max_attempts=3):
+        self.db_path = db_path
+        self.spool_dir = spool_dir
+        self.max_attempts = max_attempts
+        self._token_pid = None
+        self._token = None
+        os.makedirs(spool_dir, exist_ok=True)
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+            # Queues created before job options and worker tokens existed
+            columns = [row['name'] for row in conn.execute("PRAGMA table_info(jobs)")]
+            if 'options' not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN options TEXT")
+            if 'worker_token' not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN worker_token TEXT")
+
+    def _worker_token(self):
+        # Computed once per process, again after a fork
+        pid = os.getpid()
+        if self._token_pid != pid:
+            self._token_pid, self._token = pid, _process_token(pid)
+        return self._token
+
+    @contextmanager
+    def _connect(self):
+        # Autocommit connection, closed on exit; claim() manages its own transaction
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, user_id, kind, stream, filename=None, options=None):
+        """
+        Persist the payload read from `stream` and queue a job for it.
+        `options` is a JSON-serialisable dict handed back with the job.
+        :return: the new job id
+        """
+        job_id = uuid.uuid4().hex
+        payload_path = os.path.join(self.spool_dir, f"{job_id}.{kind}")
+        partial_path = payload_path + '.part'
+        with open(partial_path, 'wb') as f:
+            shutil.copyfileobj(stream, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(partial_path, payload_path)
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, user_id, kind, filename, payload_path, state, created_at, options) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, user_id, kind, filename, payload_path, QUEUED, time.time(),
+                 json.dumps(options) if options else None))
+        return job_id
+
+    def claim(self):
+        """Atomically move the oldest queued job to 'running' and return it, or None."""
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE state = ? ORDER BY created_at LIMIT 1",
+                    (QUEUED,)).fetchone()
+                if row is None:
+                    conn.execute('COMMIT')
+                    return None
+                started_at = time.time()
+                conn.execute(
+                    "UPDATE jobs SET state = ?, started_at = ?, worker_pid = ?, worker_token = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    (RUNNING, started_at, os.getpid(), self._worker_token(), row['id']))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+        job = _job_dict(row)
+        job.update(state=RUNNING, started_at=started_at, attempts=row['attempts'] + 1)
+        return job
+
+    def complete(self, job_id, rows, batches):
+        self._finish(job_id, SUCCEEDED, rows=rows, batches=batches)
+
+    def fail(self, job_id, error):
+        self._finish(job_id, FAILED, error=str(error))
+
+    def _finish(self, job_id, state, rows=None, batches=None, error=None):
+        with self._connect() as conn:
+            row = conn.execute("SELECT payload_path FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            conn.execute(
+                "UPDATE jobs SET state = ?, finished_at = ?, rows = ?, batches = ?, error = ? "
+                "WHERE id = ?", (state, time.time(), rows, batches, error, job_id))
+        if row is not None:
+            try:
+                os.remove(row['payload_path'])
+            except FileNotFoundError:
+                pass
+
+    def recover(self):
+        """
+        Requeue jobs whose worker process is gone (e.g. after a restart, even
+        if a new process got its PID); jobs that already used up their
+        attempts are marked failed.
+        """
+        with self._connect() as conn:
+            orphans = [row for row in conn.execute(
+                "SELECT id, worker_pid, worker_token, attempts FROM jobs WHERE state = ?", (RUNNING,))
+                if not _worker_alive(row['worker_pid'], row['worker_token'])]
+        for row in orphans:
+            if row['attempts'] >= self.max_attempts:
+                logging.error(f"Ingest job {row['id']} failed after {row['attempts']} attempts")
+                self.fail(row['id'], 'Worker stopped while processing the job')
+            else:
+                logging.info(f"Requeueing interrupted ingest job {row['id']}")
+                with self._connect() as conn:
+                    conn.execute(
+                        "UPDATE jobs SET state = ?, worker_pid = NULL, worker_token = NULL "
+                        "WHERE id = ? AND state = ?",
+                        (QUEUED, row['id'], RUNNING))
+        return len(orphans)
+
+    def get(self, job_id):
+        """Return the job as a dict with derived timings, or None."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = _job_dict(row)
+        now = time.time()
+        job['queue_seconds'] = (job['started_at'] or now) - job['created_at']
+        job['run_seconds'] = ((job['finished_at'] or now) - job['started_at']
+                              if job['started_at'] else None)
+        return job
+
+
+class JobWorkers:
+    """
+    Bounded pool of background threads processing jobs from a JobQueue.
+
+    `handler(job)` does the work and returns (rows, batches); an exception
+    marks the job failed. Threads are started lazily in the current process
+    so that each Gunicorn worker runs its own pool after the fork.
+    """
+
+    def __init__(self, queue, handler, size=2, poll_interval=1.0):
+        self.queue = queue
+        self.handler = handler
+        self.size = size
+        self.poll_interval = poll_interval
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    def ensure_started(self):
+        if self._pid == os.getpid() or self.size <= 0:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self.queue.recover()
+            self._threads = [threading.Thread(target=self._run, name=f"ingest-worker-{i}",
+                                              daemon=True) for i in range(self.size)]
+            for thread in self._threads:
+                thread.start()
+
+    def notify(self):
+        """Wake an idle worker after a job was queued."""
+        self._wakeup.set()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._pid = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                job = self.queue.claim()
+            except Exception as e:
+                logging.error(f"Error claiming ingest job: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self.run_job(job)
+
+    def run_job(self, job):
+        logging.info(f"Processing ingest job {job['id']} for user {job['user_id']}")
+        try:
+            rows, batches = self.handler(job)
+        except Exception as e:
+            logging.error(f"Ingest job {job['id']} failed: {e}")
+            self.queue.fail(job['id'], e)
+        else:
+            logging.info(f"Ingest job {job['id']} saved {rows} rows")
+            self.queue.complete(job['id'], rows, batches)
@@ -0,0 +1,167 @@
+import bisect
+import datetime
+import threading
+import time
+
+# Periods served by GET /api/v1/leaderboard; week and month are the current ones
+PERIODS = ('all', 'week', 'month')
+
+_ONE_DAY = datetime.timedelta(days=1)
+
+
+def period_keys(day):
+    """user_points periods a day counts towards: all time, its ISO week and its month."""
+    year, week, _ = day.isocalendar()
+    return ['all', f'{year}-W{week:02d}', f'{day.year}-{day.month:02d}']
+
+
+def current_period_key(period, today=None):
+    today = today or datetime.datetime.now(datetime.timezone.utc).date()
+    return dict(zip(PERIODS, period_keys(today)))[period]
+
+
+def new_state():
+    return {'points': 0.0, 'current_streak': 0, 'longest_streak': 0, 'last_active_day': None}
+
+
+def daily_totals(summary):
+    """
+    {user_id: {day: {series: value_sum}}} from daily summaries (see
+    processor.summary.daily_summary), adding up days split across batches.
+    """
+    totals = {}
+    if summary.empty:
+        return totals
+    sums = summary.groupby(['user_id', 'metric_day', 'metric_name'], sort=False)['value_sum'].sum()
+    for (user_id, day, series), value in sums.items():
+        day = day.date() if isinstance(day, datetime.datetime) else day
+        totals.setdefault(int(user_id), {}).setdefault(day, {})[series] = float(value)
+    return totals
+
+
+class PointsRules:
+    """
+    Points of a day: `step_points` per 1000 steps of the step_count metric,
+    `workout_points` for a day with a workout, and `streak_points` for every
+    consecutive workout day before it in the current streak.
+    """
+
+    def __init__(self, step_points=1.0, workout_points=10.0, streak_points=5.0):
+        self.step_points = step_points
+        self.workout_points = workout_points
+        self.streak_points = streak_points
+
+    def score(self, days, state):
+        """
+        Fold an upload's daily totals of one user ({day: {series: value_sum}})
+        into their stored state ({period: new_state()}), in place.
+
+        Step points are additive, so they count whatever day they fall on.
+        Workout days only extend the streak when they are after the last
+        active day; older days (a backfill) need a rebuild from summary_metrics.
+        :return: the periods changed
+        """
+        changed = set()
+        for day in sorted(days):
+            totals = days[day]
+            points = totals.get('step_count', 0.0) / 1000 * self.step_points
+            if 'workout' in totals:
+                overall = state.setdefault('all', new_state())
+                last = overall['last_active_day']
+                if last is None or day > last:
+                    streak = overall['current_streak'] + 1 if last == day - _ONE_DAY else 1
+                    overall.update(current_streak=streak, last_active_day=day,
+                                   longest_streak=max(overall['longest_streak'], streak))
+                    points += self.workout_points + self.streak_points * (streak - 1)
+                    changed.add('all')
+            if points:
+                for key in period_keys(day):
+                    state.setdefault(key, new_state())['points'] += points
+                    changed.add(key)
+        return changed
+
+
+def streak_json(entry, today=None):
+    """Streak fields of an 'all' entry; a streak not extended yesterday or today is over."""
+    today = today or datetime.datetime.now(datetime.timezone.utc).date()
+    last = entry.get('last_active_day')
+    active = last is not None and last >= today - _ONE_DAY
+    return {'current_streak': entry.get('current_streak', 0) if active else 0,
+            'longest_streak': entry.get('longest_streak', 0)}
+
+
+class Leaderboard:
+    """
+    Users of one period ranked by points. Entries are kept sorted, so a
+    rank is a binary search and the top N a slice; ties share a rank.
+    """
+
+    def __init__(self, entries=()):
+        self._entries = {}
+        self._keys = []  # (-points, user_id), ascending
+        for entry in entries:
+            self.set(entry)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def set(self, entry):
+        """Add or replace the entry ({'user_id', 'points', ...}) of a user."""
+        user_id = entry['user_id']
+        old = self._entries.get(user_id)
+        if old is not None:
+            del self._keys[bisect.bisect_left(self._keys, (-old['points'], user_id))]
+            entry = {**old, **{key: value for key, value in entry.items() if value is not None}}
+        bisect.insort(self._keys, (-entry['points'], user_id))
+        self._entries[user_id] = entry
+
+    def rank(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        return bisect.bisect_left(self._keys, (-entry['points'],)) + 1
+
+    def get(self, user_id):
+        entry = self._entries.get(user_id)
+        return entry and {**entry, 'rank': self.rank(user_id)}
+
+    def top(self, n):
+        return [self.get(user_id) for _, user_id in self._keys[:n]]
+
+
+class LeaderboardCache:
+    """
+    Leaderboards of the periods in use, loaded with `loader(period_key)` and
+    reloaded after `ttl` seconds to pick up points written by other
+    processes. Uploads handled here update the loaded boards directly.
+    """
+
+    def __init__(self, loader, ttl=60, clock=time.monotonic):
+        self.loader = loader
+        self.ttl = ttl
+        self._clock = clock
+        self._boards = {}
+        self._lock = threading.Lock()
+
+    def board(self, key):
+        now = self._clock()
+        with self._lock:
+            entry = self._boards.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+
+        # Load outside the lock so a slow database does not serialise requests
+        board = Leaderboard(self.loader(key))
+        with self._lock:
+            self._boards[key] = (now + self.ttl, board)
+        return board
+
+    def update(self, key, entry):
+        with self._lock:
+            loaded = self._boards.get(key)
+            if loaded is not None:
+                loaded[1].set(entry)
+
+    def clear(self):
+        with self._lock:
+            self._boards.clear()
@@ -0,0 +1,327 @@
+"""
+Counters and latency histograms in the Prometheus text format, with no
+client library.
+
+Each process adds to its own values. With a metrics directory configured
+(METRICS_DIR), they live in a memory-mapped file per process in that
+directory, and exposition() sums the files of every process, so a scrape of
+/metrics answered by any Gunicorn worker covers all of them. Counts of
+workers that have exited stay in the sums, as counters must. The directory
+should be emptied before the server starts.
+"""
+import glob
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _DictValues:
+    """Values of this process only."""
+
+    def __init__(self):
+        self._values = {}
+
+    def add(self, key, amount):
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def items(self):
+        return list(self._values.items())
+
+    def close(self):
+        pass
+
+
+class _MmapValues:
+    """
+    Values of this process in `path`, readable by any process: the used size,
+    then entries of (key length, key padded to 8 bytes, float64 value).
+    """
+
+    def __init__(self, path, initial_size=64 * 1024):
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < initial_size:
+            self._file.truncate(initial_size)
+            size = initial_size
+        self._capacity = size
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._used = struct.unpack_from('<i', self._map, 0)[0]
+        if not self._used:
+            self._used = 8
+            struct.pack_into('<i', self._map, 0, self._used)
+        # A pid reused by a later process carries on from its values
+        self._positions = {key: position for key, _, position in _read_entries(self._map, self._used)}
+
+    def _position(self, key):
+        position = self._positions.get(key)
+        if position is not None:
+            return position
+        encoded = key.encode('utf-8')
+        padded = encoded + b' ' * (8 - (len(encoded) + 4) % 8)
+        entry = struct.pack(f'<i{len(padded)}sd', len(encoded), padded, 0.0)
+        while self._used + len(entry) > self._capacity:
+            self._capacity *= 2
+            self._file.truncate(self._capacity)
+            self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), self._capacity)
+        self._map[self._used:self._used + len(entry)] = entry
+        self._used += len(entry)
+        # Readers only look up to the used size, so the entry is complete before it is published
+        struct.pack_into('<i', self._map, 0, self._used)
+        self._positions[key] = self._used - 8
+        return self._used - 8
+
+    def add(self, key, amount):
+        position = self._position(key)
+        value = struct.unpack_from('<d', self._map, position)[0]
+        struct.pack_into('<d', self._map, position, value + amount)
+
+    def items(self):
+        return [(key, value) for key, value, _ in _read_entries(self._map, self._used)]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def _read_entries(data, used):
+    position = 8
+    while position < used:
+        length = struct.unpack_from('<i', data, position)[0]
+        key = bytes(data[position + 4:position + 4 + length]).decode('utf-8')
+        position += 4 + length + (8 - (length + 4) % 8)
+        yield key, struct.unpack_from('<d', data, position)[0], position
+        position += 8
+
+
+def read_file(path):
+    """The (key, value) pairs of a per-process values file."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < 8:
+        return []
+    return [(key, value) for key, value, _ in _read_entries(data, struct.unpack_from('<i', data, 0)[0])]
+
+
+class Registry:
+    """The metrics of the app and where their values are kept."""
+
+    def __init__(self):
+        self.metrics = []
+        self.directory = None
+        self._values = None
+        self._values_pid = None
+        self._lock = threading.Lock()
+
+    def configure(self, directory=None):
+        """Keep values in `directory` (shared by every process), or in memory when None."""
+        with self._lock:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.directory = directory or None
+            if self._values is not None:
+                self._values.close()
+            self._values = None
+
+    def _get_values(self):
+        # Opened on first use in each process; a forked worker never writes to its parent's file
+        if self._values is None or self._values_pid != os.getpid():
+            if self.directory:
+                self._values = _MmapValues(os.path.join(self.directory, f"metrics_{os.getpid()}.db"))
+            else:
+                self._values = _DictValues()
+            self._values_pid = os.getpid()
+        return self._values
+
+    def add(self, key, amount):
+        with self._lock:
+            self._get_values().add(key, amount)
+
+    def collect(self):
+        """{key: value} summed over every process writing to the directory."""
+        with self._lock:
+            if not self.directory:
+                return dict(self._get_values().items())
+        totals = {}
+        for path in glob.glob(os.path.join(self.directory, 'metrics_*.db')):
+            try:
+                items = read_file(path)
+            except OSError:
+                continue
+            for key, value in items:
+                totals[key] = totals.get(key, 0.0) + value
+        return totals
+
+
+REGISTRY = Registry()
+
+
+def configure(config):
+    REGISTRY.configure(config.get('METRICS_DIR'))
+
+
+def _key(name, labels):
+    return json.dumps([name, sorted(labels.items())])
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry
+        # Encoded sample keys per label values, so observations don't build them again
+        self._keys = {}
+        registry.metrics.append(self)
+
+    def _series_keys(self, labels):
+        values = tuple(str(labels.get(name)) for name in self.labelnames)
+        keys = self._keys.get(values)
+        if keys is None or len(labels) != len(self.labelnames):
+            if set(labels) != set(self.labelnames):
+                raise ValueError(f"{self.name} takes the labels {', '.join(self.labelnames) or 'none'}")
+            keys = self._keys[values] = self._make_keys(dict(zip(self.labelnames, values)))
+        return keys
+
+    def _make_keys(self, labels):
+        return _key(self.name + '_total', labels)
+
+    def inc(self, amount=1, **labels):
+        self.registry.add(self._series_keys(labels), amount)
+
+    def samples(self, values):
+        name = self.name + '_total'
+        return [(name, dict(labels), value)
+                for labels, value in sorted((labels, value) for (key, labels), value in values if key == name)]
+
+
+class Histogram(Counter):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def _make_keys(self, labels):
+        buckets = [(bound, _key(self.name + '_bucket', dict(labels, le=_format(bound)))) for bound in self.buckets]
+        buckets.append((math.inf, _key(self.name + '_bucket', dict(labels, le='+Inf'))))
+        return buckets, _key(self.name + '_sum', labels), _key(self.name + '_count', labels)
+
+    def observe(self, value, **labels):
+        buckets, sum_key, count_key = self._series_keys(labels)
+        # Buckets are cumulative, so every bound at or above the value counts it
+        for bound, key in buckets:
+            if value <= bound:
+                self.registry.add(key, 1)
+        self.registry.add(sum_key, value)
+        self.registry.add(count_key, 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the seconds spent in the with block (also when it raises)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def time_iter(self, iterable, **labels):
+        """Yield the items of `iterable`, observing the seconds spent producing each one."""
+        iterator = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.observe(time.perf_counter() - started, **labels)
+            yield item
+
+    def samples(self, values):
+        by_name = {}
+        for (name, labels), value in values:
+            by_name.setdefault(name, []).append((labels, value))
+        samples = []
+        for labels, count in sorted(by_name.get(self.name + '_count', [])):
+            series = dict(labels)
+            buckets = {dict(bucket_labels)['le']: value
+                       for bucket_labels, value in by_name.get(self.name + '_bucket', [])
+                       if {k: v for k, v in bucket_labels if k != 'le'} == series}
+            for bound in self.buckets:
+                samples.append((self.name + '_bucket', dict(series, le=_format(bound)),
+                                buckets.get(_format(bound), 0.0)))
+            samples.append((self.name + '_bucket', dict(series, le='+Inf'), count))
+            total = next((value for sum_labels, value in by_name.get(self.name + '_sum', [])
+                          if sum_labels == labels), 0.0)
+            samples.append((self.name + '_sum', series, total))
+            samples.append((self.name + '_count', series, count))
+        return samples
+
+
+def _format(value):
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value))
+
+
+def _escape(value):
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def exposition(registry=REGISTRY):
+    """Every metric in the Prometheus text format (version 0.0.4)."""
+    values = []
+    for key, value in registry.collect().items():
+        name, labels = json.loads(key)
+        values.append(((name, tuple(tuple(pair) for pair in labels)), value))
+    lines = []
+    for metric in registry.metrics:
+        lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for name, labels, value in metric.samples(values):
+            label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_text}}} {_format(value)}" if label_text else f"{name} {_format(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+## Ingest
+
+INGEST_STAGE_SECONDS = Histogram(
+    'uzimasync_ingest_stage_seconds',
+    'Time spent in each ingest stage: parse (json decoding), flatten, build (columnar layout), '
+    'prepare (timestamps, ingest filter), downsample, write, summary, points, workout_tables, ingest_state',
+    ['stage'])
+INGEST_ROWS = Counter(
+    'uzimasync_ingest_rows', 'Rows through ingest by outcome: parsed, written, rejected, skipped', ['outcome'])
+UPLOAD_BYTES = Counter('uzimasync_upload_bytes', 'Request body bytes received by upload endpoints', ['endpoint'])
+
+## Database
+
+DB_SECONDS = Histogram(
+    'uzimasync_db_seconds',
+    'Database call latency: acquire (pool wait), convert (rows to binds), executemany, merge', ['operation'])
+DB_ROWS = Counter('uzimasync_db_rows', 'Rows sent to the database by table and outcome (written, rejected)',
+                  ['table', 'outcome'])
+
+## Authentication
+
+AUTH_LOOKUP_SECONDS = Histogram('uzimasync_auth_lookup_seconds', 'API key lookups in the database (cache misses)')
+PASSWORD_HASH_SECONDS = Histogram(
+    'uzimasync_password_hash_seconds', 'bcrypt operations (hash, check), queued and hashing', ['operation', 'phase'])
+
+## HTTP
+
+HTTP_REQUEST_SECONDS = Histogram('uzimasync_http_request_seconds', 'Request latency by endpoint',
+                                 ['endpoint', 'method', 'status'])
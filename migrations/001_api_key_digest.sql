@@ -0,0 +1,30 @@
+-- Store API keys as an indexed SHA-256 digest instead of the raw key.
+--
+-- New keys ("uz_<prefix>_<secret>") only ever have their prefix and digest
+-- stored. Existing bcrypt-style keys are backfilled below; any key missed here
+-- is migrated on its first successful lookup by the API.
+
+ALTER TABLE users ADD (
+    api_key_prefix VARCHAR2(16),
+    api_key_hash   CHAR(64)
+);
+
+-- New users have no plain-text key
+DECLARE
+    column_already_nullable EXCEPTION;
+    PRAGMA EXCEPTION_INIT(column_already_nullable, -1451);
+BEGIN
+    EXECUTE IMMEDIATE 'ALTER TABLE users MODIFY (api_key NULL)';
+EXCEPTION
+    WHEN column_already_nullable THEN NULL;
+END;
+/
+
+UPDATE users
+   SET api_key_hash = LOWER(RAWTOHEX(STANDARD_HASH(api_key, 'SHA256')))
+ WHERE api_key IS NOT NULL
+   AND api_key_hash IS NULL;
+
+COMMIT;
+
+CREATE UNIQUE INDEX users_api_key_hash_uk ON users (api_key_hash);
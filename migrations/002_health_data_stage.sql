@@ -0,0 +1,26 @@
+-- Staging table for bulk loads into health_data.
+--
+-- A global temporary table gives every session its own private rows, so
+-- concurrent uploads can stage in parallel. Rows survive the commits made
+-- while staging and are cleared by the loader after each merge.
+
+CREATE GLOBAL TEMPORARY TABLE health_data_stage
+ON COMMIT PRESERVE ROWS
+AS SELECT health_data_user,
+          type,
+          recorded_date,
+          source,
+          workout_qty,
+          workout_units,
+          elevation_qty,
+          elevation_units,
+          location,
+          value,
+          units,
+          metric_name
+     FROM health_data
+    WHERE 1 = 0;
+
+-- Supports the duplicate check of the set-based merge
+CREATE INDEX health_data_dedupe_ix
+    ON health_data (health_data_user, recorded_date, type, metric_name, source);
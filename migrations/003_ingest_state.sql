@@ -0,0 +1,22 @@
+-- Incremental ingest state.
+--
+-- ingest_files records the SHA-256 of every export a user has uploaded, so
+-- repeat uploads are skipped. ingest_watermarks keeps, per user and series
+-- (metric name, or 'workout'), the UTC time of the newest sample stored;
+-- samples at or before it are dropped when overlapping windows are re-uploaded.
+
+CREATE TABLE ingest_files (
+    user_id       NUMBER NOT NULL,
+    content_hash  CHAR(64) NOT NULL,
+    filename      VARCHAR2(255),
+    processed_at  TIMESTAMP DEFAULT SYSTIMESTAMP NOT NULL,
+    CONSTRAINT ingest_files_pk PRIMARY KEY (user_id, content_hash)
+);
+
+CREATE TABLE ingest_watermarks (
+    user_id     NUMBER NOT NULL,
+    series      VARCHAR2(128) NOT NULL,
+    high_water  TIMESTAMP NOT NULL,
+    updated_at  TIMESTAMP DEFAULT SYSTIMESTAMP NOT NULL,
+    CONSTRAINT ingest_watermarks_pk PRIMARY KEY (user_id, series)
+);
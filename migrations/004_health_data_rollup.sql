@@ -0,0 +1,15 @@
+-- Downsampled rows (DOWNSAMPLE_RESOLUTION / DOWNSAMPLE_OVERRIDES).
+--
+-- A rolled-up row is dated with the first sample of its bucket; the bucket's
+-- last sample date and number of samples are kept alongside. Raw rows have
+-- no end date and a count of 1 (NULL when written with downsampling off).
+
+ALTER TABLE health_data ADD (
+    recorded_date_end  VARCHAR2(50),
+    sample_count       NUMBER
+);
+
+ALTER TABLE health_data_stage ADD (
+    recorded_date_end  VARCHAR2(50),
+    sample_count       NUMBER
+);
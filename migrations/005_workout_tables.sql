@@ -0,0 +1,61 @@
+-- Narrow workout tables (WORKOUT_TABLES=true).
+--
+-- One row per workout session, keyed by the export's workout id, and one
+-- narrow row per sample of each series kind. Session constants (location,
+-- elevation, energy, distance) are stored once instead of on every step row.
+
+CREATE TABLE workout_sessions (
+    user_id             NUMBER NOT NULL,
+    workout_id          VARCHAR2(64) NOT NULL,
+    name                VARCHAR2(100),
+    location            VARCHAR2(50),
+    start_date          VARCHAR2(50),
+    end_date            VARCHAR2(50),
+    duration            NUMBER,
+    active_energy_qty   NUMBER,
+    active_energy_units VARCHAR2(20),
+    distance_qty        NUMBER,
+    distance_units      VARCHAR2(20),
+    elevation_up_qty    NUMBER,
+    elevation_up_units  VARCHAR2(20),
+    intensity_qty       NUMBER,
+    intensity_units     VARCHAR2(20),
+    humidity_qty        NUMBER,
+    humidity_units      VARCHAR2(20),
+    temperature_qty     NUMBER,
+    temperature_units   VARCHAR2(20),
+    CONSTRAINT workout_sessions_pk PRIMARY KEY (user_id, workout_id)
+);
+
+-- stepCount, activeEnergy and walkingAndRunningDistance samples
+CREATE TABLE workout_quantity_samples (
+    user_id        NUMBER NOT NULL,
+    workout_id     VARCHAR2(64) NOT NULL,
+    series         VARCHAR2(32) NOT NULL,
+    recorded_date  VARCHAR2(50),
+    qty            NUMBER,
+    units          VARCHAR2(20),
+    source         VARCHAR2(100),
+    CONSTRAINT workout_quantity_samples_fk FOREIGN KEY (user_id, workout_id)
+        REFERENCES workout_sessions (user_id, workout_id)
+);
+
+CREATE INDEX workout_quantity_samples_ix
+    ON workout_quantity_samples (user_id, workout_id, series);
+
+-- heartRateData and heartRateRecovery samples
+CREATE TABLE workout_heart_rate_samples (
+    user_id        NUMBER NOT NULL,
+    workout_id     VARCHAR2(64) NOT NULL,
+    series         VARCHAR2(32) NOT NULL,
+    recorded_date  VARCHAR2(50),
+    bpm_min        NUMBER,
+    bpm_avg        NUMBER,
+    bpm_max        NUMBER,
+    source         VARCHAR2(100),
+    CONSTRAINT workout_heart_rate_samples_fk FOREIGN KEY (user_id, workout_id)
+        REFERENCES workout_sessions (user_id, workout_id)
+);
+
+CREATE INDEX workout_heart_rate_samples_ix
+    ON workout_heart_rate_samples (user_id, workout_id, series);
@@ -0,0 +1,30 @@
+-- Native sample timestamps (NATIVE_TIMESTAMPS=true).
+--
+-- recorded_at holds the sample time normalised to UTC and utc_offset_minutes
+-- the offset it was recorded with, so local days can be bucketed as
+-- TRUNC(recorded_at + utc_offset_minutes / 1440) without string conversion.
+-- recorded_date keeps the original text.
+
+ALTER TABLE health_data ADD (
+    recorded_at         TIMESTAMP,
+    utc_offset_minutes  NUMBER(4)
+);
+
+ALTER TABLE health_data_stage ADD (
+    recorded_at         TIMESTAMP,
+    utc_offset_minutes  NUMBER(4)
+);
+
+-- Backfill rows in the export format ("2024-09-05 17:37:40 +0200") with an
+-- explicit format mask, independent of the session NLS settings
+UPDATE health_data
+   SET recorded_at = SYS_EXTRACT_UTC(TO_TIMESTAMP_TZ(recorded_date, 'YYYY-MM-DD HH24:MI:SS TZHTZM')),
+       utc_offset_minutes =
+           EXTRACT(TIMEZONE_HOUR FROM TO_TIMESTAMP_TZ(recorded_date, 'YYYY-MM-DD HH24:MI:SS TZHTZM')) * 60
+         + EXTRACT(TIMEZONE_MINUTE FROM TO_TIMESTAMP_TZ(recorded_date, 'YYYY-MM-DD HH24:MI:SS TZHTZM'))
+ WHERE recorded_at IS NULL
+   AND REGEXP_LIKE(recorded_date, '^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} [+-]\d{4}$');
+
+COMMIT;
+
+CREATE INDEX health_data_user_recorded_at_ix ON health_data (health_data_user, recorded_at);
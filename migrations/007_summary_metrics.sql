@@ -0,0 +1,19 @@
+-- Daily per-user, per-metric aggregates (SUMMARY_METRICS=true).
+--
+-- Maintained at ingest from each saved batch; rebuild with
+-- `flask --app app backfill-summary`. metric_day is the local calendar day the
+-- samples were recorded on; metric_name is the metric, or 'workout' for
+-- workout step rows. The average is value_sum / sample_count.
+
+CREATE TABLE summary_metrics (
+    user_id       NUMBER NOT NULL,
+    metric_day    DATE NOT NULL,
+    metric_name   VARCHAR2(100) NOT NULL,
+    units         VARCHAR2(50),
+    value_sum     NUMBER,
+    value_min     NUMBER,
+    value_max     NUMBER,
+    sample_count  NUMBER NOT NULL,
+    updated_at    TIMESTAMP DEFAULT SYSTIMESTAMP NOT NULL,
+    CONSTRAINT summary_metrics_pk PRIMARY KEY (user_id, metric_day, metric_name)
+);
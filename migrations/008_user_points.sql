@@ -0,0 +1,19 @@
+-- Gamification points and workout streaks (LEADERBOARD=true).
+--
+-- One row per user and period: 'all' (which also holds the streak), an ISO
+-- week ('2024-W35') or a month ('2024-08'). Updated at ingest from the daily
+-- totals of each upload; rebuild from summary_metrics with
+-- `flask --app app rebuild-leaderboard`.
+
+CREATE TABLE user_points (
+    user_id          NUMBER NOT NULL,
+    period           VARCHAR2(10) NOT NULL,
+    points           NUMBER DEFAULT 0 NOT NULL,
+    current_streak   NUMBER DEFAULT 0 NOT NULL,
+    longest_streak   NUMBER DEFAULT 0 NOT NULL,
+    last_active_day  DATE,
+    updated_at       TIMESTAMP DEFAULT SYSTIMESTAMP NOT NULL,
+    CONSTRAINT user_points_pk PRIMARY KEY (user_id, period)
+);
+
+CREATE INDEX user_points_period_ix ON user_points (period, points DESC);
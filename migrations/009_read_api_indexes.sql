@@ -0,0 +1,17 @@
+-- Indexes serving the read API (GET /api/v1/metrics, /api/v1/workouts).
+--
+-- Pages are ranged, ordered and keyed on the sample time of one user, so each
+-- page is an index range scan that stops after FETCH FIRST rows. health_data
+-- is read by recorded_at (health_data_user_recorded_at_ix, migrations/006);
+-- run the 006 backfill before serving reads, and ingest with
+-- NATIVE_TIMESTAMPS=true so new rows carry recorded_at.
+--
+-- The narrow workout tables (WORKOUT_TABLES) keep the export text, so their
+-- time is a function-based index on exactly the expression health_queries.py
+-- uses. A conversion error yields NULL, and NULL times are not served.
+
+CREATE INDEX workout_quantity_samples_time_ix ON workout_quantity_samples (
+    user_id,
+    SYS_EXTRACT_UTC(TO_TIMESTAMP_TZ(recorded_date DEFAULT NULL ON CONVERSION ERROR,
+                                    'YYYY-MM-DD HH24:MI:SS TZHTZM'))
+);
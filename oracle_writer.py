@@ -0,0 +1,314 @@
+import logging
+import time
+
+import oracledb
+
+from metrics import DB_ROWS, DB_SECONDS
+
+# (DataFrame column, health_data column, bind type) in INSERT order
+HEALTH_DATA_BINDS = [
+    ('health_data_user', 'health_data_user', oracledb.DB_TYPE_NUMBER),
+    ('type', 'type', oracledb.DB_TYPE_VARCHAR),
+    ('date', 'recorded_date', oracledb.DB_TYPE_VARCHAR),
+    ('source', 'source', oracledb.DB_TYPE_VARCHAR),
+    ('workout_qty', 'workout_qty', oracledb.DB_TYPE_NUMBER),
+    ('workout_units', 'workout_units', oracledb.DB_TYPE_VARCHAR),
+    ('elevation_qty', 'elevation_qty', oracledb.DB_TYPE_NUMBER),
+    ('elevation_units', 'elevation_units', oracledb.DB_TYPE_VARCHAR),
+    ('location', 'location', oracledb.DB_TYPE_VARCHAR),
+    ('value', 'value', oracledb.DB_TYPE_NUMBER),
+    ('units', 'units', oracledb.DB_TYPE_VARCHAR),
+    ('metric_name', 'metric_name', oracledb.DB_TYPE_VARCHAR),
+]
+
+# Rolled-up frames (see processor.downsample) also carry the bucket's last sample and size
+ROLLUP_BINDS = [
+    ('date_end', 'recorded_date_end', oracledb.DB_TYPE_VARCHAR),
+    ('samples', 'sample_count', oracledb.DB_TYPE_NUMBER),
+]
+
+# Frames with parsed timestamps (see processor.timestamps) bind them natively
+TIMESTAMP_BINDS = [
+    ('recorded_at', 'recorded_at', oracledb.DB_TYPE_TIMESTAMP),
+    ('utc_offset', 'utc_offset_minutes', oracledb.DB_TYPE_NUMBER),
+]
+
+N = oracledb.DB_TYPE_NUMBER
+V = oracledb.DB_TYPE_VARCHAR
+
+# Narrow workout tables; frame columns carry the table column names
+WORKOUT_TABLE_BINDS = {
+    'workout_sessions': [(column, column, bind_type) for column, bind_type in (
+        ('user_id', N), ('workout_id', V), ('name', V), ('location', V), ('start_date', V),
+        ('end_date', V), ('duration', N), ('active_energy_qty', N), ('active_energy_units', V),
+        ('distance_qty', N), ('distance_units', V), ('elevation_up_qty', N),
+        ('elevation_up_units', V), ('intensity_qty', N), ('intensity_units', V),
+        ('humidity_qty', N), ('humidity_units', V), ('temperature_qty', N),
+        ('temperature_units', V))],
+    'workout_quantity_samples': [(column, column, bind_type) for column, bind_type in (
+        ('user_id', N), ('workout_id', V), ('series', V), ('recorded_date', V), ('qty', N),
+        ('units', V), ('source', V))],
+    'workout_heart_rate_samples': [(column, column, bind_type) for column, bind_type in (
+        ('user_id', N), ('workout_id', V), ('series', V), ('recorded_date', V), ('bpm_min', N),
+        ('bpm_avg', N), ('bpm_max', N), ('source', V))],
+}
+
+
+def binds_for(df):
+    """The bind list matching the layout of a frame."""
+    binds = list(HEALTH_DATA_BINDS)
+    if 'date_end' in df.columns:
+        binds += ROLLUP_BINDS
+    if 'recorded_at' in df.columns:
+        binds += TIMESTAMP_BINDS
+    return binds
+
+
+def insert_statement(table, binds):
+    columns = ', '.join(column for _, column, _ in binds)
+    values = ', '.join(f":{i}" for i in range(1, len(binds) + 1))
+    return f"INSERT INTO {table} ({columns}) VALUES ({values})"
+
+
+def column_values(series, start, end):
+    """
+    Return rows [start:end) of a column as a list of Python values with
+    NaN/NaT/NA replaced by None. Only the slice is converted; the frame is
+    not copied.
+    """
+    # Imported here so that the row ingest path (write_rows) doesn't load pandas
+    import numpy as np
+    import pandas as pd
+
+    values = series.to_numpy()[start:end]
+    if values.dtype.kind == 'M':
+        # datetime64 only converts to datetime objects (not ints) at microsecond precision
+        values = values.astype('datetime64[us]')
+    missing = pd.isna(values)
+    values = values.tolist()
+    for i in np.flatnonzero(missing):
+        values[i] = None
+    return values
+
+
+def accepted_rows(df, report):
+    """The rows of `df` not rejected by a writer (per its report)."""
+    if report and report.get('rejected_rows'):
+        return df.drop(df.index[report['rejected_rows']])
+    return df
+
+
+class HealthDataWriter:
+    """
+    Array-DML writer for health_data.
+
+    Rows are sent in batches of `batch_size` with bind types declared up
+    front. Batch errors are collected instead of failing the whole batch, and
+    the transaction is committed every `commit_every` batches (0 commits
+    once at the end, None leaves the commit to the caller).
+    """
+
+    def __init__(self, connection, batch_size=5000, commit_every=1,
+                 table='health_data', binds=HEALTH_DATA_BINDS):
+        self.connection = connection
+        self.batch_size = batch_size
+        self.commit_every = commit_every
+        self.binds = binds
+        self.table = table
+        self.sql = insert_statement(table, binds)
+
+    def write(self, df):
+        """
+        Insert every row of `df`.
+        :return: dict with rows, rows_written, errors, the positions of the
+            rejected rows, batches and per-batch seconds
+        """
+        if df.empty:
+            return self._write(0, None)
+        columns = [df[name] for name, _, _ in self.binds]
+        return self._write(len(df), lambda start, end: list(zip(*(column_values(column, start, end)
+                                                                  for column in columns))))
+
+    def write_rows(self, rows):
+        """
+        Insert a list of row tuples (or lists) already in bind order, e.g. from
+        HealthDataProcessor(rows=True), as they are. Returns the same report as
+        write().
+        """
+        return self._write(len(rows), lambda start, end: rows[start:end])
+
+    def _write(self, total, batch):
+        # batch(start, end) returns rows [start:end) as sequences of bind values
+        report = {'rows': total, 'rows_written': 0, 'errors': 0, 'rejected_rows': [],
+                  'batches': 0, 'batch_seconds': []}
+        if not total:
+            return report
+
+        cursor = self.connection.cursor()
+        try:
+            for start in range(0, total, self.batch_size):
+                end = min(start + self.batch_size, total)
+                with DB_SECONDS.time(operation='convert'):
+                    rows = batch(start, end)
+
+                started = time.perf_counter()
+                cursor.setinputsizes(*(bind_type for _, _, bind_type in self.binds))
+                cursor.executemany(self.sql, rows, batcherrors=True)
+                errors = cursor.getbatcherrors()
+                DB_SECONDS.observe(time.perf_counter() - started, operation='executemany')
+                report['batches'] += 1
+                if self.commit_every and report['batches'] % self.commit_every == 0:
+                    self.connection.commit()
+                report['batch_seconds'].append(time.perf_counter() - started)
+
+                report['rows_written'] += len(rows) - len(errors)
+                report['errors'] += len(errors)
+                DB_ROWS.inc(len(rows) - len(errors), table=self.table, outcome='written')
+                DB_ROWS.inc(len(errors), table=self.table, outcome='rejected')
+                report['rejected_rows'].extend(start + error.offset for error in errors)
+                for error in errors[:5]:
+                    logging.error(f"Row {start + error.offset} rejected: {error.message}")
+
+            if self.commit_every is not None and (
+                    not self.commit_every or report['batches'] % self.commit_every):
+                self.connection.commit()
+        finally:
+            cursor.close()
+
+        seconds = report['batch_seconds']
+        logging.info(f"Wrote {report['rows_written']}/{report['rows']} rows in "
+                     f"{report['batches']} batches (max {max(seconds) * 1000:.1f} ms, "
+                     f"total {sum(seconds) * 1000:.1f} ms, {report['errors']} rejected)")
+        return report
+
+
+# Null-safe match on the dedupe key (user, type/metric_name, recorded_date, source)
+_DEDUPE_MATCH = """
+        t.health_data_user = s.health_data_user
+    AND t.recorded_date = s.recorded_date
+    AND t.type = s.type
+    AND DECODE(t.metric_name, s.metric_name, 1, 0) = 1
+    AND DECODE(t.source, s.source, 1, 0) = 1"""
+
+# Stage rows with duplicates inside the upload removed
+_DEDUPED_STAGE = """
+    SELECT *
+      FROM (SELECT st.*,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY health_data_user, recorded_date, type, metric_name, source
+                       ORDER BY NULL) AS rn
+              FROM health_data_stage st)
+     WHERE rn = 1"""
+
+
+def merge_statement(binds):
+    columns = [column for _, column, _ in binds]
+    return (f"MERGE INTO health_data t USING ({_DEDUPED_STAGE}) s ON ({_DEDUPE_MATCH})\n"
+            f"WHEN NOT MATCHED THEN INSERT ({', '.join(columns)})\n"
+            f"VALUES ({', '.join('s.' + column for column in columns)})")
+
+
+def append_statement(binds):
+    columns = ', '.join(column for _, column, _ in binds)
+    return (f"INSERT /*+ APPEND */ INTO health_data ({columns})\n"
+            f"SELECT {columns} FROM ({_DEDUPED_STAGE}) s\n"
+            f"WHERE NOT EXISTS (SELECT 1 FROM health_data t WHERE {_DEDUPE_MATCH})")
+
+
+class StagingBulkLoader:
+    """
+    Bulk loader for large uploads and backfills.
+
+    Rows are array-inserted into the session-private health_data_stage table,
+    then moved into health_data with one set-based statement that skips rows
+    already present (same user, type/metric, recorded_date and source):
+    a MERGE by default, or a direct-path INSERT /*+ APPEND */ ... SELECT with
+    strategy='append' (faster, but locks health_data until the commit).
+    """
+
+    def __init__(self, connection, batch_size=5000, strategy='merge', binds=HEALTH_DATA_BINDS):
+        if strategy not in ('merge', 'append'):
+            raise ValueError(f"Unknown bulk load strategy: {strategy}")
+        self.connection = connection
+        self.stage_writer = HealthDataWriter(connection, batch_size=batch_size, commit_every=None,
+                                             table='health_data_stage', binds=binds)
+        self.sql = merge_statement(binds) if strategy == 'merge' else append_statement(binds)
+
+    def write(self, df):
+        """
+        Stage and merge every row of `df`.
+        :return: the staging report plus rows_written, duplicates and merge_seconds
+        """
+        if df.empty:
+            return self.stage_writer.write(df)
+        return self._load(lambda: self.stage_writer.write(df))
+
+    def write_rows(self, rows):
+        """Stage and merge row tuples in bind order (see HealthDataWriter.write_rows)."""
+        if not rows:
+            return self.stage_writer.write_rows(rows)
+        return self._load(lambda: self.stage_writer.write_rows(rows))
+
+    def _load(self, stage):
+        cursor = self.connection.cursor()
+        try:
+            # Clear anything a failed load left behind in this pooled session
+            cursor.execute("TRUNCATE TABLE health_data_stage")
+            report = stage()
+            staged = report['rows_written']
+
+            started = time.perf_counter()
+            cursor.execute(self.sql)
+            merged = cursor.rowcount
+            self.connection.commit()
+            report['merge_seconds'] = time.perf_counter() - started
+            DB_SECONDS.observe(report['merge_seconds'], operation='merge')
+
+            cursor.execute("TRUNCATE TABLE health_data_stage")
+        finally:
+            cursor.close()
+
+        report['staged'] = staged
+        report['rows_written'] = merged
+        report['duplicates'] = staged - merged
+        logging.info(f"Bulk loaded {merged} of {staged} staged rows into health_data "
+                     f"({report['duplicates']} duplicates skipped, merge "
+                     f"{report['merge_seconds'] * 1000:.1f} ms)")
+        return report
+
+
+class WorkoutTablesWriter:
+    """
+    Writes the narrow workout tables built by processor.workouts in one
+    transaction, each with its own array-DML writer. Sessions already stored
+    (same user and workout id) are rejected by the primary key and their
+    samples are not written again.
+    """
+
+    def __init__(self, connection, batch_size=5000, binds=WORKOUT_TABLE_BINDS):
+        self.connection = connection
+        self.writers = {table: HealthDataWriter(connection, batch_size=batch_size, commit_every=None,
+                                                table=table, binds=table_binds)
+                        for table, table_binds in binds.items()}
+
+    def write(self, tables):
+        """
+        :param tables: {table: DataFrame}, workout_sessions first
+        :return: {table: writer report}
+        """
+        sessions = tables['workout_sessions'].drop_duplicates('workout_id', ignore_index=True)
+        reports = {'workout_sessions': self.writers['workout_sessions'].write(sessions)}
+        rejected = sessions['workout_id'].iloc[reports['workout_sessions']['rejected_rows']]
+        new_sessions = set(sessions['workout_id']) - set(rejected)
+
+        for table, df in tables.items():
+            if table == 'workout_sessions':
+                continue
+            # The same workout may come twice in one upload (e.g. overlapping exports in a zip)
+            df = df[df['workout_id'].isin(new_sessions)].drop_duplicates(ignore_index=True)
+            reports[table] = self.writers[table].write(df)
+        self.connection.commit()
+
+        logging.info(f"Wrote {len(new_sessions)} new workout sessions "
+                     f"({len(rejected)} already stored or rejected)")
+        return reports
@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from metrics import PASSWORD_HASH_SECONDS
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many password operations are already queued or running."""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification on a small dedicated thread pool.
+
+    bcrypt releases the GIL, so up to `workers` operations run in parallel
+    while the request threads that asked for them only wait. At most
+    `max_pending` operations are queued or running at once; further ones fail
+    fast with PasswordHasherBusy, so a burst of logins can't take every CPU
+    and request thread away from uploads. The time spent queued and the
+    time spent hashing are counted separately.
+    """
+
+    def __init__(self, bcrypt, rounds=12, workers=2, max_pending=32, timeout=10.0):
+        self._bcrypt = bcrypt
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {
+            'operations': 0,
+            'rejected': 0,
+            'timeouts': 0,
+            'queue_seconds_total': 0.0,
+            'queue_seconds_max': 0.0,
+            'hash_seconds_total': 0.0,
+            'hash_seconds_max': 0.0,
+        }
+
+    def _get_executor(self):
+        # Created on first use in each process; threads don't survive a fork
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='bcrypt')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _run(self, submitted, operation, fn, args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            finished = time.perf_counter()
+            PASSWORD_HASH_SECONDS.observe(started - submitted, operation=operation, phase='queue')
+            PASSWORD_HASH_SECONDS.observe(finished - started, operation=operation, phase='hash')
+            with self._lock:
+                stats = self._stats
+                stats['operations'] += 1
+                stats['queue_seconds_total'] += started - submitted
+                stats['queue_seconds_max'] = max(stats['queue_seconds_max'], started - submitted)
+                stats['hash_seconds_total'] += finished - started
+                stats['hash_seconds_max'] = max(stats['hash_seconds_max'], finished - started)
+
+    def submit(self, fn, *args, operation='other'):
+        """Queue fn(*args) on the pool and return its Future, or raise PasswordHasherBusy."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._stats['rejected'] += 1
+                raise PasswordHasherBusy("Too many password operations in progress")
+            self._pending += 1
+        try:
+            future = self._get_executor().submit(self._run, time.perf_counter(), operation, fn, args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def _result(self, future):
+        try:
+            return future.result(self.timeout)
+        except FutureTimeoutError:  # not the builtin TimeoutError before Python 3.11
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise PasswordHasherBusy("Password operation timed out")
+
+    def hash(self, password):
+        """bcrypt hash of a password, at the configured cost, as text."""
+        return self._result(self.submit(self._bcrypt.generate_password_hash, password, self.rounds,
+                                        operation='hash')).decode('utf-8')
+
+    def check(self, password_hash, password):
+        return self._result(self.submit(self._bcrypt.check_password_hash, password_hash, password,
+                                        operation='check'))
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = self._pending
+        operations = stats['operations']
+        stats['queue_seconds_avg'] = stats['queue_seconds_total'] / operations if operations else 0.0
+        stats['hash_seconds_avg'] = stats['hash_seconds_total'] / operations if operations else 0.0
+        stats.update({'workers': self.workers, 'max_pending': self.max_pending, 'rounds': self.rounds})
+        return stats
@@ -0,0 +1,64 @@
+import io
+
+
+class ArchiveLimitError(ValueError):
+    """Raised when an uploaded archive exceeds the configured size limits."""
+
+
+def is_export_member(info):
+    """JSON exports only; skips directories and macOS resource forks (__MACOSX/, ._*)."""
+    name = info.filename
+    base = name.rsplit('/', 1)[-1]
+    return (not info.is_dir() and name.endswith('.json')
+            and not name.startswith('__MACOSX/') and not base.startswith('._'))
+
+
+def json_members(zip_ref, max_members, max_uncompressed_bytes):
+    """
+    Return the JSON export members of an open ZipFile, in archive order, after
+    checking the member count and total uncompressed size against the limits.
+    """
+    infos = zip_ref.infolist()
+    if len(infos) > max_members:
+        raise ArchiveLimitError(f"Archive has {len(infos)} entries (limit {max_members})")
+
+    members = [info for info in infos if is_export_member(info)]
+    total = sum(info.file_size for info in members)
+    if total > max_uncompressed_bytes:
+        raise ArchiveLimitError(
+            f"Archive expands to {total} bytes (limit {max_uncompressed_bytes})")
+    return members
+
+
+class _BoundedReader(io.RawIOBase):
+    """Reads a zip member (or any decompressing stream) and fails if it inflates past `limit`."""
+
+    def __init__(self, member, limit, message="Archive member expands past its declared size"):
+        self._member = member
+        self._limit = limit
+        self._message = message
+        self._read = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        data = self._member.read(size)
+        self._read += len(data)
+        if self._read > self._limit:
+            raise ArchiveLimitError(self._message)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._member.close()
+        super().close()
+
+
+def open_member(zip_ref, info):
+    """Open a member for streaming decompression, bounded by its declared size."""
+    return _BoundedReader(zip_ref.open(info), info.file_size)
@@ -0,0 +1,100 @@
+# NumPy and pandas are imported when a frame is built, so workers ingesting through
+# processor.rows never load them
+from processor.columns import INSERT_COLUMNS
+
+# Columns stored as float64 arrays; everything else is an object column
+NUMERIC_COLUMNS = ('workout_qty', 'elevation_qty', 'value')
+
+
+class ColumnarBuilder:
+    """
+    Collects rows as column segments instead of one dict per sample.
+
+    Each segment (one metric, or one workout's stepCount series) holds a list
+    per varying column plus a single value for every constant column (user id,
+    type, units, metric name, ...). build() lays the segments out into typed
+    column arrays once, broadcasting the constants, and returns the frame.
+    """
+
+    def __init__(self, numeric_columns=NUMERIC_COLUMNS):
+        self.numeric_columns = numeric_columns
+        self._segments = []
+        self.row_count = 0
+
+    def add_segment(self, length, constants, columns):
+        """
+        :param length: number of rows in the segment
+        :param constants: column -> value repeated on every row
+        :param columns: column -> list of `length` values
+        """
+        if length:
+            self._segments.append((length, constants, columns))
+            self.row_count += length
+
+    def add_workouts(self, data, user_id):
+        """Add the stepCount series of every workout in an export."""
+        for workout in data['data'].get('workouts') or []:
+            steps = workout.get('stepCount') or []
+            elevation = workout.get('elevationUp') or {}
+            self.add_segment(len(steps), {
+                'health_data_user': user_id,
+                'type': 'workout',
+                'elevation_qty': elevation.get('qty', None),
+                'elevation_units': elevation.get('units', None),
+                'location': workout.get('location', None),
+            }, {
+                'date': [step.get('date') for step in steps],
+                'source': [step.get('source') for step in steps],
+                'workout_qty': [step.get('qty') for step in steps],
+                'workout_units': [step.get('units') for step in steps],
+            })
+
+    def add_metrics(self, data, user_id):
+        """Add the data series of every metric in an export."""
+        for metric in data['data'].get('metrics') or []:
+            entries = metric.get('data') or []
+            self.add_segment(len(entries), {
+                'health_data_user': user_id,
+                'type': 'metric',
+                'units': metric.get('units', None),
+                'metric_name': metric.get('name', None),
+            }, {
+                'date': [entry.get('date') for entry in entries],
+                'source': [entry.get('source', None) for entry in entries],
+                'value': [entry.get('qty') for entry in entries],
+            })
+
+    def _column(self, name):
+        import numpy as np
+
+        numeric = name in self.numeric_columns
+        array = np.full(self.row_count, np.nan if numeric else None,
+                        dtype=np.float64 if numeric else object)
+        start = 0
+        for length, constants, columns in self._segments:
+            end = start + length
+            if name in columns:
+                values = columns[name]
+                try:
+                    array[start:end] = values
+                except (TypeError, ValueError):
+                    # Non-numeric values in a numeric column: keep them as objects
+                    array = array.astype(object)
+                    array[start:end] = values
+            elif name in constants and constants[name] is not None:
+                array[start:end] = constants[name]
+            start = end
+        return array
+
+    def build(self, columns=INSERT_COLUMNS):
+        """Return a DataFrame with the given columns, in segment order."""
+        import pandas as pd
+
+        return pd.DataFrame({name: self._column(name) for name in columns})
+
+
+def records_frame(records, columns=INSERT_COLUMNS):
+    """A DataFrame of row tuples, e.g. the record batches of processor.streaming."""
+    import pandas as pd
+
+    return pd.DataFrame.from_records(records, columns=columns)
@@ -0,0 +1,23 @@
+# Column layouts shared by the processor and the database writers.
+
+WORKOUT_COLUMNS = ['health_data_user', 'type', 'date', 'source', 'workout_qty',
+                   'workout_units', 'elevation_qty', 'elevation_units', 'location']
+
+METRIC_COLUMNS = ['health_data_user', 'type', 'date', 'source', 'value',
+                  'units', 'metric_name']
+
+# Order of the columns in the health_data INSERT
+INSERT_COLUMNS = WORKOUT_COLUMNS + ['value', 'units', 'metric_name']
+
+# Narrow workout tables (WORKOUT_TABLES); frame columns are named after the table columns
+WORKOUT_SESSION_COLUMNS = ['user_id', 'workout_id', 'name', 'location', 'start_date', 'end_date',
+                           'duration', 'active_energy_qty', 'active_energy_units', 'distance_qty',
+                           'distance_units', 'elevation_up_qty', 'elevation_up_units', 'intensity_qty',
+                           'intensity_units', 'humidity_qty', 'humidity_units', 'temperature_qty',
+                           'temperature_units']
+
+WORKOUT_QUANTITY_COLUMNS = ['user_id', 'workout_id', 'series', 'recorded_date', 'qty', 'units',
+                            'source']
+
+WORKOUT_HEART_RATE_COLUMNS = ['user_id', 'workout_id', 'series', 'recorded_date', 'bpm_min',
+                              'bpm_avg', 'bpm_max', 'source']
@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+
+from processor.incremental import series_keys
+from processor.timestamps import sample_times
+
+# Quantities summed per bucket; every other column is constant within a series
+SUM_COLUMNS = ('workout_qty', 'value')
+SERIES_COLUMNS = ('health_data_user', 'type', 'source', 'workout_units', 'elevation_qty',
+                  'elevation_units', 'location', 'units', 'metric_name')
+
+
+def parse_resolution(spec):
+    """'raw' (or empty) -> None, otherwise a bucket width such as '10s', '1min', '5min' in seconds."""
+    if not spec or spec == 'raw':
+        return None
+    seconds = pd.Timedelta(spec).total_seconds()
+    if seconds <= 0:
+        raise ValueError(f"Invalid downsampling resolution: {spec}")
+    return seconds
+
+
+def parse_overrides(spec):
+    """Parse 'step_count=1min,heart_rate=raw' into {series: resolution}."""
+    overrides = {}
+    for item in (spec or '').split(','):
+        if item.strip():
+            series, _, resolution = item.partition('=')
+            overrides[series.strip()] = resolution.strip()
+    return overrides
+
+
+class Downsampler:
+    """
+    Ingest-time rollup of high-frequency series into fixed time buckets.
+
+    `resolution` applies to workout stepCount series; metrics are only rolled
+    up when named in `overrides` (series -> resolution, the series being the
+    metric name or 'workout'). Quantities are summed, so only additive
+    metrics such as step_count should be listed. Each bucket becomes one row
+    dated with its first sample, with the last sample's date in `date_end`,
+    the number of samples in `samples` and the smallest and largest sample
+    quantity in `sample_min` / `sample_max`. Buckets are aligned on UTC.
+
+    Buckets are formed within each frame, so in streaming mode a bucket that
+    straddles two batches is written as two rows.
+    """
+
+    def __init__(self, resolution='raw', overrides=None):
+        self.default = parse_resolution(resolution)
+        self.overrides = {series: parse_resolution(spec) for series, spec in (overrides or {}).items()}
+        self.samples = 0
+        self.rows = 0
+
+    @property
+    def enabled(self):
+        return self.default is not None or any(self.overrides.values())
+
+    def resolutions(self, df):
+        """Bucket width in seconds of every row (NaN for raw)."""
+        series = series_keys(df)
+        default = np.where(df['type'] == 'workout', self.default or np.nan, np.nan)
+        if not self.overrides:
+            return default
+        override = series.map(self.overrides).astype('float64').to_numpy()
+        return np.where(series.isin(list(self.overrides)).to_numpy(), override, default)
+
+    def apply(self, df):
+        """Return `df` with the selected series rolled up; other rows are unchanged."""
+        self.samples += len(df)
+        if df.empty or not self.enabled:
+            self.rows += len(df)
+            return df
+
+        resolution = self.resolutions(df)
+        times = sample_times(df)
+        epoch = (times - pd.Timestamp(0, tz='UTC')).dt.total_seconds().to_numpy()
+        rollup = ~np.isnan(resolution) & ~np.isnan(epoch)
+        if not rollup.any():
+            self.rows += len(df)
+            return df
+
+        # Value of metric rows, workout_qty of workout rows
+        quantity = pd.to_numeric(df['value'].where(df['type'] == 'metric', df['workout_qty']),
+                                 errors='coerce').to_numpy()
+        selected = df[rollup].assign(
+            _quantity=quantity[rollup],
+            _position=np.flatnonzero(rollup),
+            _resolution=resolution[rollup],
+            _bucket=np.floor(epoch[rollup] / resolution[rollup]),
+            _epoch=epoch[rollup])
+        groups = selected.groupby(list(SERIES_COLUMNS) + ['_resolution', '_bucket'],
+                                  dropna=False, sort=False)
+
+        first = selected.loc[groups['_epoch'].idxmin()].reset_index(drop=True)
+        last = selected.loc[groups['_epoch'].idxmax()].reset_index(drop=True)
+        sums = groups[list(SUM_COLUMNS)].sum(min_count=1).reset_index(drop=True)
+        rolled = first.assign(
+            date_end=last['date'].to_numpy(),
+            samples=groups.size().to_numpy(),
+            sample_min=groups['_quantity'].min().to_numpy(),
+            sample_max=groups['_quantity'].max().to_numpy(),
+            _position=groups['_position'].min().to_numpy(),
+            **{column: sums[column].to_numpy() for column in SUM_COLUMNS})
+
+        kept = df[~rollup].assign(date_end=None, samples=1, sample_min=quantity[~rollup],
+                                  sample_max=quantity[~rollup], _position=np.flatnonzero(~rollup))
+        result = (pd.concat([kept, rolled[kept.columns]], ignore_index=True)
+                  .sort_values('_position', kind='stable')
+                  .drop(columns='_position')
+                  .reset_index(drop=True))
+        self.rows += len(result)
+        return result
+
+    def report(self):
+        return {'samples': self.samples, 'rows': self.rows,
+                'reduction': round(1 - self.rows / self.samples, 4) if self.samples else 0.0}
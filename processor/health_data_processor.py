@@ -1,92 +1,323 @@
 import os
 import json
-import pandas as pd
+from contextlib import contextmanager, nullcontext
+
+from metrics import INGEST_ROWS, INGEST_STAGE_SECONDS
+from processor.archive import open_member
+from processor.columnar import ColumnarBuilder, records_frame
+from processor.columns import METRIC_COLUMNS, WORKOUT_COLUMNS
+from processor.incremental import content_digest, file_digest
+from processor.parallel import ordered_map, parse_export, parse_export_file
+from processor.rows import RowBuilder
+from processor.streaming import (DEFAULT_BATCH_SIZE, MAX_VALUE_SIZE, iter_record_batches,
+                                 iter_workouts)
+from processor.workouts import WORKOUT_TABLES, WorkoutTablesBuilder
 
 
 class HealthDataProcessor:
-    def __init__(self, input_dir):
+    def __init__(self, input_dir=None, ingest_filter=None, workout_tables=False,
+                 native_timestamps=False, rows=False):
+        """
+        :param ingest_filter: optional IngestFilter; files it has already seen are
+            skipped and samples at or before its watermarks are dropped
+        :param workout_tables: collect workouts into the narrow workout tables
+            (see take_workout_tables) instead of health_data rows
+        :param native_timestamps: add the UTC recorded_at and utc_offset columns
+            parsed from each sample's date (see processor.timestamps)
+        :param rows: produce lists of tuples in INSERT_COLUMNS order instead of
+            DataFrames (see processor.rows), for HealthDataWriter.write_rows();
+            pandas is then not used. Workout tables and native timestamps need
+            DataFrames.
+        """
+        if rows and (workout_tables or native_timestamps):
+            raise ValueError("Row ingest can't collect workout tables or native timestamps")
         self.input_dir = input_dir
+        self.ingest_filter = ingest_filter
+        self.workout_builder = WorkoutTablesBuilder() if workout_tables else None
+        self.workout_frames = []
+        self.native_timestamps = native_timestamps
+        self.rows = rows
         self.dataframes = []
 
+    def new_builder(self):
+        return RowBuilder() if self.rows else ColumnarBuilder()
+
     def process_files(self, user_id):
         """
         Process each JSON file in the extracted directory and associate with the provided user_id.
+        All files are collected into one columnar builder and laid out once.
         """
+        builder = self.new_builder()
         # Process each JSON file in the extracted directory
         for file_name in os.listdir(self.input_dir):
             if file_name.endswith('.json'):
                 file_path = os.path.join(self.input_dir, file_name)
                 # Use the passed user_id instead of extracting from file name
-                self.process_file(file_path, user_id)
+                self.load_file(builder, file_path, user_id)
 
-        # Combine all dataframes into one
-        combined_df = pd.concat(self.dataframes, ignore_index=True)
-        return combined_df
+        return self.build(builder)
 
     def process_file(self, file_path, user_id):
-        # Load the JSON file
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+        """
+        Process a single JSON export into a DataFrame with the INSERT_COLUMNS layout
+        (workout rows first, then metric rows).
+        """
+        builder = self.new_builder()
+        self.load_file(builder, file_path, user_id)
 
-        # Check if both workouts and metrics exist and process accordingly
-        if 'workouts' in data['data'] and data['data']['workouts']:
-            workout_data = self.flatten_workouts(data, user_id)
-        else:
-            workout_data = pd.DataFrame()  # Create an empty dataframe if no workouts are present
+        return self.build(builder)
 
-        if 'metrics' in data['data'] and data['data']['metrics']:
-            metrics_data = self.flatten_metrics(data, user_id)
-        else:
-            metrics_data = pd.DataFrame()  # Create an empty dataframe if no metrics are present
+    def process_stream(self, stream, user_id):
+        """Process a JSON export read from an open (binary or text) stream."""
+        builder = self.new_builder()
+        self.load_stream(builder, stream, user_id)
 
-        # Combine the flattened data and ensure both workouts and metrics exist
-        if workout_data.empty:
-            workout_data = pd.DataFrame(columns=['health_data_user', 'type', 'date', 'source', 'workout_qty',
-                                                 'workout_units', 'elevation_qty', 'elevation_units', 'location'])
+        return self.build(builder)
 
-        if metrics_data.empty:
-            metrics_data = pd.DataFrame(columns=['health_data_user', 'type', 'date', 'source', 'value',
-                                                 'units', 'metric_name'])
+    def process_archive(self, zip_ref, members, user_id):
+        """
+        Process the given JSON members of an open ZipFile. Members are
+        decompressed straight from the archive; nothing is written to disk.
+        """
+        builder = self.new_builder()
+        for info in members:
+            with open_member(zip_ref, info) as f:
+                self.load_stream(builder, f, user_id, info.filename)
 
-        combined_df = pd.concat([workout_data, metrics_data], ignore_index=True)
-        self.dataframes.append(combined_df)
+        return self.build(builder)
 
+    def build(self, builder):
+        with INGEST_STAGE_SECONDS.time(stage='build'):
+            df = builder.build()
+        combined_df = self.prepare(df)
+        self.dataframes.append(combined_df)
         return combined_df
 
+    def prepare(self, df):
+        """
+        Ingest stages applied to every frame (or list of rows): timestamp
+        parsing, then the ingest filter.
+        """
+        INGEST_ROWS.inc(len(df), outcome='parsed')
+        with INGEST_STAGE_SECONDS.time(stage='prepare'):
+            if self.rows:
+                return df if self.ingest_filter is None else self.ingest_filter.filter_rows(df)
+            if self.native_timestamps:
+                from processor.timestamps import add_timestamp_columns
+                df = add_timestamp_columns(df)
+            if self.ingest_filter is not None:
+                df = self.ingest_filter.filter(df)
+        return df
+
+    def load_file(self, builder, file_path, user_id):
+        """Load a JSON export and add its workouts and metrics to the builder."""
+        with open(file_path, 'r') as f:
+            self.load_stream(builder, f, user_id, file_path)
+
+    def load_stream(self, builder, stream, user_id, name=None):
+        with INGEST_STAGE_SECONDS.time(stage='parse'):
+            if self.ingest_filter is None:
+                data = json.load(stream)
+            else:
+                # json.load reads the whole stream anyway; hash the same bytes
+                raw = stream.read()
+                if not self.ingest_filter.accept_file(content_digest(raw), name):
+                    return
+                data = json.loads(raw)
+        with INGEST_STAGE_SECONDS.time(stage='flatten'):
+            if self.workout_builder is not None:
+                self.workout_builder.add_workouts(data, user_id)
+            else:
+                builder.add_workouts(data, user_id)
+            builder.add_metrics(data, user_id)
+
+    def take_workout_tables(self):
+        """
+        Return {table: DataFrame} for the workouts collected so far with
+        workout_tables=True, and start collecting anew.
+        """
+        import pandas as pd
+
+        frames = self.workout_frames
+        if self.workout_builder.row_count or not frames:
+            frames.append(self.workout_builder.build())
+        self.workout_builder = WorkoutTablesBuilder()
+        self.workout_frames = []
+        return {table: pd.concat([tables[table] for tables in frames], ignore_index=True)
+                for table in WORKOUT_TABLES}
+
+    def process_files_parallel(self, user_id, workers=2, executor='process'):
+        """
+        Parallel counterpart of process_files: the JSON files of the input
+        directory are parsed on a pool of `workers` processes (or threads) and
+        one DataFrame per file is yielded, in file name order, as soon as that
+        file and the ones before it are parsed.
+        """
+        paths = [os.path.join(self.input_dir, file_name)
+                 for file_name in sorted(os.listdir(self.input_dir)) if file_name.endswith('.json')]
+        seen_files = self.seen_files()
+        results = ordered_map(executor, workers, parse_export_file,
+                              ((path, user_id, seen_files, self.workout_builder is not None, self.rows)
+                               for path in paths))
+        yield from self.accept_parsed(zip(paths, results))
+
+    def process_archive_parallel(self, zip_ref, members, user_id, workers=2, executor='process'):
+        """
+        Parallel counterpart of process_archive, yielding one DataFrame per
+        member in archive order. Members are decompressed here and parsed on
+        the pool; only a few are held in memory at a time.
+        """
+        def read(info):
+            with open_member(zip_ref, info) as f:
+                return f.read()
+
+        seen_files = self.seen_files()
+        results = ordered_map(executor, workers, parse_export,
+                              ((read(info), user_id, seen_files, self.workout_builder is not None,
+                                self.rows) for info in members))
+        yield from self.accept_parsed(zip((info.filename for info in members), results))
+
+    def seen_files(self):
+        # Snapshot handed to the workers so that known exports are not parsed
+        return frozenset(self.ingest_filter.seen_files) if self.ingest_filter is not None else None
+
+    def accept_parsed(self, results):
+        # Workers parse, flatten and lay out each export; here that shows as the wait for it
+        for name, (digest, df, workouts) in INGEST_STAGE_SECONDS.time_iter(results, stage='parse'):
+            if self.ingest_filter is not None:
+                if df is None:
+                    # Known export, skipped by the worker without parsing
+                    self.ingest_filter.skipped_files += 1
+                    continue
+                if not self.ingest_filter.accept_file(digest, name):
+                    continue
+            df = self.prepare(df)
+            if workouts is not None:
+                self.workout_frames.append(workouts)
+            self.dataframes.append(df)
+            yield df
+
+    def process_files_streaming(self, user_id, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Streaming counterpart of process_files: yield DataFrames of at most
+        batch_size rows for every JSON file in the input directory.
+        """
+        for file_name in os.listdir(self.input_dir):
+            if file_name.endswith('.json'):
+                file_path = os.path.join(self.input_dir, file_name)
+                yield from self.process_file_streaming(file_path, user_id, batch_size)
+
+    def process_file_streaming(self, file_path, user_id, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Streaming counterpart of process_file: the file is read incrementally
+        and never loaded whole, so memory is bounded by batch_size.
+        """
+        return self.iter_batches(lambda: open(file_path, 'rb'), user_id, batch_size, name=file_path)
+
+    def process_stream_streaming(self, stream, user_id, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Streaming counterpart of process_stream. The stream is rewound for the
+        header pass, so it must be seekable; it is not closed.
+        """
+        @contextmanager
+        def rewound():
+            stream.seek(0)
+            yield stream
+
+        return self.iter_batches(rewound, user_id, batch_size)
+
+    def process_stream_single_pass(self, stream, user_id, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Streaming parse of a JSON export read once, front to back, e.g. a request
+        body as it arrives. Samples are held back only until their object's
+        name and units have been read. Exports can't be hashed ahead of
+        parsing, so only the ingest filter's watermarks apply.
+        """
+        return self.iter_batches(lambda: nullcontext(stream), user_id, batch_size, two_pass=False)
+
+    def process_ndjson_stream(self, stream, user_id, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Yield DataFrames of about batch_size rows from a binary stream of
+        newline-delimited JSON exports, one export document per line. Memory is
+        bounded by the batch plus the longest line.
+        """
+        builder = self.new_builder()
+        for number, line in enumerate(iter(lambda: stream.readline(MAX_VALUE_SIZE + 1), b''), 1):
+            if len(line) > MAX_VALUE_SIZE:
+                raise ValueError(f"Invalid NDJSON export: line {number} is longer than {MAX_VALUE_SIZE} bytes")
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            if not isinstance(data, dict) or not isinstance(data.get('data'), dict):
+                raise ValueError(f"Invalid NDJSON export: line {number} is not an export document")
+            if self.workout_builder is not None:
+                self.workout_builder.add_workouts(data, user_id)
+            else:
+                builder.add_workouts(data, user_id)
+            builder.add_metrics(data, user_id)
+            if builder.row_count >= batch_size:
+                df = self.prepare(builder.build())
+                builder = self.new_builder()
+                if len(df):
+                    yield df
+        if builder.row_count:
+            df = self.prepare(builder.build())
+            if len(df):
+                yield df
+
+    def process_archive_streaming(self, zip_ref, members, user_id, batch_size=DEFAULT_BATCH_SIZE):
+        """Streaming counterpart of process_archive."""
+        for info in members:
+            yield from self.iter_batches(lambda: open_member(zip_ref, info), user_id, batch_size,
+                                         name=info.filename)
+
+    def iter_batches(self, open_stream, user_id, batch_size=DEFAULT_BATCH_SIZE, two_pass=True,
+                     name=None):
+        """
+        Yield DataFrames (INSERT_COLUMNS layout) of at most batch_size rows from
+        the export returned by open_stream(). See iter_record_batches.
+        """
+        # A single-pass source can't be hashed ahead of parsing; only the watermarks apply
+        if self.ingest_filter is not None and two_pass:
+            with open_stream() as f:
+                if not self.ingest_filter.accept_file(file_digest(f), name):
+                    return
+
+        # Workout tables take another pass over a seekable source; a single-pass source hands
+        # each workout object to the builder as it is decoded
+        workout_tables = self.workout_builder is not None and two_pass
+        on_workout = None
+        if self.workout_builder is not None and not two_pass:
+            def on_workout(workout):
+                self.workout_builder.add_workout(workout, user_id)
+        sections = ('metrics',) if workout_tables else ('metrics', 'workouts')
+        # Decoding and flattening are interleaved here, so each batch counts as parse time
+        batches = iter_record_batches(open_stream, user_id, batch_size, two_pass, sections, on_workout)
+        for batch in INGEST_STAGE_SECONDS.time_iter(batches, stage='parse'):
+            if self.rows:
+                # The records are already the rows to bind
+                df = batch
+            else:
+                with INGEST_STAGE_SECONDS.time(stage='build'):
+                    df = records_frame(batch)
+            df = self.prepare(df)
+            if not len(df):
+                continue
+            yield df
+
+        if workout_tables:
+            with open_stream() as f:
+                for workout in iter_workouts(f):
+                    self.workout_builder.add_workout(workout, user_id)
 
     def flatten_workouts(self, data, user_id):
         """ Flatten the workout data from the JSON file """
-        flattened_workout_data = []
-        for workout in data['data'].get('workouts', []):
-            elevation = workout.get('elevationUp', {})
-            for step in workout.get('stepCount', []):
-                flattened_workout_data.append({
-                    'health_data_user': user_id,
-                    'type': 'workout',
-                    'date': step.get('date'),
-                    'source': step.get('source'),
-                    'workout_qty': step.get('qty'),
-                    'workout_units': step.get('units'),
-                    'elevation_qty': elevation.get('qty', None),
-                    'elevation_units': elevation.get('units', None),
-                    'location': workout.get('location', None)
-                })
-        return pd.DataFrame(flattened_workout_data)
-
+        builder = ColumnarBuilder()
+        builder.add_workouts(data, user_id)
+        return builder.build(WORKOUT_COLUMNS)
 
     def flatten_metrics(self, data, user_id):
-        flattened_metrics_data = []
-        for metric in data['data'].get('metrics', []):
-            name = metric.get('name', None)
-            units = metric.get('units', None)
-            for entry in metric.get('data', []):
-                flattened_metrics_data.append({
-                    'health_data_user': user_id,
-                    'type': 'metric',
-                    'date': entry.get('date'),
-                    'source': entry.get('source', None),
-                    'value': entry.get('qty'),
-                    'units': units,
-                    'metric_name': name
-                })
-        return pd.DataFrame(flattened_metrics_data)
+        """ Flatten the metrics data from the JSON file """
+        builder = ColumnarBuilder()
+        builder.add_metrics(data, user_id)
+        return builder.build(METRIC_COLUMNS)
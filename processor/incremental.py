@@ -0,0 +1,127 @@
+import hashlib
+
+from processor.columns import INSERT_COLUMNS
+from processor.rows import row_time, series_key
+
+
+def file_digest(stream, chunk_size=1 << 20):
+    """SHA-256 hex digest of everything left in a binary or text stream."""
+    digest = hashlib.sha256()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return digest.hexdigest()
+        digest.update(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+
+
+def content_digest(data):
+    """SHA-256 hex digest of an export already read into memory."""
+    return hashlib.sha256(data.encode('utf-8') if isinstance(data, str) else data).hexdigest()
+
+
+def series_keys(df):
+    """Watermark series of each row: the metric name, or the row type for workouts."""
+    return df['metric_name'].where(df['type'] == 'metric').fillna(df['type'])
+
+
+class IngestFilter:
+    """
+    Incremental ingest state of one user.
+
+    `seen_files` holds the content digests of exports already ingested and
+    `watermarks` maps each series (see series_keys) to the UTC time of the
+    newest sample stored. Files already seen are skipped and samples at or
+    before their series' watermark are dropped, so re-uploading an
+    overlapping export window only writes the new samples.
+
+    The watermarks are not moved while an upload is processed; the files
+    accepted and the newest sample times are collected in `new_files` and
+    `high_water` and persisted by the caller once the rows are saved. Within
+    the upload, a row identical to one already accepted (e.g. from another
+    export whose window overlaps) is dropped too; `upload_rows` holds a hash
+    of every row accepted so far.
+    """
+
+    def __init__(self, seen_files=(), watermarks=None):
+        self.seen_files = set(seen_files)
+        self.watermarks = dict(watermarks or {})
+        self.new_files = []
+        self.high_water = {}
+        self.upload_rows = set()
+        self.skipped_files = 0
+        self.dropped_rows = 0
+
+    def accept_file(self, digest, name=None):
+        """Return False if the export was already ingested, otherwise record it."""
+        if digest in self.seen_files:
+            self.skipped_files += 1
+            return False
+        self.seen_files.add(digest)
+        self.new_files.append((digest, name))
+        return True
+
+    def filter(self, df):
+        """Return the rows of `df` newer than their series' watermark."""
+        import numpy as np
+        import pandas as pd
+
+        from processor.timestamps import sample_times
+
+        if df.empty:
+            return df
+
+        times = sample_times(df)
+        series = series_keys(df)
+
+        for key, newest in times.groupby(series).max().items():
+            if pd.notna(newest) and (key not in self.high_water or newest > self.high_water[key]):
+                self.high_water[key] = newest
+
+        stale = np.zeros(len(df), dtype=bool)
+        if self.watermarks:
+            marks = pd.to_datetime(series.map(self.watermarks), utc=True)
+            # Rows without a parseable date or a watermark compare False and are kept
+            stale = (times <= marks).to_numpy()
+
+        # Rows already accepted earlier in this upload (or earlier in this frame)
+        hashes = pd.util.hash_pandas_object(df[INSERT_COLUMNS], index=False)
+        repeated = (hashes.duplicated() | hashes.isin(self.upload_rows)).to_numpy() & ~stale
+        self.upload_rows.update(hashes[~stale & ~repeated].tolist())
+
+        dropped = stale | repeated
+        if not dropped.any():
+            return df
+        self.dropped_rows += int(np.count_nonzero(dropped))
+        return df[~dropped].reset_index(drop=True)
+
+    def filter_rows(self, rows):
+        """Row counterpart of filter() for tuples in INSERT_COLUMNS order (see processor.rows)."""
+        kept = []
+        for row in rows:
+            newest = row_time(row)
+            if newest is not None:
+                key = series_key(row)
+                if key not in self.high_water or newest > self.high_water[key]:
+                    self.high_water[key] = newest
+                mark = self.watermarks.get(key)
+                if mark is not None and newest <= mark:
+                    self.dropped_rows += 1
+                    continue
+            if self._repeated(row):
+                continue
+            kept.append(row)
+        return kept
+
+    def _repeated(self, row):
+        # Row identical to one accepted earlier in this upload
+        digest = hash(row)
+        if digest in self.upload_rows:
+            self.dropped_rows += 1
+            return True
+        self.upload_rows.add(digest)
+        return False
+
+    def advanced_watermarks(self):
+        """Series whose newest sample in this upload is past the stored watermark."""
+        return {key: newest for key, newest in self.high_water.items()
+                if key not in self.watermarks or newest > self.watermarks[key]}
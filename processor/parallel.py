@@ -0,0 +1,113 @@
+import json
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from processor.columnar import ColumnarBuilder
+from processor.incremental import content_digest
+from processor.rows import RowBuilder
+from processor.workouts import WorkoutTablesBuilder
+
+EXECUTORS = ('process', 'thread')
+
+_executors = {}
+_executors_pid = None
+_executors_lock = threading.Lock()
+
+
+def parse_export(raw, user_id, seen_files=None, workout_tables=False, rows=False):
+    """
+    Parse one JSON export (bytes or str) into an INSERT_COLUMNS frame (a list
+    of row tuples with `rows`), and with `workout_tables` its workouts into
+    the workout tables instead.
+
+    With `seen_files` (a set of content digests) the export is hashed first
+    and not parsed if already seen.
+    :return: (digest or None, DataFrame or None when skipped, {table: DataFrame} or None)
+    """
+    digest = None
+    if seen_files is not None:
+        digest = content_digest(raw)
+        if digest in seen_files:
+            return digest, None, None
+    data = json.loads(raw)
+    builder = RowBuilder() if rows else ColumnarBuilder()
+    workouts = None
+    if workout_tables:
+        workout_builder = WorkoutTablesBuilder()
+        workout_builder.add_workouts(data, user_id)
+        workouts = workout_builder.build()
+    else:
+        builder.add_workouts(data, user_id)
+    builder.add_metrics(data, user_id)
+    return digest, builder.build(), workouts
+
+
+def parse_export_file(path, user_id, seen_files=None, workout_tables=False, rows=False):
+    """parse_export for a file read in the worker itself."""
+    with open(path, 'rb') as f:
+        return parse_export(f.read(), user_id, seen_files, workout_tables, rows)
+
+
+def get_executor(kind, workers):
+    """
+    Return the shared executor of this process for `kind` ('process' or
+    'thread') and pool size. Pools are created on first use after a fork, and
+    worker processes are started from a fork server rather than forked from
+    the (threaded) web process.
+    """
+    global _executors_pid
+    if kind not in EXECUTORS:
+        raise ValueError(f"Unknown executor: {kind}")
+    with _executors_lock:
+        if _executors_pid != os.getpid():
+            _executors.clear()
+            _executors_pid = os.getpid()
+        key = (kind, workers)
+        if key not in _executors:
+            if kind == 'process':
+                context = None
+                if 'forkserver' in multiprocessing.get_all_start_methods():
+                    context = multiprocessing.get_context('forkserver')
+                _executors[key] = ProcessPoolExecutor(workers, mp_context=context)
+            else:
+                _executors[key] = ThreadPoolExecutor(workers, thread_name_prefix='parse')
+        return _executors[key]
+
+
+def shutdown_executors():
+    with _executors_lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        _executors.clear()
+
+
+def ordered_map(kind, workers, fn, argument_lists, max_pending=None):
+    """
+    Run fn(*args) for every argument tuple on the shared executor and yield the
+    results in input order, each as soon as it and all earlier ones are done.
+    At most `max_pending` calls (default 2 per worker) are in flight, so
+    arguments are only produced as the consumer keeps up.
+    """
+    executor = get_executor(kind, workers)
+    max_pending = max_pending or 2 * workers
+    pending = deque()
+    arguments = iter(argument_lists)
+    try:
+        for args in arguments:
+            pending.append(executor.submit(fn, *args))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a fresh pool next time
+        with _executors_lock:
+            _executors.pop((kind, workers), None)
+        raise
+    finally:
+        for future in pending:
+            future.cancel()
@@ -0,0 +1,54 @@
+import gzip
+import io
+import zlib
+
+from processor.archive import _BoundedReader
+
+try:
+    import zstandard
+except ImportError:  # optional; zstd bodies are refused without it
+    zstandard = None
+
+# Request body media types accepted by the push endpoint
+MEDIA_TYPES = {
+    'application/json': 'json_body',
+    'application/x-ndjson': 'ndjson',
+    'application/ndjson': 'ndjson',
+}
+
+# Errors raised while inflating a corrupt body
+DECODE_ERRORS = (gzip.BadGzipFile, zlib.error, EOFError) + (
+    (zstandard.ZstdError,) if zstandard is not None else ())
+
+
+class UnsupportedEncoding(ValueError):
+    """Raised for a Content-Encoding the push endpoint cannot decode."""
+
+
+def supported_encodings():
+    return ['identity', 'gzip'] + (['zstd'] if zstandard is not None else [])
+
+
+def limit_body(stream, max_bytes):
+    """Wrap a request body as sent so reading fails with ArchiveLimitError past `max_bytes`."""
+    return _BoundedReader(stream, max_bytes, f"Request body is larger than {max_bytes} bytes")
+
+
+def open_body(stream, encoding, max_bytes, buffer_size=64 * 1024):
+    """
+    Wrap a request body to decode its Content-Encoding as it is read. Nothing
+    is buffered beyond one chunk, and reading fails with ArchiveLimitError
+    once more than `max_bytes` have been decoded.
+    """
+    encoding = (encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        decoded = stream
+    elif encoding in ('gzip', 'x-gzip'):
+        decoded = gzip.GzipFile(fileobj=stream, mode='rb')
+    elif encoding == 'zstd' and zstandard is not None:
+        decoded = zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True)
+    else:
+        raise UnsupportedEncoding(
+            f"Content-Encoding must be one of {', '.join(supported_encodings())}")
+    bounded = _BoundedReader(decoded, max_bytes, f"Request body expands past {max_bytes} bytes")
+    return io.BufferedReader(bounded, buffer_size)
@@ -0,0 +1,73 @@
+import datetime
+
+from processor.columns import INSERT_COLUMNS
+from processor.streaming import make_record
+
+_TYPE = INSERT_COLUMNS.index('type')
+_DATE = INSERT_COLUMNS.index('date')
+_METRIC_NAME = INSERT_COLUMNS.index('metric_name')
+
+
+class RowBuilder:
+    """
+    Drop-in for ColumnarBuilder that keeps rows as plain tuples in
+    INSERT_COLUMNS order, the layout HealthDataWriter.write_rows() binds, so
+    an upload goes from the parser to executemany without pandas or NumPy.
+    Rows are in the same order (workout rows first, then metric rows), and
+    values are kept as decoded from the export.
+    """
+
+    def __init__(self):
+        self.rows = []
+
+    @property
+    def row_count(self):
+        return len(self.rows)
+
+    def add_workouts(self, data, user_id):
+        """Add the stepCount series of every workout in an export."""
+        for workout in data['data'].get('workouts') or []:
+            self.rows.extend(make_record('workout', workout, step, user_id)
+                             for step in workout.get('stepCount') or [])
+
+    def add_metrics(self, data, user_id):
+        """Add the data series of every metric in an export."""
+        for metric in data['data'].get('metrics') or []:
+            self.rows.extend(make_record('metric', metric, entry, user_id)
+                             for entry in metric.get('data') or [])
+
+    def build(self):
+        return self.rows
+
+
+def series_key(row):
+    """Watermark series of a row: the metric name, or the row type for workouts."""
+    if row[_TYPE] == 'metric' and row[_METRIC_NAME] is not None:
+        return row[_METRIC_NAME]
+    return row[_TYPE]
+
+
+def parse_sample_time(value):
+    """
+    UTC time of an export timestamp, e.g. "2024-08-27 00:00:00 +0200", or
+    None if it can't be parsed. Other ISO 8601 forms are accepted too; times
+    without an offset are taken as UTC.
+    """
+    if not isinstance(value, str):
+        return None
+    try:
+        if len(value) == 25 and value[19] == ' ':
+            # The export format; fromisoformat only takes a "+0200" offset from Python 3.11
+            time = datetime.datetime.strptime(value, '%Y-%m-%d %H:%M:%S %z')
+        else:
+            time = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if time.tzinfo is None:
+        return time.replace(tzinfo=datetime.timezone.utc)
+    return time.astimezone(datetime.timezone.utc)
+
+
+def row_time(row):
+    """UTC time of a row's sample (see parse_sample_time)."""
+    return parse_sample_time(row[_DATE])
@@ -0,0 +1,273 @@
+import codecs
+import json
+import re
+
+DEFAULT_BATCH_SIZE = 5000
+
+# Largest single value decoded with JsonReader.value(); stops a malformed file
+# from being buffered to the end while looking for a closing quote or bracket
+MAX_VALUE_SIZE = 16 * 1024 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_NUMBER_TAIL = re.compile(r'[0-9eE.+\-]*')
+
+# Fields read from each metric / workout object, and the key holding its samples
+METRIC_HEADER_KEYS = ('name', 'units')
+WORKOUT_HEADER_KEYS = ('location', 'elevationUp')
+SECTIONS = {
+    'metrics': ('metric', 'data', METRIC_HEADER_KEYS),
+    'workouts': ('workout', 'stepCount', WORKOUT_HEADER_KEYS),
+}
+
+
+class JsonReader:
+    """
+    Pull-style reader over a JSON document that never holds more than one
+    chunk plus the value being decoded in memory. Containers are walked with
+    iter_object()/iter_array(); leaves and small sub-documents are decoded
+    with value().
+    """
+
+    def __init__(self, stream, chunk_size=64 * 1024):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.eof:
+            return False
+        raw = self._stream.read(self._chunk_size)
+        if isinstance(raw, bytes):
+            text = self._decoder.decode(raw, final=not raw)
+        else:
+            text = raw
+        if not raw:
+            self.eof = True
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def _error(self, message):
+        return ValueError(f"Invalid JSON export: {message}")
+
+    def peek(self):
+        """Skip whitespace and return the next character ('' at end of input)."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise self._error(f"expected '{char}'")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if len(self.buf) - self.pos < MAX_VALUE_SIZE and self._fill():
+                    continue
+                raise
+            # A number at the very end of the buffer may continue in the next chunk
+            if _NUMBER_TAIL.fullmatch(self.buf, end) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def iter_object(self):
+        """Yield each key of the object at the cursor; the caller consumes the value."""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise self._error("expected an object key")
+            key = self.value()
+            self.expect(':')
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == '}':
+                return
+            if char != ',':
+                raise self._error("expected ',' or '}'")
+
+    def iter_array(self):
+        """Yield once per element of the array at the cursor; the caller consumes it."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield
+            char = self.peek()
+            self.pos += 1
+            if char == ']':
+                return
+            if char != ',':
+                raise self._error("expected ',' or ']'")
+
+    def skip(self):
+        """
+        Skip the next value. Arrays and objects are walked one level deep and
+        their members decoded one at a time, so a large array of samples is
+        never built as a whole.
+        """
+        char = self.peek()
+        if char == '[':
+            for _ in self.iter_array():
+                self.value()
+        elif char == '{':
+            for _ in self.iter_object():
+                self.value()
+        else:
+            self.value()
+
+
+def walk_export(reader, want_samples=True, sections=tuple(SECTIONS), on_workout=None):
+    """
+    Walk data.metrics[*] and data.workouts[*] (or only the given `sections`)
+    of a Health Auto Export document.
+
+    Yields ('sample', kind, index, header, sample) for each entry of
+    metrics[*].data / workouts[*].stepCount, and ('end', kind, index, header,
+    None) once an object has been read. `header` holds the fields seen so far
+    for the current object, so it may still be incomplete for a sample. With
+    `on_workout`, each workout object is instead decoded whole (as by
+    iter_workouts) and passed to it.
+    """
+    for key in reader.iter_object():
+        if key != 'data' or reader.peek() != '{':
+            reader.skip()
+            continue
+        for section in reader.iter_object():
+            if section not in sections or reader.peek() != '[':
+                reader.skip()
+                continue
+            if section == 'workouts' and on_workout is not None:
+                for _ in reader.iter_array():
+                    workout = reader.value()
+                    if isinstance(workout, dict):
+                        on_workout(workout)
+                continue
+            kind, series_key, header_keys = SECTIONS[section]
+            for index, _ in enumerate(reader.iter_array()):
+                if reader.peek() != '{':
+                    reader.skip()
+                    continue
+                header = {}
+                for field in reader.iter_object():
+                    if field == series_key and want_samples and reader.peek() == '[':
+                        for _ in reader.iter_array():
+                            yield 'sample', kind, index, header, reader.value()
+                    elif field in header_keys:
+                        header[field] = reader.value()
+                    else:
+                        reader.skip()
+                yield 'end', kind, index, header, None
+
+
+def make_record(kind, header, sample, user_id):
+    """Build one row in INSERT_COLUMNS order from a sample and its object's header."""
+    if kind == 'metric':
+        return (user_id, 'metric', sample.get('date'), sample.get('source', None),
+                None, None, None, None, None,
+                sample.get('qty'), header.get('units', None), header.get('name', None))
+    elevation = header.get('elevationUp') or {}
+    return (user_id, 'workout', sample.get('date'), sample.get('source'),
+            sample.get('qty'), sample.get('units'),
+            elevation.get('qty', None), elevation.get('units', None),
+            header.get('location', None), None, None, None)
+
+
+def iter_workouts(stream):
+    """
+    Yield each object of data.workouts decoded whole; metrics are skipped
+    sample by sample. Memory is bounded by the largest single workout.
+    """
+    reader = JsonReader(stream)
+    for key in reader.iter_object():
+        if key != 'data' or reader.peek() != '{':
+            reader.skip()
+            continue
+        for section in reader.iter_object():
+            if section != 'workouts' or reader.peek() != '[':
+                reader.skip()
+                continue
+            for _ in reader.iter_array():
+                workout = reader.value()
+                if isinstance(workout, dict):
+                    yield workout
+
+
+def read_headers(stream, sections=tuple(SECTIONS)):
+    """First pass: collect the header fields of every metric and workout object."""
+    headers = {}
+    for event, kind, index, header, _ in walk_export(JsonReader(stream), False, sections):
+        if event == 'end':
+            headers[(kind, index)] = header
+    return headers
+
+
+def iter_records(stream, user_id, headers=None, sections=tuple(SECTIONS), on_workout=None):
+    """
+    Yield rows in INSERT_COLUMNS order from an export stream.
+
+    With `headers` from read_headers() every sample is emitted as soon as it is
+    read. Without them (single pass over a non-seekable stream), samples of an
+    object whose name/units/location have not been seen yet are held back
+    until the object ends, since export files do not order keys. See
+    walk_export for `on_workout`.
+    """
+    pending = []
+    for event, kind, index, header, sample in walk_export(JsonReader(stream), True, sections, on_workout):
+        if event == 'sample':
+            if headers is not None:
+                yield make_record(kind, headers.get((kind, index), {}), sample, user_id)
+            elif kind == 'metric' and all(k in header for k in METRIC_HEADER_KEYS):
+                yield make_record(kind, header, sample, user_id)
+            else:
+                pending.append(sample)
+        elif pending:
+            for held in pending:
+                yield make_record(kind, header, held, user_id)
+            pending = []
+
+
+def iter_record_batches(open_stream, user_id, batch_size=DEFAULT_BATCH_SIZE, two_pass=True,
+                        sections=tuple(SECTIONS), on_workout=None):
+    """
+    Yield lists of at most `batch_size` rows from an export.
+
+    `open_stream` is a callable returning a fresh file-like object (binary or
+    text). With `two_pass` it is opened twice: once to read the small header
+    fields and once to stream the samples, so memory stays bounded by the
+    batch size whatever the key order of the file. `sections` limits the
+    rows to metrics and/or workouts; `on_workout` takes workout objects whole
+    instead of their rows (see walk_export).
+    """
+    headers = None
+    if two_pass:
+        with open_stream() as stream:
+            headers = read_headers(stream, sections)
+
+    with open_stream() as stream:
+        batch = []
+        for record in iter_records(stream, user_id, headers, sections, on_workout):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
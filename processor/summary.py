@@ -0,0 +1,54 @@
+import pandas as pd
+
+from processor.incremental import series_keys
+
+SUMMARY_COLUMNS = ['user_id', 'metric_day', 'metric_name', 'units', 'value_sum', 'value_min',
+                   'value_max', 'sample_count']
+
+
+def daily_summary(df):
+    """
+    Per-user, per-day, per-series aggregates of a batch of health_data rows.
+
+    The day is the local calendar day the sample was recorded on (the date
+    part of the export timestamp); the series is the metric name, or
+    'workout' for workout step rows. Rolled-up rows count their samples, and
+    their value_min / value_max come from the samples, not the bucket sums.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=SUMMARY_COLUMNS)
+
+    metric = df['type'] == 'metric'
+    value = pd.to_numeric(df['value'].where(metric, df['workout_qty']), errors='coerce')
+    frame = pd.DataFrame({
+        'user_id': df['health_data_user'],
+        'metric_day': pd.to_datetime(df['date'].str[:10], format='%Y-%m-%d', errors='coerce'),
+        'metric_name': series_keys(df),
+        'units': df['units'].where(metric, df['workout_units']),
+        'value': value,
+        'value_min': df['sample_min'] if 'sample_min' in df.columns else value,
+        'value_max': df['sample_max'] if 'sample_max' in df.columns else value,
+        'samples': df['samples'] if 'samples' in df.columns else 1,
+    })
+    frame = frame[frame['metric_day'].notna()]
+
+    groups = frame.groupby(['user_id', 'metric_day', 'metric_name'], sort=False)
+    summary = pd.DataFrame({
+        'units': groups['units'].last(),
+        'value_sum': groups['value'].sum(min_count=1),
+        'value_min': groups['value_min'].min(),
+        'value_max': groups['value_max'].max(),
+        'sample_count': groups['samples'].sum(),
+    }).reset_index()
+    return summary[SUMMARY_COLUMNS]
+
+
+def workout_days(sessions):
+    """Daily summary rows marking the local days workout sessions (WORKOUT_TABLES) started on."""
+    days = pd.DataFrame({
+        'user_id': sessions['user_id'],
+        'metric_day': pd.to_datetime(sessions['start_date'].str[:10], format='%Y-%m-%d', errors='coerce'),
+    }).dropna()
+    summary = days.groupby(['user_id', 'metric_day'], sort=False).size().rename('sample_count').reset_index()
+    summary['metric_name'] = 'workout'
+    return summary.reindex(columns=SUMMARY_COLUMNS)
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+# Health Auto Export sample timestamps, e.g. "2024-08-27 00:00:00 +0200"
+SAMPLE_DATE_FORMAT = '%Y-%m-%d %H:%M:%S %z'
+
+
+def split_sample_dates(dates):
+    """
+    Parse a column of export timestamps once.
+
+    The export format is parsed vectorised; anything else is parsed leniently.
+    :return: (UTC times, NaT if unparseable; UTC offsets in minutes, NaN if
+        unknown), both indexed like `dates`
+    """
+    utc, offsets = _parse_export_format(dates)
+    times = pd.Series(utc, index=dates.index)
+    offsets = pd.Series(offsets, index=dates.index)
+
+    retry = times.isna() & dates.notna()
+    if retry.any():
+        # Other formats are rare; parse them one by one to keep each offset
+        parsed = [_parse_lenient(value) for value in dates[retry]]
+        times[retry] = pd.Series([utc for utc, _ in parsed], dtype=times.dtype, index=times.index[retry])
+        offsets[retry] = [offset for _, offset in parsed]
+    return times, offsets
+
+
+def parse_sample_dates(dates):
+    """Parse a column of export timestamps to UTC (see split_sample_dates)."""
+    return split_sample_dates(dates)[0]
+
+
+def sample_times(df):
+    """UTC time of each row, from recorded_at when the frame already has it."""
+    if 'recorded_at' in df.columns:
+        return df['recorded_at'].dt.tz_localize('UTC')
+    return parse_sample_dates(df['date'])
+
+
+def add_timestamp_columns(df):
+    """
+    Return `df` with `recorded_at` (naive UTC datetime64[us], NaT when the date
+    can't be parsed) and `utc_offset` (the sample's offset in minutes) parsed
+    from `date`, so they can be bound as native TIMESTAMP and NUMBER values.
+    """
+    times, offsets = split_sample_dates(df['date'])
+    return df.assign(recorded_at=times.dt.tz_localize(None).astype('datetime64[us]'),
+                     utc_offset=offsets)
+
+
+def _parse_lenient(value):
+    try:
+        timestamp = pd.Timestamp(str(value))
+    except (ValueError, TypeError, OverflowError):
+        return pd.NaT, np.nan
+    if pd.isna(timestamp):
+        return pd.NaT, np.nan
+    if timestamp.tzinfo is None:
+        return timestamp.tz_localize('UTC'), np.nan
+    return timestamp.tz_convert('UTC'), timestamp.utcoffset().total_seconds() / 60
+
+
+def _parse_export_format(dates):
+    # Fixed width "YYYY-mm-dd HH:MM:SS +hhmm": the local time goes through
+    # to_datetime without %z (which is parsed row by row) and the offset is
+    # read from the code points of the last five characters.
+    text = dates.where(dates.str.len() == 25, '').to_numpy(dtype='U25')
+    local = pd.to_datetime(text.astype('U19'), format='%Y-%m-%d %H:%M:%S', errors='coerce')
+
+    codes = text.view(np.uint32).reshape(len(text), 25)
+    digits = codes[:, 21:25].astype(np.int64) - ord('0')
+    valid = (np.isin(codes[:, 20], (ord('+'), ord('-')))
+             & (digits >= 0).all(axis=1) & (digits <= 9).all(axis=1))
+    sign = np.where(codes[:, 20] == ord('-'), -1, 1)
+    minutes = sign * ((digits[:, 0] * 10 + digits[:, 1]) * 60 + digits[:, 2] * 10 + digits[:, 3])
+
+    utc = local - pd.to_timedelta(np.where(valid, minutes, 0), unit='m')
+    valid &= ~utc.isna()
+    return utc.where(valid).tz_localize('UTC'), np.where(valid, minutes, np.nan)
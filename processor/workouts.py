@@ -0,0 +1,100 @@
+import hashlib
+
+from processor.columnar import ColumnarBuilder
+from processor.columns import (WORKOUT_HEART_RATE_COLUMNS, WORKOUT_QUANTITY_COLUMNS,
+                               WORKOUT_SESSION_COLUMNS)
+
+# Workout sample series by kind; the GPS route is not ingested
+QUANTITY_SERIES = ('stepCount', 'activeEnergy', 'walkingAndRunningDistance')
+HEART_RATE_SERIES = ('heartRateData', 'heartRateRecovery')
+
+# Session-level {qty, units} fields and their column prefix
+SESSION_MEASURES = {
+    'activeEnergyBurned': 'active_energy',
+    'distance': 'distance',
+    'elevationUp': 'elevation_up',
+    'intensity': 'intensity',
+    'humidity': 'humidity',
+    'temperature': 'temperature',
+}
+
+WORKOUT_TABLES = ('workout_sessions', 'workout_quantity_samples', 'workout_heart_rate_samples')
+
+
+def workout_id(workout):
+    """The export's workout id, or for older exports without one a digest of the session."""
+    if workout.get('id'):
+        return str(workout['id'])
+    key = '|'.join(str(workout.get(field)) for field in ('name', 'start', 'end', 'location'))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:36]
+
+
+class WorkoutTablesBuilder:
+    """
+    Lays workouts out as one row per session plus narrow sample rows per
+    series kind (quantities, heart rate), each keyed by the workout id, so
+    session constants such as location and elevation are stored once.
+    """
+
+    def __init__(self):
+        self.sessions = ColumnarBuilder(numeric_columns=(
+            'duration', 'active_energy_qty', 'distance_qty', 'elevation_up_qty',
+            'intensity_qty', 'humidity_qty', 'temperature_qty'))
+        self.quantities = ColumnarBuilder(numeric_columns=('qty',))
+        self.heart_rates = ColumnarBuilder(numeric_columns=('bpm_min', 'bpm_avg', 'bpm_max'))
+
+    @property
+    def row_count(self):
+        return self.sessions.row_count + self.quantities.row_count + self.heart_rates.row_count
+
+    def add_workouts(self, data, user_id):
+        for workout in data['data'].get('workouts') or []:
+            self.add_workout(workout, user_id)
+
+    def add_workout(self, workout, user_id):
+        session_id = workout_id(workout)
+        session = {
+            'user_id': user_id,
+            'workout_id': session_id,
+            'name': workout.get('name'),
+            'location': workout.get('location'),
+            'start_date': workout.get('start'),
+            'end_date': workout.get('end'),
+            'duration': workout.get('duration'),
+        }
+        for field, prefix in SESSION_MEASURES.items():
+            measure = workout.get(field) or {}
+            session[f'{prefix}_qty'] = measure.get('qty')
+            session[f'{prefix}_units'] = measure.get('units')
+        self.sessions.add_segment(1, session, {})
+
+        for series in QUANTITY_SERIES:
+            samples = workout.get(series) or []
+            self.quantities.add_segment(len(samples), {
+                'user_id': user_id, 'workout_id': session_id, 'series': series,
+            }, {
+                'recorded_date': [sample.get('date') for sample in samples],
+                'qty': [sample.get('qty') for sample in samples],
+                'units': [sample.get('units') for sample in samples],
+                'source': [sample.get('source') for sample in samples],
+            })
+
+        for series in HEART_RATE_SERIES:
+            samples = workout.get(series) or []
+            self.heart_rates.add_segment(len(samples), {
+                'user_id': user_id, 'workout_id': session_id, 'series': series,
+            }, {
+                'recorded_date': [sample.get('date') for sample in samples],
+                'bpm_min': [sample.get('Min') for sample in samples],
+                'bpm_avg': [sample.get('Avg') for sample in samples],
+                'bpm_max': [sample.get('Max') for sample in samples],
+                'source': [sample.get('source') for sample in samples],
+            })
+
+    def build(self):
+        """Return {table: DataFrame} for the three workout tables."""
+        return {
+            'workout_sessions': self.sessions.build(WORKOUT_SESSION_COLUMNS),
+            'workout_quantity_samples': self.quantities.build(WORKOUT_QUANTITY_COLUMNS),
+            'workout_heart_rate_samples': self.heart_rates.build(WORKOUT_HEART_RATE_COLUMNS),
+        }
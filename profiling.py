@@ -0,0 +1,86 @@
+import logging
+import os
+import random
+import re
+import time
+import uuid
+from contextlib import contextmanager
+
+# Characters kept from a client-supplied request id when naming profile files
+_UNSAFE = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+class ProfileRun:
+    """One profiled request: its id, and tags (status, row counts) written with the profile."""
+
+    def __init__(self, request_id, user_id):
+        self.request_id = request_id
+        self.tags = {'user_id': user_id}
+        self.seconds = None
+        self.paths = None
+
+
+class UploadProfiler:
+    """
+    Opt-in cProfile of single upload requests.
+
+    A request is profiled when it is sampled (`sample_rate`, 0 to 1) or when
+    one of `admin_users` (user ids) asks for it with the `header`. Each
+    profile is written to `directory` as <time>-<request id>.prof (for
+    pstats / snakeviz) and a .txt summary of the `top` functions by
+    cumulative time, headed by the request's tags. Only the request thread
+    is profiled, not parse workers. With no directory, or neither sampling
+    nor admin users, wanted() is a single attribute check.
+    """
+
+    def __init__(self, directory=None, sample_rate=0.0, admin_users=(), header='X-Profile', top=30,
+                 rng=random.random):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.admin_users = frozenset(admin_users)
+        self.header = header
+        self.top = top
+        self._rng = rng
+        self.enabled = bool(directory) and (sample_rate > 0 or bool(self.admin_users))
+
+    def wanted(self, user, headers):
+        if not self.enabled:
+            return False
+        if user['id'] in self.admin_users and headers.get(self.header, '').lower() in ('1', 'true'):
+            return True
+        return self.sample_rate > 0 and self._rng() < self.sample_rate
+
+    @contextmanager
+    def profile(self, request_id, user):
+        """Profile the with block; the ProfileRun yielded takes the tags to record."""
+        # Imported by the first profiled request; most workers never profile one
+        import cProfile
+
+        run = ProfileRun(_UNSAFE.sub('', request_id or '')[:64] or uuid.uuid4().hex, user['id'])
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            yield run
+        finally:
+            profiler.disable()
+            run.seconds = time.perf_counter() - started
+            try:
+                run.paths = self.write(profiler, run)
+            except OSError as e:
+                logging.error(f"Error writing profile of request {run.request_id}: {e}")
+
+    def write(self, profiler, run):
+        import pstats
+
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"{time.strftime('%Y%m%dT%H%M%S')}-{run.request_id}")
+        profiler.dump_stats(base + '.prof')
+        with open(base + '.txt', 'w') as f:
+            f.write(f"request_id: {run.request_id}\n")
+            for name, value in run.tags.items():
+                f.write(f"{name}: {value}\n")
+            f.write(f"seconds: {run.seconds:.3f}\n\n")
+            pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(self.top)
+        logging.info(f"Profiled request {run.request_id} ({run.seconds:.2f} s) to {base}.prof")
+        return base + '.prof', base + '.txt'
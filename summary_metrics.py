@@ -0,0 +1,120 @@
+import oracledb
+
+from oracle_writer import column_values
+from processor.summary import SUMMARY_COLUMNS
+
+SUMMARY_BIND_TYPES = [oracledb.DB_TYPE_NUMBER, oracledb.DB_TYPE_DATE, oracledb.DB_TYPE_VARCHAR,
+                      oracledb.DB_TYPE_VARCHAR, oracledb.DB_TYPE_NUMBER, oracledb.DB_TYPE_NUMBER,
+                      oracledb.DB_TYPE_NUMBER, oracledb.DB_TYPE_NUMBER]
+
+# Fold a batch's aggregates into the stored day
+_MERGE_ADD = """
+    MERGE INTO summary_metrics t
+    USING (SELECT :1 AS user_id, :2 AS metric_day, :3 AS metric_name, :4 AS units,
+                  :5 AS value_sum, :6 AS value_min, :7 AS value_max, :8 AS sample_count
+             FROM dual) s
+    ON (t.user_id = s.user_id AND t.metric_day = s.metric_day AND t.metric_name = s.metric_name)
+    WHEN MATCHED THEN UPDATE SET
+        t.units = NVL(s.units, t.units),
+        t.value_sum = CASE WHEN t.value_sum IS NULL AND s.value_sum IS NULL THEN NULL
+                           ELSE NVL(t.value_sum, 0) + NVL(s.value_sum, 0) END,
+        t.value_min = LEAST(NVL(t.value_min, s.value_min), NVL(s.value_min, t.value_min)),
+        t.value_max = GREATEST(NVL(t.value_max, s.value_max), NVL(s.value_max, t.value_max)),
+        t.sample_count = t.sample_count + s.sample_count,
+        t.updated_at = SYSTIMESTAMP
+    WHEN NOT MATCHED THEN INSERT
+        (user_id, metric_day, metric_name, units, value_sum, value_min, value_max, sample_count)
+        VALUES (s.user_id, s.metric_day, s.metric_name, s.units, s.value_sum, s.value_min,
+                s.value_max, s.sample_count)"""
+
+# Recompute days from health_data; the day is the date part of the export timestamp. Stored
+# rolled-up rows keep only their sums, so days with any have no known min / max
+_MERGE_RECOMPUTE = """
+    MERGE INTO summary_metrics t
+    USING (SELECT health_data_user AS user_id,
+                  TO_DATE(SUBSTR(recorded_date, 1, 10), 'YYYY-MM-DD') AS metric_day,
+                  CASE WHEN type = 'metric' THEN NVL(metric_name, type) ELSE type END AS metric_name,
+                  MAX(CASE WHEN type = 'metric' THEN units ELSE workout_units END) AS units,
+                  SUM(CASE WHEN type = 'metric' THEN value ELSE workout_qty END) AS value_sum,
+                  CASE WHEN MAX(NVL(sample_count, 1)) = 1
+                       THEN MIN(CASE WHEN type = 'metric' THEN value ELSE workout_qty END) END AS value_min,
+                  CASE WHEN MAX(NVL(sample_count, 1)) = 1
+                       THEN MAX(CASE WHEN type = 'metric' THEN value ELSE workout_qty END) END AS value_max,
+                  SUM(NVL(sample_count, 1)) AS sample_count
+             FROM health_data
+            WHERE {where}
+              AND REGEXP_LIKE(recorded_date, '^[0-9]{{4}}-[0-9]{{2}}-[0-9]{{2}}')
+            GROUP BY health_data_user, SUBSTR(recorded_date, 1, 10),
+                     CASE WHEN type = 'metric' THEN NVL(metric_name, type) ELSE type END) s
+    ON (t.user_id = s.user_id AND t.metric_day = s.metric_day AND t.metric_name = s.metric_name)
+    WHEN MATCHED THEN UPDATE SET
+        t.units = s.units, t.value_sum = s.value_sum, t.value_min = s.value_min,
+        t.value_max = s.value_max, t.sample_count = s.sample_count, t.updated_at = SYSTIMESTAMP
+    WHEN NOT MATCHED THEN INSERT
+        (user_id, metric_day, metric_name, units, value_sum, value_min, value_max, sample_count)
+        VALUES (s.user_id, s.metric_day, s.metric_name, s.units, s.value_sum, s.value_min,
+                s.value_max, s.sample_count)"""
+
+
+def add_daily_summary(connection, summary):
+    """Upsert the days of a batch summary (processor.summary.daily_summary) and commit."""
+    if summary.empty:
+        return 0
+    rows = list(zip(*(column_values(summary[column], 0, len(summary)) for column in SUMMARY_COLUMNS)))
+    cursor = connection.cursor()
+    try:
+        cursor.setinputsizes(*SUMMARY_BIND_TYPES)
+        cursor.executemany(_MERGE_ADD, rows)
+        connection.commit()
+    finally:
+        cursor.close()
+    return len(rows)
+
+
+def refresh_days(connection, summary):
+    """
+    Recompute the (user, day) pairs touched by a batch from health_data, for
+    loads where the rows actually stored are not known (e.g. deduplicated by a
+    merge). Each day is an index range scan on (health_data_user, recorded_date).
+    """
+    days = summary[['user_id', 'metric_day']].drop_duplicates()
+    if days.empty:
+        return 0
+    sql = _MERGE_RECOMPUTE.format(where="health_data_user = :user_id AND recorded_date LIKE :day_prefix")
+    rows = [{'user_id': int(user_id), 'day_prefix': day.strftime('%Y-%m-%d') + '%'}
+            for user_id, day in days.itertuples(index=False)]
+    cursor = connection.cursor()
+    try:
+        cursor.executemany(sql, rows)
+        connection.commit()
+    finally:
+        cursor.close()
+    return len(rows)
+
+
+def backfill_summary(connection, user_id=None, since=None):
+    """
+    Rebuild summary_metrics from health_data, one user per transaction.
+    :param since: optional first day to recompute, 'YYYY-MM-DD'
+    :return: number of users processed
+    """
+    cursor = connection.cursor()
+    try:
+        if user_id is None:
+            cursor.execute("SELECT DISTINCT health_data_user FROM health_data")
+            user_ids = [row[0] for row in cursor]
+        else:
+            user_ids = [user_id]
+
+        where = "health_data_user = :user_id"
+        binds = {}
+        if since:
+            where += " AND recorded_date >= :since"
+            binds['since'] = since
+        sql = _MERGE_RECOMPUTE.format(where=where)
+        for user in user_ids:
+            cursor.execute(sql, dict(binds, user_id=user))
+            connection.commit()
+    finally:
+        cursor.close()
+    return len(user_ids)
@@ -0,0 +1,107 @@
+import unittest
+from contextlib import contextmanager
+from unittest.mock import patch, MagicMock
+
+import app as app_module
+from api_keys import digest_api_key, generate_api_key, is_legacy_api_key
+
+
+def fake_db_connection(cursor):
+    connection = MagicMock()
+    connection.cursor.return_value = cursor
+
+    @contextmanager
+    def db_connection():
+        yield connection
+
+    return db_connection
+
+
+class TestApiKeys(unittest.TestCase):
+
+    def test_generated_key_format(self):
+        api_key, prefix, digest = generate_api_key()
+
+        self.assertTrue(api_key.startswith(f"uz_{prefix}_"))
+        self.assertEqual(len(prefix), 8)
+        self.assertEqual(digest, digest_api_key(api_key))
+        self.assertEqual(len(digest), 64)
+        self.assertFalse(is_legacy_api_key(api_key))
+        self.assertTrue(is_legacy_api_key('$2b$12$abcdefghijklmnopqrstuvwxyz0123456789ABCDEFGHIJKLMNOPQ'))
+        # Garbage tokens don't get the legacy column lookup
+        self.assertFalse(is_legacy_api_key('$2b$12$abcdefghijklmnopqrstuv'))
+        self.assertFalse(is_legacy_api_key('not-a-key'))
+
+
+class TestApiKeyLookup(unittest.TestCase):
+
+    def setUp(self):
+        app_module.api_key_cache.clear()
+
+    def test_new_key_is_a_single_digest_probe(self):
+        api_key, _, digest = generate_api_key()
+        cursor = MagicMock()
+        cursor.fetchone.return_value = (5, 'zimele')
+
+        with patch('app.db_connection', fake_db_connection(cursor)):
+            user = app_module.find_user_by_api_key(api_key)
+            app_module.find_user_by_api_key(api_key)
+
+        self.assertEqual(user, {'id': 5, 'username': 'zimele'})
+        cursor.execute.assert_called_once()
+        self.assertEqual(cursor.execute.call_args.args[1], [digest])
+
+    def test_legacy_key_falls_back_and_backfills_digest(self):
+        legacy_key = '$2b$12$abcdefghijklmnopqrstuvwxyz0123456789ABCDEFGHIJKLMNOPQ'
+        cursor = MagicMock()
+        cursor.fetchone.side_effect = [None, (3, 'dom')]
+
+        with patch('app.db_connection', fake_db_connection(cursor)):
+            user = app_module.find_user_by_api_key(legacy_key)
+
+        self.assertEqual(user['id'], 3)
+        backfill = cursor.execute.call_args_list[-1]
+        self.assertIn('UPDATE users SET api_key_hash', backfill.args[0])
+        self.assertEqual(backfill.args[1], [digest_api_key(legacy_key), 3])
+
+    def test_unknown_new_key_does_not_hit_legacy_column(self):
+        api_key, _, _ = generate_api_key()
+        cursor = MagicMock()
+        cursor.fetchone.return_value = None
+
+        with patch('app.db_connection', fake_db_connection(cursor)):
+            self.assertIsNone(app_module.find_user_by_api_key(api_key))
+
+        cursor.execute.assert_called_once()
+
+    def test_rotation_invalidates_cached_user(self):
+        api_key, _, _ = generate_api_key()
+        cursor = MagicMock()
+        cursor.fetchone.return_value = (9, 'billy')
+
+        with patch('app.db_connection', fake_db_connection(cursor)):
+            app_module.find_user_by_api_key(api_key)
+            new_key, _ = app_module.rotate_api_key(9)
+            cursor.fetchone.return_value = None
+            self.assertIsNone(app_module.find_user_by_api_key(api_key))
+
+        self.assertNotEqual(new_key, api_key)
+
+    def test_registration_keeps_the_cache_of_every_worker(self):
+        api_key, _, _ = generate_api_key()
+        cursor = MagicMock()
+        cursor.fetchone.side_effect = [(9, 'billy'), None]
+
+        with patch('app.db_connection', fake_db_connection(cursor)), \
+                patch.object(app_module.api_key_cache, '_revoke') as revoke:
+            app_module.find_user_by_api_key(api_key)
+            new_key, error = app_module.create_user('zimele', 'password', 'zimele@example.com')
+            app_module.find_user_by_api_key(api_key)
+
+        self.assertIsNone(error)
+        revoke.assert_not_called()
+        self.assertEqual(cursor.fetchone.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
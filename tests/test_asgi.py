@@ -0,0 +1,132 @@
+import asyncio
+import datetime
+import gzip
+import json
+import unittest
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, patch
+
+import app as app_module
+import asgi
+
+EXPORT = {
+    "data": {
+        "metrics": [{"name": "step_count", "units": "count",
+                     "data": [{"date": "2024-08-27 00:00:00 +0200", "qty": 2536, "source": ""},
+                              {"date": "2024-08-27 00:01:00 +0200", "qty": 12, "source": ""}]}],
+    }
+}
+
+
+def call(path, method='GET', body=b'', headers=(), query=b''):
+    """Run one request through the ASGI app; returns (status, {header: value}, body)."""
+    messages = []
+    chunks = [{'type': 'http.request', 'body': body[:10], 'more_body': True},
+              {'type': 'http.request', 'body': body[10:], 'more_body': False}]
+
+    async def receive():
+        return chunks.pop(0)
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query,
+             'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+             'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80)}
+    asyncio.run(asgi.app(scope, receive, send))
+    start = messages[0]
+    return (start['status'], {name.decode(): value.decode() for name, value in start['headers']},
+            b''.join(message.get('body', b'') for message in messages[1:]))
+
+
+class TestAsgiApp(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.object(asgi.app, 'authenticate', AsyncMock(return_value={'id': 42, 'username': 'dom'}))
+        self.authenticate = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_other_routes_are_served_by_flask(self):
+        status, headers, body = call('/api/v1/')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)['version'], 'v1')
+
+        with patch('app.find_user_by_api_key', return_value=None):
+            status, _, _ = call('/api/v1/status/pool', headers=[('Authorization', 'Bearer nope')])
+        self.assertEqual(status, 401)
+
+    def test_push_is_ingested_on_the_thread_pool(self):
+        saved = []
+        with patch.object(app_module.FileUpload, 'save_to_oracle',
+                          side_effect=lambda df, load='auto': saved.append(df)), \
+                patch.object(app_module.FileUpload, 'load_ingest_state'), \
+                patch.object(app_module.FileUpload, 'save_ingest_state'):
+            status, _, body = call('/api/v1/push', 'POST', gzip.compress(json.dumps(EXPORT).encode('utf-8')),
+                                   [('Content-Type', 'application/json'), ('Content-Encoding', 'gzip')],
+                                   b'incremental=false')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body)['rows_written'], 2)
+        self.assertEqual(set(saved[0]['health_data_user']), {42})
+
+    def test_push_body_is_parsed_as_it_is_received(self):
+        body = gzip.compress(json.dumps(EXPORT).encode('utf-8'))
+        headers = [('Content-Type', 'application/json'), ('Content-Encoding', 'gzip')]
+        with patch.object(app_module.FileUpload, 'save_to_oracle', return_value=None), \
+                patch.object(app_module.FileUpload, 'load_ingest_state'), \
+                patch.object(app_module.FileUpload, 'save_ingest_state'), \
+                patch.dict(asgi.app.config, {'ASGI_PUSH_CHUNKS': 1}):
+            status, _, _ = call('/api/v1/push', 'POST', body, headers, b'incremental=false')
+            self.assertEqual(status, 200)
+
+            # The limit on the body as sent is checked while it is received...
+            with patch.dict(asgi.app.config, {'PUSH_MAX_BODY_BYTES': len(body) - 1}):
+                status, _, response = call('/api/v1/push', 'POST', body, headers)
+                self.assertEqual(status, 413)
+                self.assertIn(b'larger than', response)
+                # ...or up front from its Content-Length
+                status, _, _ = call('/api/v1/push', 'POST', body, headers + [('Content-Length', str(len(body)))])
+                self.assertEqual(status, 413)
+
+            # and the limit on the decoded body separately
+            with patch.dict(asgi.app.config, {'PUSH_MAX_BYTES': 20}):
+                status, _, response = call('/api/v1/push', 'POST', body, headers)
+                self.assertEqual(status, 413)
+                self.assertIn(b'expands past', response)
+
+    def test_push_requires_a_user(self):
+        self.authenticate.return_value = None
+
+        status, headers, _ = call('/api/v1/push', 'POST', b'{}', [('Content-Type', 'application/json')])
+
+        self.assertEqual(status, 401)
+        self.assertEqual(headers['www-authenticate'], 'Bearer realm="Authentication Required"')
+
+    def test_reads_are_streamed_from_the_async_pool(self):
+        rows = [{'sample_time': datetime.datetime(2024, 9, 1, 8), 'row_key': 'AAA', 'name': 'step_count',
+                 'value': 10.0}]
+
+        @asynccontextmanager
+        async def connection():
+            yield None
+
+        async def iter_rows_async(connection, sql, binds, arraysize):
+            self.assertIn('health_data_user = :user_id', sql)
+            for row in rows:
+                yield dict(row)
+
+        with patch('asgi.async_db_connection', connection), patch('asgi.iter_rows_async', iter_rows_async):
+            status, headers, body = call('/api/v1/metrics', query=b'limit=5')
+            bad_status, _, _ = call('/api/v1/metrics', query=b'tz=mars')
+
+        lines = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['content-type'], 'application/x-ndjson')
+        self.assertEqual(lines, [{'sample_time': '2024-09-01T08:00:00Z', 'name': 'step_count', 'value': 10.0},
+                                 {'next_cursor': None}])
+        self.assertEqual(bad_status, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from auth_cache import ApiKeyCache, SharedGeneration
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestApiKeyCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = ApiKeyCache(maxsize=2, ttl=60, negative_ttl=5, clock=self.clock)
+
+    def test_positive_lookup_is_cached_until_ttl(self):
+        loader = MagicMock(return_value={'id': 1, 'username': 'billy'})
+
+        self.assertEqual(self.cache.get('key-1', loader)['id'], 1)
+        self.assertEqual(self.cache.get('key-1', loader)['id'], 1)
+        self.assertEqual(loader.call_count, 1)
+
+        self.clock.now = 61
+        self.cache.get('key-1', loader)
+        self.assertEqual(loader.call_count, 2)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_negative_lookup_uses_shorter_ttl(self):
+        loader = MagicMock(return_value=None)
+
+        self.assertIsNone(self.cache.get('bad-key', loader))
+        self.assertIsNone(self.cache.get('bad-key', loader))
+        self.assertEqual(loader.call_count, 1)
+
+        self.clock.now = 6
+        self.cache.get('bad-key', loader)
+        self.assertEqual(loader.call_count, 2)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        loader = MagicMock(side_effect=lambda key: {'id': key})
+
+        self.cache.get('a', loader)
+        self.cache.get('b', loader)
+        self.cache.get('a', loader)
+        self.cache.get('c', loader)
+
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        self.cache.get('a', loader)
+        self.cache.get('b', loader)
+        self.assertEqual(loader.call_count, 4)
+
+    def test_invalidate_by_key_and_user(self):
+        loader = MagicMock(side_effect=lambda key: {'id': 7, 'username': 'dom'})
+
+        self.cache.get('old-key', loader)
+        self.cache.invalidate_user(7)
+        self.cache.get('old-key', loader)
+        self.cache.invalidate('old-key')
+        self.cache.get('old-key', loader)
+
+        self.assertEqual(loader.call_count, 3)
+
+    def test_invalidation_reaches_caches_sharing_the_revocation_file(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'auth_revocations')
+            # Two workers of one host
+            worker, other = (ApiKeyCache(ttl=60, clock=self.clock, shared=SharedGeneration(path))
+                             for _ in range(2))
+            loader = MagicMock(return_value={'id': 7, 'username': 'dom'})
+
+            other.get('old-key', loader)
+            other.get('old-key', loader)
+            worker.invalidate_user(7)
+            other.get('old-key', loader)
+
+            self.assertEqual(loader.call_count, 2)
+
+    def test_loader_errors_are_not_cached(self):
+        loader = MagicMock(side_effect=[RuntimeError('db down'), {'id': 1}])
+
+        with self.assertRaises(RuntimeError):
+            self.cache.get('key', loader)
+        self.assertEqual(self.cache.get('key', loader), {'id': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from api_keys import digest_api_key
+from benchmarks import bench_startup
+from benchmarks.bench_ingest import regressions
+from benchmarks.fake_db import FakeConnection, StandInConnection, create_users_table, standin_db_connection
+from benchmarks.generator import generate_export, generate_exports, sample_counts, write_exports
+from benchmarks.load_test import summarize
+from oracle_writer import HealthDataWriter
+from processor.columns import INSERT_COLUMNS
+from processor.health_data_processor import HealthDataProcessor
+
+
+class TestGenerator(unittest.TestCase):
+
+    def test_export_scales_with_days_workouts_and_sample_rate(self):
+        export = generate_export(days=3, workouts_per_day=2, samples_per_second=0.5, workout_seconds=60)
+
+        metrics, steps = sample_counts(export)
+        self.assertEqual(metrics, 3 * 13)
+        self.assertEqual(steps, 3 * 2 * 30)
+        self.assertEqual(len(export['data']['workouts'][0]['route']), 30)
+
+    def test_same_seed_same_export(self):
+        first = [export for _, export in generate_exports(users=2, days=1, workout_seconds=10)]
+        second = [export for _, export in generate_exports(users=2, days=1, workout_seconds=10)]
+
+        self.assertEqual(first, second)
+        self.assertNotEqual(first[0], first[1])
+
+    def test_written_exports_ingest(self):
+        with tempfile.TemporaryDirectory() as out_dir:
+            write_exports(out_dir, users=2, days=2, workout_seconds=10)
+            df = HealthDataProcessor(out_dir).process_files(7)
+
+        self.assertEqual(df.shape, (2 * (2 * 13 + 2 * 10), len(INSERT_COLUMNS)))
+        self.assertTrue((df['health_data_user'] == 7).all())
+        self.assertEqual(set(df['type']), {'workout', 'metric'})
+
+    def test_fake_connection_counts_written_rows(self):
+        export = generate_export(days=1, workout_seconds=10)
+        df = HealthDataProcessor().flatten_metrics(export, 1).reindex(columns=INSERT_COLUMNS)
+        connection = FakeConnection()
+
+        report = HealthDataWriter(connection, batch_size=5).write(df)
+
+        self.assertEqual(report['rows_written'], 13)
+        self.assertEqual(connection.rows, 13)
+        self.assertEqual(connection.commits, 3)
+
+
+class TestStandInDatabase(unittest.TestCase):
+
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.work_dir.cleanup)
+        self.users_db = os.path.join(self.work_dir.name, 'users.sqlite3')
+        create_users_table(self.users_db)
+
+    def test_registered_users_authenticate_from_another_connection(self):
+        import app
+
+        with patch.object(app, 'db_connection', standin_db_connection(self.users_db)), \
+                patch.object(app.password_hasher, 'hash', return_value='hashed'):
+            api_key, error = app.create_user('load_1', 'secret', 'load_1@example.com')
+            _, duplicate = app.create_user('load_1', 'secret', 'other@example.com')
+            user = app.load_user_by_api_key(api_key, digest_api_key(api_key))
+
+        self.assertIsNone(error)
+        self.assertIn('already exists', duplicate)
+        self.assertEqual(user, {'id': 1, 'username': 'load_1'})
+
+    def test_other_statements_return_no_rows(self):
+        connection = StandInConnection(self.users_db)
+        cursor = connection.cursor()
+        cursor.execute("SELECT content_hash FROM ingest_files WHERE user_id = :user_id", user_id=1)
+
+        self.assertEqual(list(cursor), [])
+        connection.close()
+
+
+class TestLoadTestReport(unittest.TestCase):
+
+    def test_percentiles_and_error_rate_per_kind(self):
+        samples = [('json', 200, i / 1000) for i in range(1, 101)] + [('zip', 500, 0.5), ('zip', None, 1.0)]
+
+        summary = summarize(samples, elapsed=2.0)
+
+        self.assertEqual(summary['json']['p50_ms'], 50.0)
+        self.assertEqual(summary['json']['p99_ms'], 99.0)
+        self.assertEqual(summary['json']['error_rate'], 0)
+        self.assertEqual(summary['zip']['error_rate'], 1.0)
+        self.assertEqual(summary['all']['requests'], 102)
+        self.assertEqual(summary['all']['throughput_rps'], 51.0)
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_workers_start_and_ingest_rows_without_pandas(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            export_path = os.path.join(work_dir, 'export.json')
+            with open(export_path, 'w') as f:
+                json.dump(generate_export(days=1, workout_seconds=10), f)
+
+            started = bench_startup.run('import', repeat=1)
+            rows = bench_startup.run('upload_rows', export_path, repeat=1)
+
+        self.assertFalse(started['pandas'])
+        self.assertFalse(rows['pandas'])
+        self.assertGreater(rows['rss_mb'], 0)
+
+
+class TestRegressions(unittest.TestCase):
+
+    def test_slower_or_larger_stages_are_reported(self):
+        baseline = {'stages': {
+            'parse': {'rows_per_second': 1000, 'peak_alloc_mb': 10.0},
+            'save': {'rows_per_second': 1000, 'peak_alloc_mb': 0.2},
+            'gone': {'rows_per_second': 1000, 'peak_alloc_mb': 1.0},
+        }}
+        results = {
+            'parse': {'rows_per_second': 700, 'peak_alloc_mb': 14.0},
+            'save': {'rows_per_second': 900, 'peak_alloc_mb': 0.5},
+        }
+
+        found = regressions(results, baseline, 0.25)
+
+        self.assertEqual(len(found), 2)
+        self.assertTrue(all(message.startswith('parse') for message in found))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+from unittest.mock import patch, MagicMock
+
+import db
+
+
+class TestSessionPool(unittest.TestCase):
+
+    def setUp(self):
+        db.close_pool()
+        db.configure({'ORACLE_POOL_MIN': 2, 'ORACLE_POOL_MAX': 8,
+                      'ORACLE_POOL_INCREMENT': 2})
+
+    def tearDown(self):
+        db._pool = None
+        db._pool_pid = None
+
+    @patch('oracledb.create_pool')
+    def test_pool_created_lazily_once(self, mock_create_pool):
+        mock_create_pool.return_value = MagicMock()
+
+        self.assertFalse(mock_create_pool.called)
+        with db.db_connection():
+            pass
+        with db.db_connection():
+            pass
+
+        mock_create_pool.assert_called_once()
+        kwargs = mock_create_pool.call_args.kwargs
+        self.assertEqual((kwargs['min'], kwargs['max'], kwargs['increment']), (2, 8, 2))
+        self.assertEqual(kwargs['ping_interval'], 0)
+
+    @patch('oracledb.create_pool')
+    def test_pool_recreated_after_fork(self, mock_create_pool):
+        mock_create_pool.side_effect = [MagicMock(), MagicMock()]
+
+        first = db.get_pool()
+        with patch('db.os.getpid', return_value=db._pool_pid + 1):
+            second = db.get_pool()
+
+        self.assertIsNot(first, second)
+        self.assertEqual(mock_create_pool.call_count, 2)
+
+    @patch('oracledb.create_pool')
+    def test_connection_released_on_error(self, mock_create_pool):
+        pool = MagicMock()
+        mock_create_pool.return_value = pool
+
+        with self.assertRaises(RuntimeError):
+            with db.db_connection():
+                raise RuntimeError('boom')
+
+        pool.release.assert_called_once_with(pool.acquire.return_value)
+
+    @patch('oracledb.create_pool')
+    def test_pool_stats(self, mock_create_pool):
+        pool = MagicMock(opened=3, busy=1, min=2, max=8)
+        mock_create_pool.return_value = pool
+        acquires_before = db.pool_stats()['acquires']
+
+        with db.db_connection():
+            pass
+        stats = db.pool_stats()
+
+        self.assertTrue(stats['created'])
+        self.assertEqual((stats['opened'], stats['busy']), (3, 1))
+        self.assertEqual(stats['acquires'], acquires_before + 1)
+        self.assertGreaterEqual(stats['wait_seconds_max'], 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
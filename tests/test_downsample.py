@@ -0,0 +1,79 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from processor.columnar import ColumnarBuilder
+from processor.downsample import Downsampler, parse_overrides
+
+EXPORT = {
+    "data": {
+        "workouts": [{
+            "location": "Outdoor",
+            "elevationUp": {"qty": 23.15, "units": "m"},
+            "stepCount": [{"date": f"2024-09-19 17:40:{second:02d} +0300", "qty": 2.5,
+                           "units": "steps", "source": "iPhone"} for second in range(55, 60)]
+                         + [{"date": f"2024-09-19 17:41:{second:02d} +0300", "qty": 1.5,
+                             "units": "steps", "source": "iPhone"} for second in range(0, 3)],
+        }],
+        "metrics": [
+            {"name": "heart_rate", "units": "count/min",
+             "data": [{"date": "2024-09-19 17:40:56 +0300", "Avg": 120},
+                      {"date": "2024-09-19 17:40:58 +0300", "Avg": 124}]},
+            {"name": "step_count", "units": "count",
+             "data": [{"date": "2024-09-19 17:40:10 +0300", "qty": 40},
+                      {"date": "2024-09-19 17:40:50 +0300", "qty": 60}]},
+        ],
+    }
+}
+
+
+def export_frame():
+    builder = ColumnarBuilder()
+    builder.add_workouts(EXPORT, 7)
+    builder.add_metrics(EXPORT, 7)
+    return builder.build()
+
+
+class TestDownsampler(unittest.TestCase):
+
+    def test_raw_resolution_leaves_the_frame_alone(self):
+        df = export_frame()
+        downsampler = Downsampler('raw')
+
+        self.assertIs(downsampler.apply(df), df)
+        self.assertEqual(downsampler.report(), {'samples': 12, 'rows': 12, 'reduction': 0.0})
+
+    def test_workout_buckets_sum_quantities_and_keep_first_and_last_dates(self):
+        downsampler = Downsampler('1min')
+
+        df = downsampler.apply(export_frame())
+
+        workouts = df[df['type'] == 'workout']
+        self.assertEqual(list(workouts['date']), ['2024-09-19 17:40:55 +0300', '2024-09-19 17:41:00 +0300'])
+        self.assertEqual(list(workouts['date_end']), ['2024-09-19 17:40:59 +0300', '2024-09-19 17:41:02 +0300'])
+        self.assertEqual(list(workouts['workout_qty']), [12.5, 4.5])
+        self.assertEqual(list(workouts['samples']), [5, 3])
+        self.assertEqual((list(workouts['sample_min']), list(workouts['sample_max'])), ([2.5, 1.5], [2.5, 1.5]))
+        self.assertEqual(list(workouts['location']), ['Outdoor', 'Outdoor'])
+        # Metrics are not rolled up unless listed
+        self.assertEqual(len(df[df['type'] == 'metric']), 4)
+        self.assertTrue(df.loc[df['type'] == 'metric', 'date_end'].isna().all())
+        self.assertEqual(downsampler.report()['rows'], 6)
+
+    def test_per_metric_overrides(self):
+        downsampler = Downsampler('raw', parse_overrides('step_count=1min, workout=10s'))
+
+        df = downsampler.apply(export_frame())
+
+        self.assertEqual(list(df['type']), ['workout'] * 2 + ['metric'] * 3)
+        steps = df[df['metric_name'] == 'step_count']
+        self.assertEqual((steps['value'].item(), steps['samples'].item()), (100, 2))
+        self.assertEqual((steps['sample_min'].item(), steps['sample_max'].item()), (40, 60))
+        self.assertTrue(np.isnan(df.loc[df['metric_name'] == 'heart_rate', 'value']).all())
+        pd.testing.assert_series_equal(
+            df['workout_qty'][:2], pd.Series([12.5, 4.5], name='workout_qty'))
+
+
+if __name__ == '__main__':
+    unittest.main()
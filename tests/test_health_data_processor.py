@@ -2,8 +2,10 @@ import unittest
 from unittest.mock import patch, mock_open
 import os
 import json
+import tempfile
 import pandas as pd
 from io import StringIO
+from processor.columns import INSERT_COLUMNS
 from processor.health_data_processor import HealthDataProcessor
 
 
@@ -30,13 +32,14 @@ class TestHealthDataProcessor(unittest.TestCase):
                 }]
             }
         })
-        mock_file.return_value = StringIO(mock_file_data)
+        # Each open() reads the export afresh
+        mock_file.side_effect = lambda *args, **kwargs: StringIO(mock_file_data)
 
         processor = HealthDataProcessor(input_dir='mock_dir')
-        result_df = processor.process_files()
+        result_df = processor.process_files('user1')
 
-        # Assert that the combined DataFrame has the correct shape
-        self.assertEqual(result_df.shape, (2, 9))  # 2 rows, 9 columns for workouts + metrics
+        # Both files land in one frame, a workout and a metric row each, in the INSERT layout
+        self.assertEqual(result_df.shape, (4, len(INSERT_COLUMNS)))
 
         # Assert that data is processed correctly
         expected_columns = ['health_data_user', 'type', 'date', 'source', 'workout_qty',
@@ -45,7 +48,8 @@ class TestHealthDataProcessor(unittest.TestCase):
         for column in expected_columns:
             self.assertIn(column, result_df.columns)
 
-        self.assertEqual(result_df.iloc[0]['health_data_user'], 'user1')
+        self.assertTrue((result_df['health_data_user'] == 'user1').all())
+        self.assertEqual(list(result_df['type']), ['workout', 'metric', 'workout', 'metric'])
         self.assertEqual(result_df.iloc[1]['metric_name'], 'heart_rate')
 
     @patch('builtins.open', new_callable=mock_open)
@@ -109,6 +113,84 @@ class TestHealthDataProcessor(unittest.TestCase):
         # Check that the result is an empty DataFrame
         self.assertTrue(df.empty)
 
+    @patch('builtins.open', new_callable=mock_open)
+    def test_process_file_builds_insert_layout_in_one_step(self, mock_file):
+        mock_data = {
+            "data": {
+                "metrics": [{
+                    "name": "heart_rate",
+                    "units": "bpm",
+                    "data": [{"date": "2024-10-01", "source": "watch", "qty": 70},
+                             {"date": "2024-10-02", "Avg": 64}]
+                }],
+                "workouts": [{
+                    "location": "park",
+                    "stepCount": [{"date": "2024-10-01", "source": "watch", "qty": 1000, "units": "steps"}]
+                }]
+            }
+        }
+        mock_file.return_value = StringIO(json.dumps(mock_data))
+
+        processor = HealthDataProcessor(input_dir='mock_dir')
+        df = processor.process_file('mock_file.json', 'user1')
+
+        self.assertEqual(list(df.columns), INSERT_COLUMNS)
+        self.assertEqual(list(df['type']), ['workout', 'metric', 'metric'])
+        self.assertEqual(list(df['health_data_user']), ['user1'] * 3)
+        self.assertEqual(list(df['metric_name'][1:]), ['heart_rate', 'heart_rate'])
+        self.assertTrue(pd.isna(df.iloc[0]['elevation_qty']))
+        self.assertTrue(pd.isna(df.iloc[2]['value']))
+        self.assertEqual(df['workout_qty'].dtype, 'float64')
+
+    def test_process_files_parallel_keeps_file_order(self):
+        with tempfile.TemporaryDirectory() as input_dir:
+            for day in range(1, 6):
+                export = {"data": {"metrics": [{"name": "heart_rate", "units": "bpm", "data": [
+                    {"date": f"2024-10-0{day}", "qty": day * 10 + i} for i in range(day)]}]}}
+                with open(os.path.join(input_dir, f"export-{day}.json"), 'w') as f:
+                    json.dump(export, f)
+
+            serial = HealthDataProcessor(input_dir=input_dir).process_file(
+                os.path.join(input_dir, 'export-3.json'), 'user1')
+            for executor in ('thread', 'process'):
+                frames = list(HealthDataProcessor(input_dir=input_dir).process_files_parallel(
+                    'user1', workers=2, executor=executor))
+
+                self.assertEqual([len(df) for df in frames], [1, 2, 3, 4, 5])
+                pd.testing.assert_frame_equal(frames[2], serial)
+
+    def test_rows_mode_matches_the_frame(self):
+        export = {"data": {
+            "workouts": [{"location": "Outdoor", "elevationUp": {"qty": 4.5, "units": "m"},
+                          "stepCount": [{"date": "2024-09-05 17:37:40 +0200", "qty": 12,
+                                         "units": "steps", "source": "iPhone"}]}],
+            "metrics": [{"name": "heart_rate", "units": "bpm",
+                         "data": [{"date": "2024-09-05 00:00:00 +0200", "qty": 61},
+                                  {"date": "2024-09-05 00:01:00 +0200"}]}],
+        }}
+
+        rows = HealthDataProcessor(rows=True).process_stream(StringIO(json.dumps(export)), 'user1')
+        df = HealthDataProcessor().process_stream(StringIO(json.dumps(export)), 'user1')
+
+        self.assertIsInstance(rows, list)
+        self.assertEqual(rows, [tuple(None if pd.isna(value) else value for value in row)
+                                for row in df.itertuples(index=False)])
+
+    def test_rows_mode_streaming_batches(self):
+        export = {"data": {"metrics": [{"name": "step_count", "units": "count", "data": [
+            {"date": f"2024-09-0{day} 00:00:00 +0200", "qty": day} for day in range(1, 6)]}]}}
+        processor = HealthDataProcessor(rows=True)
+
+        batches = list(processor.process_stream_streaming(StringIO(json.dumps(export)), 'user1', batch_size=2))
+
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(batches[0][1][9], 2)
+        self.assertEqual(batches[2][0][INSERT_COLUMNS.index('metric_name')], 'step_count')
+
+    def test_rows_mode_needs_no_frame_features(self):
+        with self.assertRaises(ValueError):
+            HealthDataProcessor(rows=True, native_timestamps=True)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
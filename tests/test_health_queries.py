@@ -0,0 +1,108 @@
+import datetime
+import json
+import os
+import unittest
+from contextlib import contextmanager
+from unittest.mock import MagicMock, patch
+
+import app as app_module
+from health_queries import SERIES, QueryError, build_query, decode_cursor, encode_cursor
+
+START = datetime.datetime(2024, 9, 1)
+
+
+def fake_db_connection(cursor):
+    connection = MagicMock()
+    connection.cursor.return_value = cursor
+
+    @contextmanager
+    def db_connection():
+        yield connection
+
+    return db_connection
+
+
+class TestBuildQuery(unittest.TestCase):
+
+    def test_raw_page_continues_after_the_cursor(self):
+        after = decode_cursor(encode_cursor(START, 'AAAR3sAAEAAAACXAAA'))
+
+        sql, binds = build_query('metrics', 7, name='step_count', start=START, after=after, limit=50)
+
+        self.assertIn("ORDER BY recorded_at, ROWID", sql)
+        self.assertIn("recorded_at IS NOT NULL", sql)
+        self.assertIn("ROWID > CHARTOROWID(:after_key)", sql)
+        self.assertNotIn("OFFSET", sql)
+        self.assertEqual(binds, {'user_id': 7, 'limit': 50, 'name': 'step_count', 'start_time': START,
+                                 'after_time': START, 'after_key': 'AAAR3sAAEAAAACXAAA'})
+
+    def test_workout_samples_are_paged_on_the_indexed_expression(self):
+        with open(os.path.join(os.path.dirname(__file__), '..', 'migrations', '009_read_api_indexes.sql')) as f:
+            migration = ' '.join(f.read().split())
+
+        sql, _ = build_query('workout_samples', 7, start=START)
+
+        self.assertIn(' '.join(SERIES['workout_samples']['time'].split()), migration)
+        self.assertIn(f"ORDER BY {SERIES['workout_samples']['time']}, ROWID", sql)
+
+    def test_buckets_are_aggregated_in_sql(self):
+        sql, _ = build_query('metrics', 7, bucket='day', local=True)
+
+        self.assertIn("TRUNC(recorded_at + NUMTODSINTERVAL(NVL(utc_offset_minutes, 0), 'MINUTE'), 'DD')", sql)
+        self.assertIn("SUM(value) AS value_sum", sql)
+        self.assertIn("GROUP BY", sql)
+        with self.assertRaises(QueryError):
+            build_query('metrics', 7, bucket='month')
+
+
+class TestSeriesQuery(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch('app.find_user_by_api_key', return_value={'id': 7, 'username': 'dom'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = app_module.app.test_client()
+        self.headers = {'Authorization': 'Bearer test-key'}
+
+    def test_rows_are_streamed_as_ndjson_with_a_next_cursor(self):
+        cursor = MagicMock()
+        cursor.description = [('SAMPLE_TIME',), ('ROW_KEY',), ('NAME',), ('VALUE',)]
+        cursor.__iter__.return_value = iter([
+            (datetime.datetime(2024, 9, 1, 8), 'AAA1', 'step_count', 120),
+            (datetime.datetime(2024, 9, 1, 9), 'AAA2', 'step_count', 80)])
+
+        with patch('app.db_connection', fake_db_connection(cursor)):
+            response = self.client.get('/api/v1/metrics?name=step_count&limit=2&start=2024-09-01T00:00:00Z',
+                                       headers=self.headers)
+            lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual(lines[0], {'sample_time': '2024-09-01T08:00:00Z', 'name': 'step_count', 'value': 120})
+        self.assertEqual(decode_cursor(lines[2]['next_cursor']), (datetime.datetime(2024, 9, 1, 9), 'AAA2'))
+        self.assertEqual(cursor.arraysize, app_module.app.config['READ_ARRAYSIZE'])
+        self.assertEqual(cursor.execute.call_args.args[1]['start_time'], START)
+
+    def test_row_without_a_sample_time_ends_the_page(self):
+        cursor = MagicMock()
+        cursor.description = [('SAMPLE_TIME',), ('ROW_KEY',), ('NAME',), ('VALUE',)]
+        cursor.__iter__.return_value = iter([
+            (datetime.datetime(2024, 9, 1, 8), 'AAA1', 'step_count', 120),
+            (None, 'AAA2', 'step_count', 80)])
+
+        with patch('app.db_connection', fake_db_connection(cursor)):
+            response = self.client.get('/api/v1/metrics?name=step_count&limit=2', headers=self.headers)
+            lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(lines[1]['sample_time'], None)
+        self.assertEqual(lines[2], {'next_cursor': None})
+        self.assertEqual(decode_cursor(encode_cursor(None, 'AAA2')), (None, 'AAA2'))
+
+    def test_invalid_parameters(self):
+        for query in ('bucket=month', 'limit=0', 'start=yesterday', 'cursor=xyz', 'tz=EAT'):
+            response = self.client.get(f'/api/v1/workouts?{query}', headers=self.headers)
+            self.assertEqual(response.status_code, 400, query)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import datetime
+import io
+import json
+import unittest
+import zipfile
+from unittest.mock import MagicMock
+
+import pandas as pd
+
+from ingest_state import save_ingest_filter
+from processor.health_data_processor import HealthDataProcessor
+from processor.incremental import IngestFilter, file_digest
+from processor.rows import parse_sample_time
+
+EXPORT = {
+    "data": {
+        "metrics": [{"name": "step_count", "units": "count",
+                     "data": [{"date": "2024-09-20 00:00:00 +0200", "qty": 1},
+                              {"date": "2024-09-21 00:00:00 +0200", "qty": 2}]}],
+        "workouts": [{"location": "Outdoor",
+                      "stepCount": [{"date": "2024-09-20 17:37:40 +0200", "qty": 3}]}],
+    }
+}
+
+
+class TestIngestFilter(unittest.TestCase):
+
+    def test_samples_at_or_before_the_watermark_are_dropped(self):
+        ingest_filter = IngestFilter(watermarks={
+            'step_count': pd.Timestamp('2024-09-20 22:00:00', tz='UTC'),  # 2024-09-21 00:00 +0200
+            'workout': pd.Timestamp('2024-09-01', tz='UTC'),
+        })
+        processor = HealthDataProcessor(ingest_filter=ingest_filter)
+
+        df = processor.process_stream(io.StringIO(json.dumps(EXPORT)), user_id=1)
+
+        self.assertEqual(list(df['type']), ['workout'])
+        self.assertEqual(ingest_filter.dropped_rows, 2)
+        self.assertEqual(ingest_filter.advanced_watermarks(),
+                         {'workout': pd.Timestamp('2024-09-20 15:37:40', tz='UTC')})
+
+    def test_rows_at_or_before_the_watermark_are_dropped(self):
+        ingest_filter = IngestFilter(watermarks={
+            'step_count': datetime.datetime(2024, 9, 20, 22, tzinfo=datetime.timezone.utc),
+            'workout': pd.Timestamp('2024-09-01', tz='UTC'),
+        })
+        processor = HealthDataProcessor(ingest_filter=ingest_filter, rows=True)
+
+        rows = processor.process_stream(io.StringIO(json.dumps(EXPORT)), user_id=1)
+
+        self.assertEqual([row[1] for row in rows], ['workout'])
+        self.assertEqual(ingest_filter.dropped_rows, 2)
+        self.assertEqual(ingest_filter.advanced_watermarks(),
+                         {'workout': pd.Timestamp('2024-09-20 15:37:40', tz='UTC')})
+
+    def test_export_sample_times_are_parsed_to_utc(self):
+        utc = datetime.timezone.utc
+        self.assertEqual(parse_sample_time('2024-08-27 00:00:00 +0200'), datetime.datetime(2024, 8, 26, 22, tzinfo=utc))
+        self.assertEqual(parse_sample_time('2024-08-27 00:00:00 -0530'),
+                         datetime.datetime(2024, 8, 27, 5, 30, tzinfo=utc))
+        self.assertEqual(parse_sample_time('2024-08-27T00:00:00+02:00'), datetime.datetime(2024, 8, 26, 22, tzinfo=utc))
+        self.assertIsNone(parse_sample_time('2024-08-27 00:00:00 +02xx'))
+        self.assertIsNone(parse_sample_time(None))
+
+    def test_streaming_parse_skips_files_already_seen(self):
+        payload = json.dumps(EXPORT).encode('utf-8')
+        ingest_filter = IngestFilter(seen_files={file_digest(io.BytesIO(payload))})
+        processor = HealthDataProcessor(ingest_filter=ingest_filter)
+
+        batches = list(processor.process_stream_streaming(io.BytesIO(payload), user_id=1))
+
+        self.assertEqual(batches, [])
+        self.assertEqual(ingest_filter.skipped_files, 1)
+
+    def test_overlapping_exports_in_one_archive_are_written_once(self):
+        def export(first_day, last_day):
+            return json.dumps({"data": {"metrics": [{"name": "step_count", "units": "count", "data": [
+                {"date": f"2024-09-{day:02d} 00:00:00 +0200", "qty": day}
+                for day in range(first_day, last_day + 1)]}]}})
+
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zip_ref:
+            zip_ref.writestr('HealthAutoExport-2024-09-01-2024-09-26.json', export(1, 26))
+            zip_ref.writestr('HealthAutoExport-2024-09-18-2024-09-25.json', export(18, 25))
+
+        for kwargs, streaming in (({}, False), ({}, True), ({'rows': True}, False)):
+            ingest_filter = IngestFilter()
+            processor = HealthDataProcessor(ingest_filter=ingest_filter, **kwargs)
+            with zipfile.ZipFile(archive) as zip_ref:
+                members = zip_ref.infolist()
+                if streaming:
+                    written = sum(len(df) for df in processor.process_archive_streaming(zip_ref, members, 1))
+                else:
+                    written = len(processor.process_archive(zip_ref, members, 1))
+
+            self.assertEqual(written, 26, (kwargs, streaming))
+            self.assertEqual(ingest_filter.dropped_rows, 8)
+
+    def test_state_is_saved_as_utc(self):
+        ingest_filter = IngestFilter()
+        ingest_filter.accept_file('ab' * 32, 'export.json')
+        ingest_filter.filter(HealthDataProcessor().process_stream(io.StringIO(json.dumps(EXPORT)), 1))
+        connection = MagicMock()
+        cursor = connection.cursor.return_value
+        cursor.getbatcherrors.return_value = []
+
+        save_ingest_filter(connection, 1, ingest_filter)
+
+        watermarks = {row['series']: row['high_water'] for row in cursor.executemany.call_args_list[0].args[1]}
+        self.assertEqual(str(watermarks['step_count']), '2024-09-20 22:00:00')
+        self.assertEqual(cursor.executemany.call_args_list[1].args[1][0]['filename'], 'export.json')
+        connection.commit.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import app as app_module
+from jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, JobQueue, JobWorkers
+from processor.incremental import IngestFilter
+
+
+class TestJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.queue = JobQueue(os.path.join(self.tmp_dir.name, 'jobs.sqlite3'),
+                              os.path.join(self.tmp_dir.name, 'spool'), max_attempts=2)
+
+    def test_enqueue_claim_complete(self):
+        job_id = self.queue.enqueue(7, 'json', io.BytesIO(b'{"data": {}}'), 'export.json')
+        self.assertEqual(self.queue.get(job_id)['state'], QUEUED)
+
+        job = self.queue.claim()
+        self.assertEqual(job['id'], job_id)
+        self.assertEqual(job['state'], RUNNING)
+        with open(job['payload_path'], 'rb') as f:
+            self.assertEqual(f.read(), b'{"data": {}}')
+        self.assertIsNone(self.queue.claim())
+
+        self.queue.complete(job_id, rows=12, batches=1)
+        finished = self.queue.get(job_id)
+        self.assertEqual((finished['state'], finished['rows']), (SUCCEEDED, 12))
+        self.assertGreaterEqual(finished['run_seconds'], 0)
+        self.assertFalse(os.path.exists(job['payload_path']))
+
+    def test_job_options_are_returned_with_the_job(self):
+        job_id = self.queue.enqueue(7, 'json', io.BytesIO(b'{}'), options={'load': 'bulk'})
+
+        self.assertEqual(self.queue.claim()['options'], {'load': 'bulk'})
+        self.assertEqual(self.queue.get(job_id)['options'], {'load': 'bulk'})
+
+    def test_jobs_survive_restart_and_orphans_are_requeued(self):
+        job_id = self.queue.enqueue(7, 'zip', io.BytesIO(b'PK'))
+        self.queue.claim()
+
+        # A new queue over the same files, as after a restart of a crashed worker
+        restarted = JobQueue(self.queue.db_path, self.queue.spool_dir, max_attempts=2)
+        with patch('jobs._pid_alive', return_value=False):
+            self.assertEqual(restarted.recover(), 1)
+        self.assertEqual(restarted.get(job_id)['state'], QUEUED)
+
+        restarted.claim()
+        with patch('jobs._pid_alive', return_value=False):
+            restarted.recover()
+        self.assertEqual(restarted.get(job_id)['state'], FAILED)
+
+    def test_jobs_of_a_reused_pid_are_requeued(self):
+        job_id = self.queue.enqueue(7, 'json', io.BytesIO(b'{}'))
+        self.queue.claim()
+
+        # Still running in this process
+        self.assertEqual(self.queue.recover(), 0)
+
+        # This PID now belongs to another process than the one that claimed the job
+        with patch('jobs._process_token', return_value='other-boot:12345'):
+            self.assertEqual(self.queue.recover(), 1)
+        self.assertEqual(self.queue.get(job_id)['state'], QUEUED)
+
+    def test_workers_process_jobs_and_record_failures(self):
+        def handler(job):
+            if job['filename'] == 'bad.json':
+                raise ValueError('Invalid JSON export')
+            return 3, 1
+
+        workers = JobWorkers(self.queue, handler, size=1)
+        good = self.queue.enqueue(1, 'json', io.BytesIO(b'{}'), 'good.json')
+        bad = self.queue.enqueue(1, 'json', io.BytesIO(b'{'), 'bad.json')
+
+        workers.run_job(self.queue.claim())
+        workers.run_job(self.queue.claim())
+
+        self.assertEqual(self.queue.get(good)['rows'], 3)
+        self.assertEqual(self.queue.get(bad)['state'], FAILED)
+        self.assertIn('Invalid JSON', self.queue.get(bad)['error'])
+
+
+class TestAsyncUpload(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        config = {'JOB_DB_PATH': os.path.join(self.tmp_dir.name, 'jobs.sqlite3'),
+                  'JOB_SPOOL_DIR': os.path.join(self.tmp_dir.name, 'spool'),
+                  'JOB_WORKERS': 0}
+        patchers = [
+            patch.dict(app_module.app.config, config),
+            patch('app._ingest_workers', None),
+            patch('app.find_user_by_api_key', side_effect=lambda key: {'id': int(key), 'username': key}),
+            patch.object(app_module.FileUpload, 'load_ingest_state',
+                         side_effect=lambda user_id: IngestFilter()),
+            patch.object(app_module.FileUpload, 'save_ingest_state'),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = app_module.app.test_client()
+
+    def test_upload_returns_202_and_job_status(self):
+        payload = json.dumps({"data": {"metrics": [{"name": "step_count", "units": "count",
+                                                    "data": [{"date": "2024-08-27", "qty": 10}]}]}})
+        response = self.client.post('/api/v1/upload?mode=async', headers={'Authorization': 'Bearer 1'},
+                                    data={'file': (io.BytesIO(payload.encode('utf-8')), 'export.json')},
+                                    content_type='multipart/form-data')
+
+        self.assertEqual(response.status_code, 202)
+        job_id = response.get_json()['job_id']
+        self.assertEqual(response.headers['Location'], f'/api/v1/jobs/{job_id}')
+
+        saved = []
+        with patch.object(app_module.FileUpload, 'save_to_oracle',
+                          side_effect=lambda df, load='auto': saved.append(df)):
+            workers = app_module.get_ingest_workers()
+            workers.run_job(workers.queue.claim())
+
+        status = self.client.get(f'/api/v1/jobs/{job_id}', headers={'Authorization': 'Bearer 1'})
+        self.assertEqual(status.status_code, 200)
+        self.assertEqual(status.get_json()['state'], SUCCEEDED)
+        self.assertEqual(status.get_json()['rows'], 1)
+
+        # Jobs are only visible to their owner
+        other = self.client.get(f'/api/v1/jobs/{job_id}', headers={'Authorization': 'Bearer 2'})
+        self.assertEqual(other.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+import datetime
+import io
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+import pandas as pd
+
+import app as app_module
+from leaderboard import Leaderboard, LeaderboardCache, PointsRules, daily_totals, period_keys
+from processor.summary import workout_days
+from user_points import rebuild_user_points
+
+DAY = datetime.date(2024, 9, 2)  # a Monday
+
+
+def days_after(n):
+    return DAY + datetime.timedelta(days=n)
+
+
+class TestPointsRules(unittest.TestCase):
+
+    def test_steps_and_workout_streaks(self):
+        rules = PointsRules(step_points=1, workout_points=10, streak_points=5)
+        state = {}
+
+        changed = rules.score({DAY: {'step_count': 8000.0, 'workout': 1.0},
+                               days_after(1): {'workout': 1.0},
+                               days_after(2): {'workout': 1.0}}, state)
+
+        self.assertEqual(changed, {'all', '2024-W36', '2024-09'})
+        # 8 + 10, then 10 + 5, then 10 + 10
+        self.assertEqual(state['all']['points'], 53)
+        self.assertEqual(state['2024-W36']['points'], 53)
+        self.assertEqual((state['all']['current_streak'], state['all']['longest_streak']), (3, 3))
+
+        # A gap restarts the streak; the longest one is kept
+        rules.score({days_after(5): {'workout': 1.0}}, state)
+        self.assertEqual((state['all']['current_streak'], state['all']['longest_streak']), (1, 3))
+        self.assertEqual(state['all']['points'], 63)
+
+        # Workouts on days already past only count their steps
+        rules.score({days_after(1): {'workout': 1.0, 'step_count': 2000.0}}, state)
+        self.assertEqual(state['all']['points'], 65)
+        self.assertEqual(state['all']['last_active_day'], days_after(5))
+
+    def test_days_count_towards_their_week_and_month(self):
+        self.assertEqual(period_keys(datetime.date(2024, 12, 30)), ['all', '2025-W01', '2024-12'])
+
+    def test_daily_totals_add_up_days_split_across_batches(self):
+        summary = pd.DataFrame({'user_id': [1, 1, 2], 'metric_name': ['step_count'] * 3,
+                                'metric_day': pd.to_datetime(['2024-09-02'] * 3),
+                                'value_sum': [100.0, 50.0, 7.0]})
+        sessions = pd.DataFrame({'user_id': [1], 'start_date': ['2024-09-02 07:00:00 +0200']})
+
+        totals = daily_totals(pd.concat([summary, workout_days(sessions)], ignore_index=True))
+
+        self.assertEqual(totals[1][DAY], {'step_count': 150.0, 'workout': 0.0})
+        self.assertEqual(totals[2][DAY], {'step_count': 7.0})
+
+
+class TestRebuildUserPoints(unittest.TestCase):
+
+    def test_workout_days_come_from_workout_sessions(self):
+        cursor = MagicMock()
+        day = datetime.datetime(2024, 9, 2)
+        cursor.fetchall.side_effect = [[(42, day, 'step_count', 5000.0)], [(42, day, 'workout', 2)]]
+        connection = MagicMock()
+        connection.cursor.return_value = cursor
+
+        with patch('user_points.save_user_points') as save:
+            users = rebuild_user_points(connection, PointsRules(), user_id=42, workout_tables=True)
+
+        self.assertEqual(users, 1)
+        self.assertIn('FROM workout_sessions', cursor.execute.call_args_list[1].args[0])
+        state = save.call_args.args[2]
+        self.assertEqual(state['all']['points'], 15.0)
+        self.assertEqual(state['all']['current_streak'], 1)
+
+
+class TestLeaderboard(unittest.TestCase):
+
+    def test_ranks_and_updates(self):
+        board = Leaderboard([{'user_id': 1, 'points': 10.0, 'username': 'a'},
+                             {'user_id': 2, 'points': 30.0, 'username': 'b'},
+                             {'user_id': 3, 'points': 10.0, 'username': 'c'}])
+
+        self.assertEqual([entry['user_id'] for entry in board.top(2)], [2, 1])
+        self.assertEqual([board.rank(user_id) for user_id in (1, 2, 3)], [2, 1, 2])
+        self.assertIsNone(board.rank(4))
+
+        board.set({'user_id': 3, 'points': 40.0})
+        self.assertEqual(board.get(3), {'user_id': 3, 'points': 40.0, 'username': 'c', 'rank': 1})
+        self.assertEqual(board.rank(2), 2)
+        self.assertEqual(len(board), 3)
+
+    def test_cache_reloads_after_ttl(self):
+        now = [0.0]
+        loads = []
+        cache = LeaderboardCache(lambda key: loads.append(key) or [{'user_id': 1, 'points': 1.0}],
+                                 ttl=60, clock=lambda: now[0])
+
+        cache.board('all')
+        cache.update('all', {'user_id': 2, 'points': 5.0})
+        cache.update('2024-W36', {'user_id': 2, 'points': 5.0})  # not loaded, nothing to update
+        self.assertEqual(cache.board('all').rank(2), 1)
+        self.assertEqual(loads, ['all'])
+
+        now[0] = 61
+        self.assertIsNone(cache.board('all').rank(2))
+        self.assertEqual(loads, ['all', 'all'])
+
+
+class TestLeaderboardApi(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app_module.app.test_client()
+        self.headers = {'Authorization': 'Bearer test-key'}
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+        rankings = [{'user_id': 7, 'username': 'ann', 'points': 120.5, 'current_streak': 4,
+                     'longest_streak': 6, 'last_active_day': today},
+                    {'user_id': 42, 'username': 'dom', 'points': 80.0, 'current_streak': 2,
+                     'longest_streak': 2, 'last_active_day': today - datetime.timedelta(days=3)}]
+        patchers = [
+            patch('app.find_user_by_api_key', return_value={'id': 42, 'username': 'dom'}),
+            patch.object(app_module, 'leaderboard_cache', LeaderboardCache(lambda key: rankings)),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_top_and_my_rank(self):
+        response = self.client.get('/api/v1/leaderboard?limit=1', headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(body['users'], 2)
+        self.assertEqual(body['top'], [{'rank': 1, 'user_id': 7, 'username': 'ann', 'points': 120.5,
+                                        'current_streak': 4, 'longest_streak': 6}])
+        # A streak not extended since the day before yesterday is over
+        self.assertEqual(body['me']['rank'], 2)
+        self.assertEqual((body['me']['current_streak'], body['me']['longest_streak']), (0, 2))
+
+    def test_invalid_period(self):
+        response = self.client.get('/api/v1/leaderboard?period=year', headers=self.headers)
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_uploads_update_points(self):
+        export = {"data": {"metrics": [{"name": "step_count", "units": "count", "data": [
+            {"date": "2024-09-02 08:00:00 +0200", "qty": 6000, "source": ""},
+            {"date": "2024-09-02 18:00:00 +0200", "qty": 4000, "source": ""}]}]}}
+        with patch.dict(app_module.app.config, {'LEADERBOARD': True, 'INCREMENTAL_INGEST': False}), \
+                patch.object(app_module.FileUpload, 'save_to_oracle', return_value=None), \
+                patch('app.db_connection'), \
+                patch('app.update_user_points', return_value={}) as update:
+            response = self.client.post('/api/v1/upload?incremental=false', headers=self.headers,
+                                        data={'file': (io.BytesIO(json.dumps(export).encode('utf-8')),
+                                                       'export.json')},
+                                        content_type='multipart/form-data')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(update.call_args.args[1:3], (42, {DAY: {'step_count': 10000.0}}))
+
+    def test_merge_duplicates_rebuild_points(self):
+        export = {"data": {"metrics": [{"name": "step_count", "units": "count", "data": [
+            {"date": "2024-09-02 08:00:00 +0200", "qty": 6000, "source": ""}]}]}}
+        report = {'rows_written': 0, 'errors': 0, 'batches': 1, 'duplicates': 1}
+
+        def upload(summary_metrics):
+            with patch.dict(app_module.app.config, {'LEADERBOARD': True, 'SUMMARY_METRICS': summary_metrics}), \
+                    patch.object(app_module.FileUpload, 'save_to_oracle', return_value=report), \
+                    patch.object(app_module.FileUpload, 'save_daily_summary'), \
+                    patch('app.db_connection'), \
+                    patch('app.update_user_points', return_value={}) as update, \
+                    patch('app.rebuild_user_points', return_value=1) as rebuild:
+                response = self.client.post('/api/v1/upload?incremental=false&load=bulk', headers=self.headers,
+                                            data={'file': (io.BytesIO(json.dumps(export).encode('utf-8')),
+                                                           'export.json')},
+                                            content_type='multipart/form-data')
+            self.assertEqual(response.status_code, 200)
+            return update, rebuild
+
+        update, rebuild = upload(summary_metrics=True)
+        self.assertFalse(update.called)
+        self.assertEqual(rebuild.call_args.kwargs['user_id'], 42)
+
+        # Without summary_metrics to recompute from, the batch doesn't score
+        update, rebuild = upload(summary_metrics=False)
+        self.assertFalse(update.called)
+        self.assertFalse(rebuild.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import app as app_module
+from metrics import Counter, Histogram, Registry, exposition
+from tests.test_upload import EXPORT
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        self.rows = Counter('test_rows', 'Rows', ['outcome'], registry=self.registry)
+        self.seconds = Histogram('test_seconds', 'Seconds', ['stage'], buckets=(0.1, 1.0), registry=self.registry)
+
+    def test_text_format(self):
+        self.rows.inc(3, outcome='written')
+        self.seconds.observe(0.05, stage='parse')
+        self.seconds.observe(0.5, stage='parse')
+
+        lines = exposition(self.registry).splitlines()
+
+        self.assertIn('# TYPE test_rows counter', lines)
+        self.assertIn('test_rows_total{outcome="written"} 3.0', lines)
+        self.assertIn('# TYPE test_seconds histogram', lines)
+        self.assertIn('test_seconds_bucket{stage="parse",le="0.1"} 1.0', lines)
+        self.assertIn('test_seconds_bucket{stage="parse",le="1.0"} 2.0', lines)
+        self.assertIn('test_seconds_bucket{stage="parse",le="+Inf"} 2.0', lines)
+        self.assertIn('test_seconds_sum{stage="parse"} 0.55', lines)
+        self.assertIn('test_seconds_count{stage="parse"} 2.0', lines)
+
+    def test_labels_must_match(self):
+        with self.assertRaises(ValueError):
+            self.rows.inc(stage='parse')
+
+    def test_time_iter_observes_each_item(self):
+        items = list(self.seconds.time_iter([1, 2], stage='build'))
+
+        self.assertEqual(items, [1, 2])
+        # Two items and the final exhausted call
+        self.assertIn('test_seconds_count{stage="build"} 3.0', exposition(self.registry).splitlines())
+
+    def test_processes_sharing_a_directory_are_summed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.registry.configure(directory)
+            self.rows.inc(outcome='written')
+            for i in range(2000):
+                # Enough keys to grow the file past its initial size
+                self.rows.inc(outcome=f"other{i}")
+
+            pid = os.fork()
+            if pid == 0:
+                self.rows.inc(5, outcome='written')
+                self.seconds.observe(2.0, stage='parse')
+                os._exit(0)
+            os.waitpid(pid, 0)
+
+            lines = exposition(self.registry).splitlines()
+            self.registry.configure(None)
+
+        self.assertIn('test_rows_total{outcome="written"} 6.0', lines)
+        self.assertIn('test_rows_total{outcome="other1999"} 1.0', lines)
+        self.assertIn('test_seconds_count{stage="parse"} 1.0', lines)
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app_module.app.test_client()
+        patchers = [
+            patch('app.find_user_by_api_key', return_value={'id': 42, 'username': 'dom'}),
+            patch.object(app_module.FileUpload, 'save_to_oracle',
+                         return_value={'rows_written': 2, 'errors': 0, 'batches': 1}),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_upload_stages_are_exposed(self):
+        self.client.post('/api/v1/upload?incremental=false', headers={'Authorization': 'Bearer test-key'},
+                         data={'file': (io.BytesIO(json.dumps(EXPORT).encode('utf-8')), 'export.json')},
+                         content_type='multipart/form-data')
+
+        response = self.client.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain; version=0.0.4'))
+        text = response.get_data(as_text=True)
+        for stage in ('parse', 'flatten', 'build', 'prepare', 'downsample', 'write'):
+            self.assertIn(f'uzimasync_ingest_stage_seconds_count{{stage="{stage}"}}', text)
+        self.assertIn('uzimasync_upload_bytes_total{endpoint="upload"}', text)
+        self.assertIn('uzimasync_http_request_seconds_count{endpoint="fileupload",method="POST",status="200"}', text)
+
+    def test_token_is_required_when_configured(self):
+        with patch.dict(app_module.app.config, {'METRICS_TOKEN': 'scrape'}):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            response = self.client.get('/metrics', headers={'Authorization': 'Bearer scrape'})
+        self.assertEqual(response.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import numpy as np
+import pandas as pd
+
+from oracle_writer import HEALTH_DATA_BINDS, HealthDataWriter, StagingBulkLoader
+from processor.columns import INSERT_COLUMNS
+
+
+def make_frame(rows):
+    data = {name: [None] * rows for name in INSERT_COLUMNS}
+    data.update({
+        'health_data_user': [1] * rows,
+        'type': ['metric'] * rows,
+        'date': [f'2024-09-{i % 28 + 1:02d} 00:00:00 +0200' for i in range(rows)],
+        'value': [float(i) for i in range(rows)],
+        'workout_qty': [np.nan] * rows,
+    })
+    return pd.DataFrame(data)
+
+
+class TestHealthDataWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = MagicMock()
+        self.cursor = self.connection.cursor.return_value
+        self.cursor.getbatcherrors.return_value = []
+
+    def test_rows_are_sent_in_typed_batches(self):
+        df = make_frame(5)
+        writer = HealthDataWriter(self.connection, batch_size=2, commit_every=1)
+
+        report = writer.write(df)
+
+        self.assertEqual(report['batches'], 3)
+        self.assertEqual(report['rows_written'], 5)
+        self.assertEqual(len(report['batch_seconds']), 3)
+        self.assertEqual(self.cursor.executemany.call_count, 3)
+        self.assertEqual(self.cursor.setinputsizes.call_args.args,
+                         tuple(bind_type for _, _, bind_type in HEALTH_DATA_BINDS))
+        self.assertEqual(self.connection.commit.call_count, 3)
+
+        first_batch = self.cursor.executemany.call_args_list[0].args[1]
+        self.assertEqual(len(first_batch), 2)
+        row = first_batch[1]
+        self.assertEqual(len(row), 12)
+        self.assertIsNone(row[4])  # NaN workout_qty bound as NULL
+        self.assertEqual(row[9], 1.0)
+        self.assertTrue(self.cursor.executemany.call_args.kwargs['batcherrors'])
+
+    def test_nan_conversion_does_not_modify_the_frame(self):
+        df = make_frame(3)
+        HealthDataWriter(self.connection).write(df)
+
+        self.assertTrue(df['workout_qty'].isna().all())
+        self.assertEqual(df['workout_qty'].dtype, np.float64)
+
+    def test_batch_errors_are_counted_not_raised(self):
+        self.cursor.getbatcherrors.side_effect = [
+            [SimpleNamespace(offset=1, message='ORA-01722: invalid number')], []]
+        writer = HealthDataWriter(self.connection, batch_size=3, commit_every=0)
+
+        report = writer.write(make_frame(6))
+
+        self.assertEqual((report['rows_written'], report['errors']), (5, 1))
+        self.connection.commit.assert_called_once()
+
+    def test_empty_frame_is_a_no_op(self):
+        report = HealthDataWriter(self.connection).write(make_frame(0))
+
+        self.assertEqual(report['batches'], 0)
+        self.cursor.executemany.assert_not_called()
+
+    def test_row_tuples_are_sent_as_they_are(self):
+        rows = [(1, 'metric', f'2024-09-0{i} 00:00:00 +0200', None, None, None, None, None, None, i,
+                 'count', 'step_count') for i in range(1, 6)]
+        writer = HealthDataWriter(self.connection, batch_size=2, commit_every=0)
+
+        report = writer.write_rows(rows)
+
+        self.assertEqual((report['rows'], report['rows_written'], report['batches']), (5, 5, 3))
+        self.assertEqual(self.cursor.executemany.call_args_list[0].args[1], rows[:2])
+        self.assertEqual(self.cursor.executemany.call_args_list[2].args[1], rows[4:])
+        self.connection.commit.assert_called_once()
+
+
+class TestStagingBulkLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = MagicMock()
+        self.cursor = self.connection.cursor.return_value
+        self.cursor.getbatcherrors.return_value = []
+
+    def test_rows_are_staged_then_merged(self):
+        self.cursor.rowcount = 3
+        loader = StagingBulkLoader(self.connection, batch_size=2)
+
+        report = loader.write(make_frame(5))
+
+        statements = [call.args[0] for call in self.cursor.execute.call_args_list]
+        self.assertEqual(statements[0], "TRUNCATE TABLE health_data_stage")
+        self.assertTrue(statements[1].startswith("MERGE INTO health_data t"))
+        self.assertEqual(statements[2], "TRUNCATE TABLE health_data_stage")
+        self.assertIn("INSERT INTO health_data_stage",
+                      self.cursor.executemany.call_args.args[0])
+        # Staging batches are not committed on their own, only the merge is
+        self.connection.commit.assert_called_once()
+        self.assertEqual((report['staged'], report['rows_written'], report['duplicates']), (5, 3, 2))
+
+    def test_append_strategy_uses_direct_path_insert(self):
+        loader = StagingBulkLoader(self.connection, strategy='append')
+
+        self.assertTrue(loader.sql.startswith("INSERT /*+ APPEND */ INTO health_data"))
+        self.assertIn("NOT EXISTS", loader.sql)
+        with self.assertRaises(ValueError):
+            StagingBulkLoader(self.connection, strategy='upsert')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import app as app_module
+from password_hasher import PasswordHasher, PasswordHasherBusy
+
+
+class FakeBcrypt:
+    def __init__(self):
+        self.release = threading.Event()
+        self.rounds = []
+
+    def generate_password_hash(self, password, rounds=None):
+        self.release.wait(5)
+        self.rounds.append(rounds)
+        return f'hash:{password}'.encode('utf-8')
+
+    def check_password_hash(self, password_hash, password):
+        self.release.wait(5)
+        return password_hash == f'hash:{password}'
+
+
+class TestPasswordHasher(unittest.TestCase):
+
+    def setUp(self):
+        self.bcrypt = FakeBcrypt()
+        self.hasher = PasswordHasher(self.bcrypt, rounds=10, workers=1, max_pending=2, timeout=5)
+
+    def test_hash_and_check_run_on_the_pool(self):
+        self.bcrypt.release.set()
+
+        self.assertEqual(self.hasher.hash('secret'), 'hash:secret')
+        self.assertTrue(self.hasher.check('hash:secret', 'secret'))
+        self.assertFalse(self.hasher.check('hash:secret', 'wrong'))
+
+        stats = self.hasher.stats()
+        self.assertEqual(self.bcrypt.rounds, [10])
+        self.assertEqual((stats['operations'], stats['rejected'], stats['pending']), (3, 0, 0))
+
+    def test_operations_past_the_cap_are_rejected(self):
+        running = [self.hasher.submit(self.bcrypt.generate_password_hash, 'a'),
+                   self.hasher.submit(self.bcrypt.generate_password_hash, 'b')]
+
+        with self.assertRaises(PasswordHasherBusy):
+            self.hasher.hash('c')
+        self.assertEqual(self.hasher.stats()['pending'], 2)
+
+        self.bcrypt.release.set()
+        for future in running:
+            future.result(5)
+        self.assertEqual(self.hasher.stats()['rejected'], 1)
+        # The slots are given back once the operations are done
+        deadline = time.monotonic() + 5
+        while self.hasher.stats()['pending'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.hasher.hash('d'), 'hash:d')
+
+    def test_timed_out_operations_are_reported_busy(self):
+        self.hasher.timeout = 0.01
+
+        with self.assertRaises(PasswordHasherBusy):
+            self.hasher.hash('slow')
+        self.bcrypt.release.set()
+        self.assertEqual(self.hasher.stats()['timeouts'], 1)
+
+    def test_login_is_refused_while_the_pool_is_saturated(self):
+        client = app_module.app.test_client()
+        with patch('app.verify_user', side_effect=PasswordHasherBusy('full')):
+            response = client.post('/api/v1/login', json={'username': 'dom', 'password': 'pw'})
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import app as app_module
+from profiling import UploadProfiler
+from tests.test_upload import EXPORT
+
+
+class TestUploadProfiler(unittest.TestCase):
+
+    def test_disabled_without_a_directory(self):
+        profiler = UploadProfiler(None, sample_rate=1.0, admin_users=[1])
+
+        self.assertFalse(profiler.enabled)
+        self.assertFalse(profiler.wanted({'id': 1}, {'X-Profile': 'true'}))
+
+    def test_header_only_honoured_for_admin_users(self):
+        profiler = UploadProfiler('/tmp/profiles', admin_users=[1])
+
+        self.assertTrue(profiler.wanted({'id': 1}, {'X-Profile': 'true'}))
+        self.assertFalse(profiler.wanted({'id': 1}, {}))
+        self.assertFalse(profiler.wanted({'id': 2}, {'X-Profile': 'true'}))
+
+    def test_sampling(self):
+        profiler = UploadProfiler('/tmp/profiles', sample_rate=0.1, rng=iter([0.05, 0.5]).__next__)
+
+        self.assertTrue(profiler.wanted({'id': 2}, {}))
+        self.assertFalse(profiler.wanted({'id': 2}, {}))
+
+    def test_profile_and_summary_are_written_with_tags(self):
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = UploadProfiler(directory, admin_users=[1], top=5)
+            with profiler.profile('req/../42', {'id': 1}) as run:
+                sorted(range(1000))
+                run.tags['rows_written'] = 7
+
+            self.assertEqual(run.request_id, 'req..42')
+            prof, summary = run.paths
+            self.assertTrue(os.path.getsize(prof) > 0)
+            with open(summary) as f:
+                text = f.read()
+
+        self.assertIn('request_id: req..42', text)
+        self.assertIn('user_id: 1', text)
+        self.assertIn('rows_written: 7', text)
+        self.assertIn('cumulative', text)
+
+
+class TestProfiledUpload(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app_module.app.test_client()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        patchers = [
+            patch('app.find_user_by_api_key', return_value={'id': 42, 'username': 'dom'}),
+            patch.object(app_module.FileUpload, 'save_to_oracle',
+                         return_value={'rows_written': 2, 'errors': 0, 'batches': 1}),
+            patch.object(app_module, 'upload_profiler', UploadProfiler(self.directory.name, admin_users=[42])),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def upload(self, headers):
+        return self.client.post('/api/v1/upload?incremental=false',
+                                headers=dict(headers, Authorization='Bearer test-key'),
+                                data={'file': (io.BytesIO(json.dumps(EXPORT).encode('utf-8')), 'export.json')},
+                                content_type='multipart/form-data')
+
+    def test_requested_profile_is_written(self):
+        response = self.upload({'X-Profile': 'true', 'X-Request-ID': 'abc123'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['X-Profile-Id'], 'abc123')
+        files = sorted(os.listdir(self.directory.name))
+        self.assertEqual([name.split('-', 1)[1] for name in files], ['abc123.prof', 'abc123.txt'])
+        with open(os.path.join(self.directory.name, files[1])) as f:
+            text = f.read()
+        self.assertIn('status: 200', text)
+        self.assertIn('rows_written: 2', text)
+        self.assertIn('filename: export.json', text)
+
+    def test_unprofiled_upload_writes_nothing(self):
+        response = self.upload({})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response.headers)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
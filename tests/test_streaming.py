@@ -0,0 +1,107 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from processor.columns import INSERT_COLUMNS
+from processor.health_data_processor import HealthDataProcessor
+from processor.streaming import JsonReader, iter_record_batches, iter_records, read_headers
+
+# Keys are deliberately out of order, as in real Health Auto Export files
+EXPORT = {
+    "data": {
+        "stateOfMind": [],
+        "workouts": [{
+            "stepCount": [
+                {"date": "2024-09-05 17:37:40 +0200", "source": "iPhone", "qty": 1.06, "units": "steps"},
+                {"date": "2024-09-05 17:37:41 +0200", "source": "iPhone", "qty": 2.65, "units": "steps"},
+            ],
+            "route": [{"lat": 1.5, "lon": 36.8}, {"lat": 1.6, "lon": 36.9}],
+            "metadata": {},
+            "location": "Outdoor",
+            "elevationUp": {"qty": 23.15, "units": "m"},
+        }],
+        "metrics": [
+            {"data": [{"date": "2024-08-27 00:00:00 +0200", "qty": 3.79, "source": ""},
+                      {"date": "2024-08-28 00:00:00 +0200", "qty": 4.12}],
+             "units": "km", "name": "walking_running_distance"},
+            {"name": "heart_rate", "units": "count/min",
+             "data": [{"date": "2024-08-27 00:00:00 +0200", "Min": 54, "Avg": 80.4, "Max": 128,
+                       "source": "Billy’s Apple Watch \\\"2\\\""}]},
+        ],
+        "ecg": [],
+    }
+}
+
+
+class TrickleStream(io.RawIOBase):
+    """Non-seekable stream returning a few bytes per read, to exercise chunk boundaries."""
+
+    def __init__(self, data, step=3):
+        self._data = data
+        self._pos = 0
+        self._step = step
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        chunk = self._data[self._pos:self._pos + self._step]
+        self._pos += len(chunk)
+        return chunk
+
+
+class TestStreamingParser(unittest.TestCase):
+
+    def setUp(self):
+        self.payload = json.dumps(EXPORT).encode('utf-8')
+
+    def expected_rows(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'export.json')
+            with open(path, 'wb') as f:
+                f.write(self.payload)
+            df = HealthDataProcessor(tmp_dir).process_file(path, 7)[INSERT_COLUMNS]
+        return [tuple(None if v != v else v for v in row) for row in df.itertuples(index=False)]
+
+    def test_two_pass_matches_in_memory_processing(self):
+        batches = list(iter_record_batches(lambda: io.BytesIO(self.payload), 7, batch_size=2))
+
+        self.assertEqual([len(b) for b in batches], [2, 2, 1])
+        self.assertEqual([row for batch in batches for row in batch], self.expected_rows())
+
+    def test_single_pass_over_small_chunks(self):
+        rows = list(iter_records(TrickleStream(self.payload), 7))
+
+        self.assertEqual(sorted(rows, key=repr), sorted(self.expected_rows(), key=repr))
+
+    def test_headers_read_without_samples(self):
+        headers = read_headers(TrickleStream(self.payload, step=5))
+
+        self.assertEqual(headers[('workout', 0)]['location'], 'Outdoor')
+        self.assertEqual(headers[('metric', 0)], {'units': 'km', 'name': 'walking_running_distance'})
+
+    def test_numbers_split_across_chunks(self):
+        reader = JsonReader(TrickleStream(b'[123456789, -0.25e-3, "a\\"b"]', step=2), chunk_size=2)
+        values = []
+        for _ in reader.iter_array():
+            values.append(reader.value())
+
+        self.assertEqual(values, [123456789, -0.25e-3, 'a"b'])
+
+    def test_truncated_document_raises(self):
+        with self.assertRaises(ValueError):
+            list(iter_records(io.BytesIO(self.payload[:-20]), 7))
+
+    def test_processor_streaming_mode_yields_dataframes(self):
+        processor = HealthDataProcessor('mock_dir')
+        frames = list(processor.iter_batches(lambda: io.BytesIO(self.payload), 7, batch_size=4))
+
+        self.assertEqual([len(df) for df in frames], [4, 1])
+        self.assertEqual(frames[0].shape[1], 12)
+        self.assertEqual(frames[1].iloc[0]['metric_name'], 'heart_rate')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import datetime
+import unittest
+from unittest.mock import MagicMock
+
+import numpy as np
+import pandas as pd
+
+from processor.columns import INSERT_COLUMNS
+from processor.summary import SUMMARY_COLUMNS, daily_summary
+from summary_metrics import add_daily_summary, refresh_days
+
+
+def make_frame(rows):
+    data = {name: [None] * len(rows) for name in INSERT_COLUMNS}
+    data.update({key: [row.get(key) for row in rows] for row in rows for key in row})
+    frame = pd.DataFrame(data)
+    frame['value'] = frame['value'].astype('float64')
+    frame['workout_qty'] = frame['workout_qty'].astype('float64')
+    return frame
+
+
+class TestDailySummary(unittest.TestCase):
+
+    def test_samples_are_aggregated_per_local_day_and_series(self):
+        df = make_frame([
+            {'health_data_user': 1, 'type': 'metric', 'metric_name': 'step_count', 'units': 'count',
+             'date': '2024-08-27 23:30:00 +0200', 'value': 100.0, 'workout_qty': np.nan},
+            {'health_data_user': 1, 'type': 'metric', 'metric_name': 'step_count', 'units': 'count',
+             'date': '2024-08-27 08:00:00 +0200', 'value': 50.0, 'workout_qty': np.nan},
+            {'health_data_user': 1, 'type': 'metric', 'metric_name': 'step_count', 'units': 'count',
+             'date': '2024-08-28 00:10:00 +0200', 'value': 10.0, 'workout_qty': np.nan},
+            {'health_data_user': 1, 'type': 'workout', 'workout_units': 'steps',
+             'date': '2024-08-27 17:00:00 +0200', 'value': np.nan, 'workout_qty': 3.0},
+            {'health_data_user': 1, 'type': 'metric', 'metric_name': 'step_count', 'units': 'count',
+             'date': 'not a date', 'value': 1.0, 'workout_qty': np.nan},
+        ])
+
+        summary = daily_summary(df).set_index(['metric_day', 'metric_name'])
+
+        self.assertEqual(len(summary), 3)
+        steps = summary.loc[(pd.Timestamp('2024-08-27'), 'step_count')]
+        self.assertEqual((steps['value_sum'], steps['value_min'], steps['value_max'], steps['sample_count']),
+                         (150.0, 50.0, 100.0, 2))
+        self.assertEqual(summary.loc[(pd.Timestamp('2024-08-28'), 'step_count'), 'value_sum'], 10.0)
+        workout = summary.loc[(pd.Timestamp('2024-08-27'), 'workout')]
+        self.assertEqual((workout['units'], workout['value_sum']), ('steps', 3.0))
+
+    def test_rolled_up_rows_count_their_samples(self):
+        df = make_frame([
+            {'health_data_user': 1, 'type': 'workout', 'workout_units': 'steps',
+             'date': '2024-09-05 17:37:40 +0200', 'value': np.nan, 'workout_qty': 12.0, 'samples': 60,
+             'sample_min': 0.1, 'sample_max': 0.4},
+            {'health_data_user': 1, 'type': 'workout', 'workout_units': 'steps',
+             'date': '2024-09-05 17:38:40 +0200', 'value': np.nan, 'workout_qty': 0.3, 'samples': 1,
+             'sample_min': 0.3, 'sample_max': 0.3},
+        ])
+
+        summary = daily_summary(df)
+        self.assertEqual(summary['sample_count'].tolist(), [61])
+        # The extremes of the samples, not of the bucket sums
+        self.assertEqual((summary['value_min'].item(), summary['value_max'].item()), (0.1, 0.4))
+
+    def test_empty_frame(self):
+        self.assertEqual(list(daily_summary(make_frame([{'type': 'metric'}]).iloc[:0]).columns),
+                         SUMMARY_COLUMNS)
+
+
+class TestSummaryMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.connection = MagicMock()
+        self.cursor = self.connection.cursor.return_value
+        self.summary = pd.DataFrame({
+            'user_id': [1, 1], 'metric_day': pd.to_datetime(['2024-08-27', '2024-08-27']),
+            'metric_name': ['step_count', 'heart_rate'], 'units': ['count', None],
+            'value_sum': [150.0, np.nan], 'value_min': [50.0, np.nan], 'value_max': [100.0, np.nan],
+            'sample_count': [2, 1]})
+
+    def test_days_are_upserted_in_one_batch(self):
+        self.assertEqual(add_daily_summary(self.connection, self.summary), 2)
+
+        rows = self.cursor.executemany.call_args.args[1]
+        self.assertEqual(rows[0], (1, datetime.datetime(2024, 8, 27), 'step_count', 'count',
+                                   150.0, 50.0, 100.0, 2))
+        self.assertIsNone(rows[1][4])
+        self.connection.commit.assert_called_once()
+
+    def test_touched_days_are_recomputed_once(self):
+        self.assertEqual(refresh_days(self.connection, self.summary), 1)
+
+        rows = self.cursor.executemany.call_args.args[1]
+        self.assertEqual(rows, [{'user_id': 1, 'day_prefix': '2024-08-27%'}])
+
+
+if __name__ == '__main__':
+    unittest.main()
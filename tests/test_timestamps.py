@@ -0,0 +1,59 @@
+import datetime
+import io
+import json
+import unittest
+from unittest.mock import MagicMock
+
+import oracledb
+import pandas as pd
+
+from oracle_writer import HealthDataWriter, binds_for
+from processor.health_data_processor import HealthDataProcessor
+from processor.timestamps import add_timestamp_columns, split_sample_dates
+
+EXPORT = {"data": {"metrics": [{"name": "step_count", "units": "count", "data": [
+    {"date": "2024-09-05 00:30:00 +0200", "qty": 10},
+    {"date": "2024-09-05 17:37:40 -0130", "qty": 20},
+    {"date": "2024-09-06", "qty": 30}]}]}}
+
+
+class TestTimestamps(unittest.TestCase):
+
+    def test_dates_are_normalised_to_utc_with_their_offset(self):
+        dates = pd.Series(['2024-09-05 00:30:00 +0200', '2024-09-05 17:37:40 -0130',
+                           '2024-09-05T10:00:00+05:45', '2024-09-06', 'not a date', None])
+
+        times, offsets = split_sample_dates(dates)
+
+        self.assertEqual([str(t) for t in times[:4]],
+                         ['2024-09-04 22:30:00+00:00', '2024-09-05 19:07:40+00:00',
+                          '2024-09-05 04:15:00+00:00', '2024-09-06 00:00:00+00:00'])
+        self.assertTrue(times[4:].isna().all())
+        self.assertEqual(list(offsets[:3]), [120, -90, 345])
+        self.assertTrue(offsets[3:].isna().all())
+
+    def test_timestamps_are_bound_as_native_datetimes(self):
+        df = HealthDataProcessor(native_timestamps=True).process_stream(
+            io.StringIO(json.dumps(EXPORT)), user_id=1)
+        connection = MagicMock()
+        cursor = connection.cursor.return_value
+        cursor.getbatcherrors.return_value = []
+
+        HealthDataWriter(connection, binds=binds_for(df)).write(df)
+
+        self.assertIn(oracledb.DB_TYPE_TIMESTAMP, cursor.setinputsizes.call_args.args)
+        self.assertIn('recorded_at, utc_offset_minutes', cursor.executemany.call_args.args[0])
+        rows = cursor.executemany.call_args.args[1]
+        self.assertEqual(rows[0][-2:], (datetime.datetime(2024, 9, 4, 22, 30), 120.0))
+        self.assertEqual(rows[2][-2:], (datetime.datetime(2024, 9, 6), None))
+
+    def test_frames_without_timestamps_keep_the_text_binds(self):
+        df = add_timestamp_columns(pd.DataFrame({'date': ['2024-09-05 00:30:00 +0200']}))
+
+        self.assertEqual(df['recorded_at'].dtype, 'datetime64[us]')
+        self.assertNotIn('recorded_at', [column for _, column, _ in binds_for(df.drop(
+            columns=['recorded_at', 'utc_offset']))])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,274 @@
+import gzip
+import io
+import json
+import os
+import unittest
+import zipfile
+from unittest.mock import patch
+
+import app as app_module
+from processor.incremental import IngestFilter
+
+EXPORT = {
+    "data": {
+        "metrics": [{"name": "step_count", "units": "count",
+                     "data": [{"date": "2024-08-27 00:00:00 +0200", "qty": 2536, "source": ""}]}],
+        "workouts": [{"location": "Outdoor",
+                      "stepCount": [{"date": "2024-09-05 17:37:40 +0200", "qty": 1.07,
+                                     "units": "steps", "source": "iPhone"}]}],
+    }
+}
+
+
+def make_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        for name, content in members.items():
+            zip_ref.writestr(name, content)
+    buffer.seek(0)
+    return buffer
+
+
+class TestFileUpload(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app_module.app.test_client()
+        self.headers = {'Authorization': 'Bearer test-key'}
+        self.saved = []
+        self.seen_files, self.watermarks = set(), {}
+        patchers = [
+            patch('app.find_user_by_api_key', return_value={'id': 42, 'username': 'dom'}),
+            patch.object(app_module.FileUpload, 'save_to_oracle',
+                         side_effect=lambda df, load='auto': self.saved.append(df)),
+            patch.object(app_module.FileUpload, 'load_ingest_state',
+                         side_effect=lambda user_id: IngestFilter(self.seen_files, self.watermarks)),
+            patch.object(app_module.FileUpload, 'save_ingest_state', side_effect=self.save_ingest_state),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def save_ingest_state(self, user_id, ingest_filter):
+        # Stands in for the ingest_files / ingest_watermarks tables
+        self.seen_files.update(digest for digest, _ in ingest_filter.new_files)
+        self.watermarks.update(ingest_filter.advanced_watermarks())
+
+    def upload(self, data, filename):
+        return self.client.post('/api/v1/upload', headers=self.headers,
+                                data={'file': (data, filename)},
+                                content_type='multipart/form-data')
+
+    def test_zip_members_are_read_from_the_upload(self):
+        payload = json.dumps(EXPORT)
+        archive = make_zip({'export.json': payload,
+                            '__MACOSX/._export.json': 'not json',
+                            'nested/second.json': payload.replace('2024-0', '2025-0')})
+        upload_dir = app_module.app.config['UPLOAD_FOLDER']
+        before = set(os.listdir(upload_dir)) if os.path.isdir(upload_dir) else set()
+
+        response = self.upload(archive, 'export.zip')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sum(len(df) for df in self.saved), 4)
+        self.assertEqual(set(self.saved[0]['health_data_user']), {42})
+        after = set(os.listdir(upload_dir)) if os.path.isdir(upload_dir) else set()
+        self.assertEqual(before, after)
+
+    def test_zip_member_limit(self):
+        archive = make_zip({f'{i}.json': '{}' for i in range(5)})
+
+        with patch.dict(app_module.app.config, {'MAX_ZIP_MEMBERS': 3}):
+            response = self.upload(archive, 'many.zip')
+
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.saved, [])
+
+    def test_zip_uncompressed_size_limit(self):
+        archive = make_zip({'big.json': json.dumps(EXPORT) + ' ' * 100000})
+
+        with patch.dict(app_module.app.config, {'MAX_ZIP_UNCOMPRESSED_BYTES': 50000}):
+            response = self.upload(archive, 'big.zip')
+
+        self.assertEqual(response.status_code, 413)
+
+    def test_json_upload_in_streaming_mode(self):
+        with patch.dict(app_module.app.config, {'STREAMING_PARSE': True, 'STREAM_BATCH_SIZE': 1}):
+            response = self.upload(io.BytesIO(json.dumps(EXPORT).encode('utf-8')), 'export.json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([len(df) for df in self.saved], [1, 1])
+
+    def test_repeat_and_overlapping_uploads_only_save_new_samples(self):
+        payload = json.dumps(EXPORT)
+        response = self.upload(make_zip({'a.json': payload, 'copy/a.json': payload}), 'export.zip')
+        self.assertEqual(response.get_json()['files_skipped'], 1)
+        self.assertEqual(sum(len(df) for df in self.saved), 2)
+
+        # The same export again is skipped without saving anything
+        self.saved.clear()
+        response = self.upload(io.BytesIO(payload.encode('utf-8')), 'export.json')
+        self.assertEqual(response.get_json()['files_skipped'], 1)
+        self.assertEqual(self.saved, [])
+
+        # An overlapping window only saves the samples past the watermark
+        newer = json.loads(payload)
+        newer['data']['metrics'][0]['data'].append(
+            {"date": "2024-08-28 00:00:00 +0200", "qty": 1200, "source": ""})
+        response = self.upload(io.BytesIO(json.dumps(newer).encode('utf-8')), 'export.json')
+        self.assertEqual(response.get_json()['rows_skipped'], 2)
+        self.assertEqual(list(self.saved[0]['value']), [1200])
+
+        # Incremental ingest can be turned off, e.g. for a backfill
+        self.saved.clear()
+        response = self.client.post('/api/v1/upload?incremental=false', headers=self.headers,
+                                    data={'file': (io.BytesIO(payload.encode('utf-8')), 'export.json')},
+                                    content_type='multipart/form-data')
+        self.assertEqual(sum(len(df) for df in self.saved), 2)
+
+    def test_row_ingest_saves_row_tuples(self):
+        payload = json.dumps(EXPORT)
+        with patch.dict(app_module.app.config, {'ROW_INGEST': True}):
+            response = self.upload(io.BytesIO(payload.encode('utf-8')), 'export.json')
+            self.assertEqual(response.status_code, 200)
+            self.assertIsInstance(self.saved[0], list)
+            self.assertEqual([row[1] for row in self.saved[0]], ['workout', 'metric'])
+
+            # Watermarks work the same on rows
+            self.saved.clear()
+            newer = json.loads(payload)
+            newer['data']['metrics'][0]['data'].append(
+                {"date": "2024-08-28 00:00:00 +0200", "qty": 1200, "source": ""})
+            response = self.upload(io.BytesIO(json.dumps(newer).encode('utf-8')), 'export.json')
+            self.assertEqual(response.get_json()['rows_skipped'], 2)
+            self.assertEqual([row[9] for row in self.saved[0]], [1200])
+
+            # Features that need DataFrames keep the DataFrame path
+            self.saved.clear()
+            with patch.dict(app_module.app.config, {'DOWNSAMPLE_RESOLUTION': '1min'}):
+                self.client.post('/api/v1/upload?incremental=false', headers=self.headers,
+                                 data={'file': (io.BytesIO(payload.encode('utf-8')), 'export.json')},
+                                 content_type='multipart/form-data')
+            self.assertNotIsInstance(self.saved[0], list)
+
+    def test_load_mode_is_passed_to_the_writer(self):
+        with patch.object(app_module.FileUpload, 'save_to_oracle', return_value=None) as save:
+            response = self.client.post('/api/v1/upload?load=bulk', headers=self.headers,
+                                        data={'file': (io.BytesIO(json.dumps(EXPORT).encode('utf-8')),
+                                                       'export.json')},
+                                        content_type='multipart/form-data')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(save.call_args.args[1], 'bulk')
+
+        response = self.client.post('/api/v1/upload?load=fast', headers=self.headers,
+                                    data={'file': (io.BytesIO(b'{}'), 'export.json')},
+                                    content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 400)
+
+    def auto_load_modes(self, threshold_bytes):
+        archive = make_zip({f'export-{i}.json': json.dumps(EXPORT) for i in range(3)})
+
+        with patch.object(app_module.FileUpload, 'save_to_oracle', return_value=None) as save, \
+                patch.dict(app_module.app.config, {'BULK_LOAD_THRESHOLD_BYTES': threshold_bytes,
+                                                   'STREAMING_PARSE': True, 'STREAM_BATCH_SIZE': 2}):
+            response = self.client.post('/api/v1/upload?load=auto&incremental=false', headers=self.headers,
+                                        data={'file': (archive, 'export.zip')},
+                                        content_type='multipart/form-data')
+
+        self.assertEqual(response.status_code, 200)
+        return [call.args[1] for call in save.call_args_list]
+
+    def test_auto_load_decides_once_per_upload(self):
+        # The members' declared sizes add up past the threshold although each one stays below it
+        member_bytes = len(json.dumps(EXPORT))
+        self.assertEqual(self.auto_load_modes(member_bytes + 1), ['bulk', 'bulk', 'bulk'])
+        self.assertEqual(self.auto_load_modes(3 * member_bytes + 1), ['rows', 'rows', 'rows'])
+
+    def test_payload_size(self):
+        archive = make_zip({'export.json': '{"data": {}}', '__MACOSX/._export.json': 'xx'})
+        self.assertEqual(app_module.payload_size('zip', archive), 12)
+
+        stream = io.BytesIO(b'0123456789')
+        stream.seek(4)
+        self.assertEqual(app_module.payload_size('json', stream), 6)
+        self.assertEqual(stream.tell(), 4)
+
+    def test_invalid_zip(self):
+        response = self.upload(io.BytesIO(b'not a zip'), 'broken.zip')
+
+        self.assertEqual(response.status_code, 400)
+
+
+class TestPushUpload(unittest.TestCase):
+
+    def setUp(self):
+        self.client = app_module.app.test_client()
+        self.saved = []
+        patchers = [
+            patch('app.find_user_by_api_key', return_value={'id': 42, 'username': 'dom'}),
+            patch.object(app_module.FileUpload, 'save_to_oracle',
+                         side_effect=lambda df, load='auto': self.saved.append(df)),
+            patch.object(app_module.FileUpload, 'load_ingest_state',
+                         side_effect=lambda user_id: IngestFilter()),
+            patch.object(app_module.FileUpload, 'save_ingest_state'),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def push(self, body, content_type='application/json', encoding=None):
+        headers = {'Authorization': 'Bearer test-key', 'Content-Type': content_type}
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return self.client.post('/api/v1/push', headers=headers, data=body)
+
+    def test_gzip_json_body(self):
+        response = self.push(gzip.compress(json.dumps(EXPORT).encode('utf-8')), encoding='gzip')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['rows_written'], 2)
+        self.assertEqual(set(self.saved[0]['health_data_user']), {42})
+
+    def test_ndjson_body_is_saved_in_batches(self):
+        # Three exports of different years (identical samples would be written once)
+        body = '\n'.join(json.dumps(EXPORT).replace('2024-0', f'{year}-0') for year in (2024, 2025, 2026)) + '\n'
+
+        with patch.dict(app_module.app.config, {'STREAM_BATCH_SIZE': 4}):
+            response = self.push(body.encode('utf-8'), 'application/x-ndjson')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([len(df) for df in self.saved], [4, 2])
+
+    def test_workouts_go_to_the_workout_tables(self):
+        tables = []
+        body = json.dumps(EXPORT)
+        with patch.dict(app_module.app.config, {'WORKOUT_TABLES': True}), \
+                patch.object(app_module.FileUpload, 'save_workout_tables',
+                             side_effect=lambda t: tables.append(t) or {name: {'rows_written': len(df)}
+                                                                        for name, df in t.items()}):
+            json_response = self.push(body.encode('utf-8'))
+            ndjson_response = self.push((body + '\n').encode('utf-8'), 'application/x-ndjson')
+
+        self.assertEqual((json_response.status_code, ndjson_response.status_code), (200, 200))
+        # Both bodies: the metric sample in health_data, the workout as a session
+        self.assertEqual([list(df['type']) for df in self.saved], [['metric'], ['metric']])
+        self.assertEqual([len(t['workout_sessions']) for t in tables], [1, 1])
+        self.assertEqual(json_response.get_json()['workouts_written'], 1)
+
+    def test_rejected_bodies(self):
+        self.assertEqual(self.push(b'{}', 'text/plain').status_code, 415)
+        self.assertEqual(self.push(b'{}', encoding='br').status_code, 415)
+        self.assertEqual(self.push(b'not gzip', encoding='gzip').status_code, 400)
+        self.assertEqual(self.push(b'[1, 2]\n', 'application/x-ndjson').status_code, 400)
+
+        bomb = gzip.compress(b' ' * 100000 + json.dumps(EXPORT).encode('utf-8'))
+        with patch.dict(app_module.app.config, {'PUSH_MAX_BYTES': 50000}):
+            self.assertEqual(self.push(bomb, encoding='gzip').status_code, 413)
+        # The encoded size has its own limit
+        with patch.dict(app_module.app.config, {'PUSH_MAX_BODY_BYTES': len(bomb) - 1}):
+            self.assertEqual(self.push(bomb, encoding='gzip').status_code, 413)
+        self.assertEqual(self.saved, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
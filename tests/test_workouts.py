@@ -0,0 +1,89 @@
+import io
+import json
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from oracle_writer import WorkoutTablesWriter
+from processor.health_data_processor import HealthDataProcessor
+from processor.workouts import workout_id
+
+WORKOUT = {
+    "id": "214122E4-05DA-40EE-9097-CFF847A27A81",
+    "name": "Outdoor Run",
+    "location": "Outdoor",
+    "start": "2024-09-05 17:34:36 +0200",
+    "end": "2024-09-05 18:33:07 +0200",
+    "duration": 3492.5,
+    "activeEnergyBurned": {"qty": 610.164, "units": "kJ"},
+    "distance": {"qty": 8.44, "units": "km"},
+    "stepCount": [{"qty": 1.07, "units": "steps", "date": "2024-09-05 17:37:40 +0200", "source": "iPhone"},
+                  {"qty": 2.5, "units": "steps", "date": "2024-09-05 17:37:41 +0200", "source": "iPhone"}],
+    "activeEnergy": [{"qty": 0.35, "units": "kcal", "date": "2024-09-05 17:34:36 +0200"}],
+    "heartRateData": [{"Min": 92, "Avg": 95, "Max": 99, "units": "bpm", "date": "2024-09-05 17:35:00 +0200"}],
+    "route": [{"latitude": -1.2, "longitude": 36.9}],
+}
+EXPORT = {"data": {"workouts": [WORKOUT],
+                   "metrics": [{"name": "step_count", "units": "count",
+                                "data": [{"date": "2024-09-05 00:00:00 +0200", "qty": 2536}]}]}}
+
+
+class TestWorkoutTables(unittest.TestCase):
+
+    def test_workouts_are_split_into_sessions_and_narrow_samples(self):
+        processor = HealthDataProcessor(workout_tables=True)
+
+        df = processor.process_stream(io.StringIO(json.dumps(EXPORT)), user_id=7)
+        tables = processor.take_workout_tables()
+
+        self.assertEqual(list(df['type']), ['metric'])
+        session = tables['workout_sessions'].iloc[0]
+        self.assertEqual((session['workout_id'], session['duration'], session['distance_qty']),
+                         (WORKOUT['id'], 3492.5, 8.44))
+        quantities = tables['workout_quantity_samples']
+        self.assertEqual(list(quantities['series']), ['stepCount', 'stepCount', 'activeEnergy'])
+        self.assertEqual(list(quantities.columns),
+                         ['user_id', 'workout_id', 'series', 'recorded_date', 'qty', 'units', 'source'])
+        heart_rate = tables['workout_heart_rate_samples'].iloc[0]
+        self.assertEqual((heart_rate['bpm_min'], heart_rate['bpm_avg'], heart_rate['bpm_max']), (92, 95, 99))
+
+    def test_streaming_parse_collects_the_same_tables(self):
+        payload = json.dumps(EXPORT).encode('utf-8')
+        serial = HealthDataProcessor(workout_tables=True)
+        serial.process_stream(io.BytesIO(payload), user_id=7)
+        streaming = HealthDataProcessor(workout_tables=True)
+
+        frames = list(streaming.process_stream_streaming(io.BytesIO(payload), user_id=7))
+
+        self.assertEqual(sum(len(df) for df in frames), 1)
+        streamed = streaming.take_workout_tables()
+        for table, df in serial.take_workout_tables().items():
+            self.assertTrue(df.equals(streamed[table]), table)
+
+    def test_workouts_without_an_id_get_a_stable_one(self):
+        workout = {key: value for key, value in WORKOUT.items() if key != 'id'}
+
+        self.assertEqual(workout_id(workout), workout_id(dict(workout)))
+        self.assertNotEqual(workout_id(workout), workout_id({**workout, 'start': '2024-09-06'}))
+
+    def test_samples_of_sessions_already_stored_are_not_written(self):
+        processor = HealthDataProcessor(workout_tables=True)
+        second = {**WORKOUT, "id": "NEW"}
+        processor.process_stream(io.StringIO(json.dumps({"data": {"workouts": [WORKOUT, second]}})), 7)
+        connection = MagicMock()
+        cursor = connection.cursor.return_value
+        # The first session violates the primary key
+        cursor.getbatcherrors.side_effect = [
+            [SimpleNamespace(offset=0, message='ORA-00001: unique constraint violated')], [], []]
+
+        reports = WorkoutTablesWriter(connection).write(processor.take_workout_tables())
+
+        self.assertEqual(reports['workout_sessions']['rows_written'], 1)
+        self.assertEqual(reports['workout_quantity_samples']['rows'], 3)
+        written = cursor.executemany.call_args_list[1].args[1]
+        self.assertEqual({row[1] for row in written}, {'NEW'})
+        connection.commit.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import datetime
+
+from leaderboard import daily_totals, period_keys
+
+_MERGE_POINTS = """
+    MERGE INTO user_points p
+    USING (SELECT :user_id AS user_id, :period AS period, :points AS points,
+                  :current_streak AS current_streak, :longest_streak AS longest_streak,
+                  :last_active_day AS last_active_day FROM dual) s
+    ON (p.user_id = s.user_id AND p.period = s.period)
+    WHEN MATCHED THEN UPDATE SET
+        p.points = s.points, p.current_streak = s.current_streak,
+        p.longest_streak = s.longest_streak, p.last_active_day = s.last_active_day,
+        p.updated_at = SYSTIMESTAMP
+    WHEN NOT MATCHED THEN INSERT
+        (user_id, period, points, current_streak, longest_streak, last_active_day)
+        VALUES (s.user_id, s.period, s.points, s.current_streak, s.longest_streak, s.last_active_day)"""
+
+# Daily totals the points rules look at, oldest first
+_SELECT_DAYS = """
+    SELECT user_id, metric_day, metric_name, value_sum
+      FROM summary_metrics
+     WHERE metric_name IN ('step_count', 'workout'){where}
+     ORDER BY user_id, metric_day"""
+
+# Workout days from the narrow workout tables (WORKOUT_TABLES), whose workouts are not in
+# summary_metrics: the local day each session started on
+_SELECT_WORKOUT_DAYS = """
+    SELECT user_id, TO_DATE(SUBSTR(start_date, 1, 10), 'YYYY-MM-DD') AS metric_day,
+           'workout' AS metric_name, COUNT(*) AS value_sum
+      FROM workout_sessions
+     WHERE REGEXP_LIKE(start_date, '^[0-9]{{4}}-[0-9]{{2}}-[0-9]{{2}}'){where}
+     GROUP BY user_id, SUBSTR(start_date, 1, 10)"""
+
+
+def _day(value):
+    return value.date() if isinstance(value, datetime.datetime) else value
+
+
+def load_user_points(connection, user_id, periods):
+    """
+    Stored state of a user's periods ({period: new_state()}). Called in the
+    transaction that saves the new state: the user row is locked so two
+    uploads of one user do not both add to the same old totals.
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT id FROM users WHERE id = :user_id FOR UPDATE", user_id=user_id)
+        cursor.fetchall()
+        binds = {'user_id': user_id}
+        binds.update({f'p{i}': period for i, period in enumerate(periods)})
+        cursor.execute(
+            "SELECT period, points, current_streak, longest_streak, last_active_day FROM user_points "
+            f"WHERE user_id = :user_id AND period IN ({', '.join(f':p{i}' for i in range(len(periods)))})",
+            binds)
+        return {period: {'points': float(points), 'current_streak': current_streak or 0,
+                         'longest_streak': longest_streak or 0, 'last_active_day': _day(last_active_day)}
+                for period, points, current_streak, longest_streak, last_active_day in cursor}
+    finally:
+        cursor.close()
+
+
+def save_user_points(connection, user_id, state, periods):
+    """Write the given periods of a user's state and commit."""
+    rows = [{'user_id': user_id, 'period': period, **state[period]} for period in periods]
+    cursor = connection.cursor()
+    try:
+        if rows:
+            cursor.executemany(_MERGE_POINTS, rows)
+        connection.commit()
+    finally:
+        cursor.close()
+
+
+def update_user_points(connection, user_id, days, rules):
+    """
+    Apply an upload's daily totals of one user ({day: {series: value_sum}}).
+    :return: {period: state} of the periods changed
+    """
+    periods = sorted({key for day in days for key in period_keys(day)})
+    if not periods:
+        return {}
+    state = load_user_points(connection, user_id, periods)
+    changed = rules.score(days, state)
+    save_user_points(connection, user_id, state, sorted(changed))
+    return {period: state[period] for period in changed}
+
+
+def load_rankings(connection, period):
+    """Every user's entry of a period, for a Leaderboard."""
+    cursor = connection.cursor()
+    try:
+        cursor.arraysize = 1000
+        cursor.execute("""
+            SELECT p.user_id, u.username, p.points, p.current_streak, p.longest_streak,
+                   p.last_active_day
+              FROM user_points p JOIN users u ON u.id = p.user_id
+             WHERE p.period = :period""", period=period)
+        return [{'user_id': user_id, 'username': username, 'points': float(points),
+                 'current_streak': current_streak or 0, 'longest_streak': longest_streak or 0,
+                 'last_active_day': _day(last_active_day)}
+                for user_id, username, points, current_streak, longest_streak, last_active_day in cursor]
+    finally:
+        cursor.close()
+
+
+def rebuild_user_points(connection, rules, user_id=None, workout_tables=False):
+    """
+    Recompute user_points from summary_metrics, one user per transaction.
+    :param workout_tables: also take workout days from workout_sessions
+    :return: number of users rebuilt
+    """
+    import pandas as pd
+
+    cursor = connection.cursor()
+    try:
+        cursor.arraysize = 1000
+        binds = {}
+        where = ""
+        if user_id is not None:
+            where, binds = " AND user_id = :user_id", {'user_id': user_id}
+        cursor.execute(_SELECT_DAYS.format(where=where), binds)
+        rows = cursor.fetchall()
+        if workout_tables:
+            cursor.execute(_SELECT_WORKOUT_DAYS.format(where=where), binds)
+            rows += cursor.fetchall()
+        summary = pd.DataFrame(rows, columns=['user_id', 'metric_day', 'metric_name', 'value_sum'])
+    finally:
+        cursor.close()
+
+    users = daily_totals(summary)
+    for user, days in users.items():
+        state = {}
+        rules.score(days, state)
+        cursor = connection.cursor()
+        try:
+            cursor.execute("DELETE FROM user_points WHERE user_id = :user_id", user_id=user)
+        finally:
+            cursor.close()
+        save_user_points(connection, user, state, sorted(state))
+    return len(users)